@@ -0,0 +1,358 @@
+"""Clinic analytics.
+
+GET /analytics reports on the slots that started in the last
+ANALYTICS_WINDOW_DAYS: utilization per doctor (booked / offered seats; an
+ordinary slot is one seat, a group session as many as it has), the
+distribution of booking lead times (slot start minus booking time), the
+busiest hours of the week and cancellation rates per doctor.
+
+Slot and appointment columns are streamed out of every file that holds doctor
+tables, ANALYTICS_CHUNK_ROWS rows at a time, into one typed array.array buffer
+per column, and each statistic is computed over whole columns. With NumPy
+installed the buffers are wrapped without a copy and every statistic is a
+vectorized operation; without it the same numbers are computed in plain
+Python, only more slowly. Cancelled appointments are deleted from the
+database, so bookings and cancellations are counted from the booking journal
+instead, per doctor and UTC day, reading only what was appended since the
+last report.
+
+Reports are cached per process. The first request computes one; after
+ANALYTICS_REFRESH_SECONDS the next request starts a recompute in the
+background and, like every request until it finishes, gets the previous
+report.
+
+    python -m doctor_appointment.analytics [--python]    # print a fresh report
+"""
+import argparse
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import compress
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+from sqlalchemy import Engine
+from .journal import BOOKED, CANCELLED, JOURNAL_PATH, read_events
+from .models import epoch_seconds, from_epoch
+from .schemas import AnalyticsOut, BusyHourOut, DoctorAnalyticsOut, LeadTimeBucketOut, LeadTimeOut
+from .sharding import shards
+
+ANALYTICS_WINDOW_DAYS = 90
+ANALYTICS_REFRESH_SECONDS = 300
+ANALYTICS_CHUNK_ROWS = 65_536
+BUSIEST_HOURS = 10
+
+# Memory-map the database file while streaming columns, so pages are read
+# without a system call each; SQLite caps this at its compile-time maximum.
+ANALYTICS_MMAP_BYTES = 1 << 32
+
+# Upper bounds of the lead-time buckets, in hours; a last bucket holds the rest.
+LEAD_TIME_BUCKET_HOURS = (1, 6, 24, 72, 168, 336, 720)
+
+_DAY = 86_400
+
+
+@lru_cache(maxsize=1)
+def _numpy() -> Any:
+    """The numpy module, or None when it is not installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class Columns(NamedTuple):
+    slot_doctor: array  # doctor_id of every slot in the window
+    slot_capacity: array  # seats that slot offers
+    slot_booked: array  # seats of it taken
+    appointment_start: array  # start_ts of every booked appointment's slot
+    appointment_lead: array  # seconds between booking and slot start
+
+
+# Epoch seconds come straight from the indexed start_ts column; created_at is
+# the stored naive-UTC string.
+_SLOT_COLUMNS = "SELECT doctor_id, capacity, booked_count FROM slot WHERE start_ts >= ? AND start_ts < ?"
+_APPOINTMENT_COLUMNS = """
+SELECT s.start_ts, s.start_ts - coalesce(CAST(strftime('%s', a.created_at) AS INTEGER), s.start_ts)
+FROM appointment a JOIN slot s ON s.id = a.slot_id
+WHERE s.start_ts >= ? AND s.start_ts < ?
+"""
+
+
+def _stream(engine: Engine, sql: str, params: tuple[Any, ...], columns: Sequence[array]) -> None:
+    # Plain DB-API tuples: building a SQLAlchemy Row per record costs more
+    # than the query itself at millions of rows
+    with engine.connect() as conn:
+        cursor = conn.connection.driver_connection.cursor()  # type: ignore[union-attr]
+        try:
+            cursor.execute(f"PRAGMA mmap_size = {ANALYTICS_MMAP_BYTES}")
+            cursor.execute(sql, params)
+            while rows := cursor.fetchmany(ANALYTICS_CHUNK_ROWS):
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+        finally:
+            # The connection goes back to the pool for ordinary requests
+            cursor.execute("PRAGMA mmap_size = 0")
+            cursor.close()
+
+
+def load_columns(engines: Sequence[Engine], start_ts: int, end_ts: int) -> Columns:
+    """Columns for the slots starting in [start_ts, end_ts) and their appointments."""
+    columns = Columns(array("q"), array("i"), array("i"), array("q"), array("q"))
+    for engine in engines:
+        _stream(engine, _SLOT_COLUMNS, (start_ts, end_ts), columns[:3])
+        _stream(engine, _APPOINTMENT_COLUMNS, (start_ts, end_ts), columns[3:])
+    return columns
+
+
+class _NumpyOps:
+    backend = "numpy"
+
+    def __init__(self, np: Any):
+        self.np = np
+
+    def _wrap(self, column: array) -> Any:
+        return self.np.frombuffer(column, dtype=self.np.dtype(column.typecode))
+
+    def per_doctor(self, doctors: array, capacity: array, booked: array) -> dict[int, tuple[int, int]]:
+        # Doctor ids are small and dense, so counting by id beats sorting
+        keys = self._wrap(doctors)
+        offered = self.np.bincount(keys, weights=self._wrap(capacity))
+        taken = self.np.bincount(keys, weights=self._wrap(booked))
+        return {int(d): (int(offered[d]), int(taken[d])) for d in self.np.flatnonzero(offered)}
+
+    def hours_of_week(self, starts: array) -> list[int]:
+        start = self._wrap(starts)
+        slot = ((start // _DAY + 3) % 7) * 24 + (start // 3600) % 24
+        return self.np.bincount(slot, minlength=7 * 24).tolist()
+
+    def lead_times(self, leads: array, bounds: Sequence[int]) -> tuple[list[int], Optional[float], list[float]]:
+        lead = self._wrap(leads)
+        buckets = self.np.bincount(self.np.searchsorted(bounds, lead, side="right"), minlength=len(bounds) + 1)
+        if not len(lead):
+            return buckets.tolist(), None, []
+        return buckets.tolist(), float(lead.mean()), self.np.percentile(lead, [50, 90]).tolist()
+
+
+class _PythonOps:
+    backend = "python"
+
+    def per_doctor(self, doctors: array, capacity: array, booked: array) -> dict[int, tuple[int, int]]:
+        # Count every slot once, then add the extra seats of the few group sessions
+        offered = Counter(doctors)
+        taken = Counter(compress(doctors, booked))
+        for counts, seats in ((offered, capacity), (taken, booked)):
+            for d, n in compress(zip(doctors, seats), map((1).__lt__, seats)):
+                counts[d] += n - 1
+        return {d: (n, taken[d]) for d, n in sorted(offered.items())}
+
+    def hours_of_week(self, starts: array) -> list[int]:
+        counts = Counter(((s // _DAY + 3) % 7) * 24 + (s // 3600) % 24 for s in starts)
+        return [counts[slot] for slot in range(7 * 24)]
+
+    def lead_times(self, leads: array, bounds: Sequence[int]) -> tuple[list[int], Optional[float], list[float]]:
+        counts = Counter(bisect_right(bounds, lead) for lead in leads)
+        buckets = [counts[i] for i in range(len(bounds) + 1)]
+        if not leads:
+            return buckets, None, []
+        ordered = sorted(leads)
+        # Linear interpolation between closest ranks, as numpy.percentile does
+        percentiles = []
+        for q in (0.5, 0.9):
+            pos = (len(ordered) - 1) * q
+            low = int(pos)
+            high = min(low + 1, len(ordered) - 1)
+            percentiles.append(ordered[low] + (ordered[high] - ordered[low]) * (pos - low))
+        return buckets, sum(ordered) / len(ordered), percentiles
+
+
+def column_ops(use_numpy: bool = True) -> Any:
+    np = _numpy() if use_numpy else None
+    return _NumpyOps(np) if np is not None else _PythonOps()
+
+
+class JournalTally:
+    """Booked and cancelled events per (doctor, UTC day) from the booking journal.
+
+    update() reads only the events appended since the previous call; a
+    journal that shrank was replaced, and is counted again from the start.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        self.offset = 0
+        self.counts: Counter[tuple[int, int, str]] = Counter()
+
+    def update(self) -> None:
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < self.offset:
+            self.offset = 0
+            self.counts.clear()
+        if size == self.offset:
+            return
+        for record, offset in read_events(self.path, self.offset):
+            kind = record.get("type")
+            if kind in (BOOKED, CANCELLED) and record.get("doctor_id") is not None:
+                day = epoch_seconds(datetime.fromisoformat(record["at"])) // _DAY
+                self.counts[(record["doctor_id"], day, kind)] += 1
+            self.offset = offset
+
+    def per_doctor(self, start_ts: int, end_ts: int) -> dict[int, tuple[int, int]]:
+        """(bookings, cancellations) per doctor on the UTC days overlapping [start_ts, end_ts)."""
+        first, last = start_ts // _DAY, (end_ts - 1) // _DAY
+        totals: dict[int, list[int]] = {}
+        for (doctor_id, day, kind), n in self.counts.items():
+            if first <= day <= last:
+                totals.setdefault(doctor_id, [0, 0])[kind == CANCELLED] += n
+        return {doctor_id: (booked, cancelled) for doctor_id, (booked, cancelled) in totals.items()}
+
+
+def _ratio(part: int, whole: int) -> Optional[float]:
+    return part / whole if whole else None
+
+
+def _hours(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else seconds / 3600
+
+
+def build_report(
+    columns: Columns,
+    journal_counts: dict[int, tuple[int, int]],
+    ops: Any,
+    window_start: int,
+    window_end: int,
+) -> AnalyticsOut:
+    slots = ops.per_doctor(columns.slot_doctor, columns.slot_capacity, columns.slot_booked)
+    doctors = []
+    for doctor_id in sorted(slots.keys() | journal_counts.keys()):
+        offered, booked = slots.get(doctor_id, (0, 0))
+        bookings, cancellations = journal_counts.get(doctor_id, (0, 0))
+        doctors.append(DoctorAnalyticsOut(
+            doctor_id=doctor_id, offered_slots=offered, booked_slots=booked, utilization=_ratio(booked, offered),
+            bookings=bookings, cancellations=cancellations, cancellation_rate=_ratio(cancellations, bookings),
+        ))
+
+    bounds = [hours * 3600 for hours in LEAD_TIME_BUCKET_HOURS]
+    buckets, mean, percentiles = ops.lead_times(columns.appointment_lead, bounds)
+    p50, p90 = percentiles or (None, None)
+    lead_time = LeadTimeOut(
+        appointments=len(columns.appointment_lead),
+        mean_hours=_hours(mean), p50_hours=_hours(p50), p90_hours=_hours(p90),
+        buckets=[
+            LeadTimeBucketOut(max_hours=hours, appointments=n)
+            for hours, n in zip((*LEAD_TIME_BUCKET_HOURS, None), buckets)
+        ],
+    )
+
+    per_hour = ops.hours_of_week(columns.appointment_start)
+    busiest = sorted((slot for slot in range(len(per_hour)) if per_hour[slot]), key=lambda s: (-per_hour[s], s))
+    offered_total = sum(offered for offered, _ in slots.values())
+    booked_total = sum(booked for _, booked in slots.values())
+    return AnalyticsOut(
+        generated_at=datetime.now(timezone.utc),
+        window_start=from_epoch(window_start),
+        window_end=from_epoch(window_end),
+        backend=ops.backend,
+        offered_slots=offered_total,
+        booked_slots=booked_total,
+        utilization=_ratio(booked_total, offered_total),
+        doctors=doctors,
+        lead_time=lead_time,
+        busiest_hours=[
+            BusyHourOut(weekday=slot // 24, hour=slot % 24, appointments=per_hour[slot])
+            for slot in busiest[:BUSIEST_HOURS]
+        ],
+    )
+
+
+def _doctor_engines() -> list[Engine]:
+    return list(shards.engines or [shards.bind])
+
+
+def compute_analytics(
+    engines: Optional[Sequence[Engine]] = None,
+    tally: Optional[JournalTally] = None,
+    now: Optional[datetime] = None,
+    use_numpy: bool = True,
+) -> AnalyticsOut:
+    """A fresh report for the ANALYTICS_WINDOW_DAYS before now."""
+    end = epoch_seconds(now or datetime.now(timezone.utc))
+    start = end - ANALYTICS_WINDOW_DAYS * _DAY
+    if tally is None:
+        tally = JournalTally()
+    tally.update()
+    columns = load_columns(engines if engines is not None else _doctor_engines(), start, end)
+    return build_report(columns, tally.per_doctor(start, end), column_ops(use_numpy), start, end)
+
+
+class AnalyticsCache:
+    """The last report, recomputed in the background once it is older than refresh_seconds."""
+
+    def __init__(
+        self,
+        refresh_seconds: float = ANALYTICS_REFRESH_SECONDS,
+        compute: Optional[Callable[[JournalTally], AnalyticsOut]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self._compute = compute or (lambda tally: compute_analytics(tally=tally))
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Held while a report is computed; also guards the journal tally
+        self._compute_lock = threading.Lock()
+        self._tally = JournalTally()
+        self._report: Optional[AnalyticsOut] = None
+        self._computed_at = 0.0
+        self._refreshing = False
+
+    def get(self) -> AnalyticsOut:
+        with self._lock:
+            report = self._report
+            if report is not None:
+                if self._clock() - self._computed_at >= self.refresh_seconds and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name="analytics-refresh", daemon=True).start()
+                return report
+        with self._compute_lock:
+            # Only the first caller computes; the rest wait for its report
+            if self._report is None:
+                self._refresh()
+            assert self._report is not None
+            return self._report
+
+    def _refresh(self) -> None:
+        report = self._compute(self._tally)
+        with self._lock:
+            self._report = report
+            self._computed_at = self._clock()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            with self._compute_lock:
+                self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def clear(self) -> None:
+        with self._compute_lock, self._lock:
+            self._report = None
+            self._tally = JournalTally()
+
+
+analytics_cache = AnalyticsCache()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Print clinic analytics for the last ANALYTICS_WINDOW_DAYS")
+    parser.add_argument("--python", action="store_true", help="compute without numpy even if it is installed")
+    args = parser.parse_args(argv)
+    print(compute_analytics(use_numpy=not args.python).model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,109 @@
-from passlib.context import CryptContext
+import atexit
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from functools import lru_cache
 from sqlmodel import Session, select
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional, Sequence
 from .database import get_session
 from .models import User
+from .revocation import revoked_tokens
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
 
 SECRET_KEY = "CHANGE_ME_TO_A_RANDOM_SECRET"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60*24
+# Access tokens are short-lived and checked without a query; clients renew
+# them at /auth/refresh with a refresh token, which is single-use.
+ACCESS_TOKEN_EXPIRE_MINUTES = 15
+REFRESH_TOKEN_EXPIRE_DAYS = 14
+
+# Worker processes for hashing the passwords of a bulk registration.
+HASH_WORKERS = os.cpu_count() or 1
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# passlib and jose (which pulls in cryptography) are imported on first use so
+# that importing the app stays cheap.
+@lru_cache(maxsize=None)
+def get_pwd_context() -> "CryptContext":
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    return get_pwd_context().verify(plain, hashed)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
-def create_access_token(data: dict[str, Any], expires_delta: timedelta | None = None) -> str:
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # spawn, not fork: the app process has threads and open SQLite files
+            _hash_pool = ProcessPoolExecutor(HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _hash_pool
+
+def _shutdown_hash_pool() -> None:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(cancel_futures=True)
+            _hash_pool = None
+
+def _forget_hash_pool() -> None:
+    # A forked worker does not own its parent's pool
+    global _hash_pool
+    _hash_pool = None
+
+atexit.register(_shutdown_hash_pool)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_hash_pool)
+
+def hash_passwords(passwords: Sequence[str]) -> list[str]:
+    """get_password_hash for many passwords, spread over HASH_WORKERS processes."""
+    if len(passwords) < 2 or HASH_WORKERS < 2:
+        return [get_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (HASH_WORKERS * 4))
+    return list(_get_hash_pool().map(get_password_hash, passwords, chunksize=chunksize))
+
+def _encode_token(data: dict[str, Any], token_type: str, lifetime: timedelta) -> str:
+    from jose import jwt
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    expire = datetime.now(timezone.utc) + lifetime
+    # jti names the token in the revocation list
+    to_encode.update({"exp": expire, "typ": token_type, "jti": uuid.uuid4().hex})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def create_access_token(data: dict[str, Any], expires_delta: timedelta | None = None) -> str:
+    return _encode_token(data, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+def create_refresh_token(user_id: int) -> str:
+    return _encode_token({"sub": str(user_id)}, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+def decode_token(token: str, token_type: str = "access") -> dict[str, Any]:
+    """Claims of a valid, unrevoked token of token_type; raises JWTError otherwise."""
+    from jose import JWTError, jwt
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # Access tokens issued before refresh tokens existed have no typ or jti
+    if payload.get("typ", "access") != token_type:
+        raise JWTError("Wrong token type")
+    jti = payload.get("jti")
+    if jti is not None and revoked_tokens.is_revoked(jti):
+        raise JWTError("Token has been revoked")
+    return payload
+
+def token_expiry(payload: dict[str, Any]) -> datetime:
+    return datetime.fromtimestamp(payload["exp"], timezone.utc)
 
 def get_user_by_email(session: Session, email: str) -> Optional[User]:
     statement = select(User).where(User.email == email)
@@ -41,13 +118,14 @@ def authenticate_user(session: Session, email: str, password: str) -> Optional[U
     return user
 
 def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)) -> User:
+    from jose import JWTError
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id_raw = payload.get("sub")
         if user_id_raw is None:
             raise credentials_exception
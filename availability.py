@@ -0,0 +1,202 @@
+"""Per-doctor availability summary.
+
+DoctorAvailability holds, for each doctor, the free and booked slot counts for
+the coming AVAILABILITY_WINDOW and the start of the next free slot, so the
+doctor listing can show and sort by availability without touching the slot
+table.
+
+Every transaction that creates a slot, books or cancels an appointment is
+tracked through mapper events, and just before it commits the rows of the
+doctors it touched are recomputed from the (doctor_id, start_ts) index.
+Because the window moves with the clock, a row also goes stale after
+AVAILABILITY_REFRESH_INTERVAL or once its next free slot has started. The
+doctor listing never writes: with_stale_recomputed() swaps fresh numbers into
+the stale rows of its response, and refresh_stale_availability() stores them,
+from the refresh command run on a timer (cron, a systemd timer).
+
+    python -m doctor_appointment.availability check [--repair]
+    python -m doctor_appointment.availability refresh
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional
+from sqlalchemy import case, delete, event, func, type_coerce
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session as OrmSession, object_session
+from sqlmodel import Session, select
+from .models import Appointment, DoctorAvailability, DoctorProfile, Slot, EpochUTC, as_utc, epoch_seconds
+from .sharding import fan_out, open_session, owns
+
+AVAILABILITY_WINDOW = timedelta(days=7)
+AVAILABILITY_REFRESH_INTERVAL = timedelta(minutes=15)
+
+_PENDING_KEY = "availability_doctors"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def summarize(session: Session, doctor_id: int, now: datetime) -> dict[str, Any]:
+    """Compute a doctor's summary row as of now."""
+    now = as_utc(now)
+    end = now + AVAILABILITY_WINDOW
+    now_ts, end_ts = epoch_seconds(now), epoch_seconds(end)
+    free, booked = session.exec(
+        select(
+            func.coalesce(func.sum(case((Slot.is_booked == False, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Slot.is_booked == True, 1), else_=0)), 0),
+        ).where(Slot.doctor_id == doctor_id, Slot.start_ts >= now_ts, Slot.start_ts < end_ts)
+    ).one()
+    next_free = session.exec(
+        select(type_coerce(func.min(Slot.start_ts), EpochUTC)).where(
+            Slot.doctor_id == doctor_id, Slot.is_booked == False, Slot.start_ts >= now_ts
+        )
+    ).one()
+    stale_at = now + AVAILABILITY_REFRESH_INTERVAL
+    if next_free is not None and next_free < stale_at:
+        stale_at = next_free
+    return {
+        "doctor_id": doctor_id,
+        "free_slots": free,
+        "booked_slots": booked,
+        "next_free_start": next_free,
+        "window_start": now,
+        "window_end": end,
+        "stale_at": stale_at,
+    }
+
+
+def refresh_availability(session: Session, doctor_ids: Iterable[int], now: Optional[datetime] = None) -> None:
+    """Recompute the summary rows of doctor_ids in the current transaction."""
+    now = now or _utcnow()
+    for doctor_id in sorted(set(doctor_ids)):
+        values = summarize(session, doctor_id, now)
+        stmt = insert(DoctorAvailability).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DoctorAvailability.doctor_id],
+            set_={k: v for k, v in values.items() if k != "doctor_id"},
+        )
+        session.exec(stmt)
+
+
+def refresh_stale_availability(session: Session, now: Optional[datetime] = None) -> int:
+    """Recompute rows the clock has moved past and commit. Returns how many."""
+    now = now or _utcnow()
+    stale = session.exec(select(DoctorAvailability.doctor_id).where(DoctorAvailability.stale_at <= now)).all()
+    if stale:
+        refresh_availability(session, stale, now)
+        session.commit()
+    return len(stale)
+
+
+def with_stale_recomputed(session: Session, rows: list[Any], now: Optional[datetime] = None) -> list[Any]:
+    """Rows of a doctor listing with the stale summaries recomputed, read-only."""
+    now = now or _utcnow()
+    stale = set(session.exec(select(DoctorAvailability.doctor_id).where(DoctorAvailability.stale_at <= now)).all())
+    if not stale:
+        return rows
+    fresh = []
+    for row in rows:
+        if row.id in stale:
+            values = summarize(session, row.id, now)
+            row = row._replace(
+                free_slots=values["free_slots"],
+                booked_slots=values["booked_slots"],
+                next_free_start=values["next_free_start"],
+            )
+        fresh.append(row)
+    return fresh
+
+
+def rebuild_availability(session: Session, now: Optional[datetime] = None) -> int:
+    """Throw the table away and recompute a row for every doctor whose slots live behind session."""
+    now = now or _utcnow()
+    doctor_ids = [d for d in session.exec(select(DoctorProfile.id)).all() if d is not None and owns(session, d)]
+    session.exec(delete(DoctorAvailability))
+    refresh_availability(session, doctor_ids, now)
+    session.commit()
+    return len(doctor_ids)
+
+
+def check_availability(session: Session) -> list[str]:
+    """Compare every stored row with a from-scratch computation over the same window."""
+    problems = []
+    rows = {row.doctor_id: row for row in session.exec(select(DoctorAvailability)).all()}
+    fields = ("free_slots", "booked_slots", "next_free_start")
+    for doctor_id in session.exec(select(Slot.doctor_id).distinct()).all():
+        row = rows.get(doctor_id)
+        if row is None:
+            problems.append(f"doctor {doctor_id}: has slots but no availability row")
+            continue
+        expected = summarize(session, doctor_id, row.window_start)
+        for field in fields:
+            if getattr(row, field) != expected[field]:
+                problems.append(f"doctor {doctor_id}: {field} is {getattr(row, field)}, expected {expected[field]}")
+    return problems
+
+
+def _stage(target: Any, doctor_id: Optional[int]) -> None:
+    session = object_session(target)
+    if session is not None and doctor_id is not None:
+        session.info.setdefault(_PENDING_KEY, set()).add(doctor_id)
+
+
+@event.listens_for(Slot, "after_insert")
+@event.listens_for(Slot, "after_update")
+def _slot_changed(mapper, connection, slot: Slot) -> None:
+    _stage(slot, slot.doctor_id)
+
+
+@event.listens_for(Appointment, "after_insert")
+@event.listens_for(Appointment, "after_delete")
+def _appointment_changed(mapper, connection, appt: Appointment) -> None:
+    _stage(appt, appt.doctor_id)
+
+
+@event.listens_for(OrmSession, "before_commit")
+def _refresh_before_commit(session: OrmSession) -> None:
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    doctor_ids = session.info.pop(_PENDING_KEY, None)
+    if doctor_ids:
+        refresh_availability(session, doctor_ids)  # type: ignore[arg-type]
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_after_rollback(session: OrmSession) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from .database import init_db
+
+    parser = argparse.ArgumentParser(description="Check or rebuild the doctor availability summary")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="compare the table with a from-scratch computation")
+    check.add_argument("--repair", action="store_true", help="rebuild the table if anything is off")
+    commands.add_parser("rebuild", help="recompute every row")
+    commands.add_parser("refresh", help="recompute the rows the clock has moved past")
+    args = parser.parse_args(argv)
+
+    init_db()
+    with open_session() as session:
+        if args.command == "rebuild":
+            print(f"rebuilt {sum(fan_out(session, lambda s: [rebuild_availability(s)]))} rows")
+            return
+        if args.command == "refresh":
+            print(f"refreshed {sum(fan_out(session, lambda s: [refresh_stale_availability(s)]))} rows")
+            return
+        problems = fan_out(session, check_availability)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} problems")
+        if problems and args.repair:
+            print(f"rebuilt {sum(fan_out(session, lambda s: [rebuild_availability(s)]))} rows")
+        elif problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# Benchmarks are run as modules from the directory containing the package, e.g.
+#   python -m doctor_appointment.benchmarks.bench_holds
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from sqlmodel import SQLModel, Session, create_engine
+from ..models import User, DoctorProfile
+
+
+def temp_engine(name: str = "bench.db"):
+    """Fresh SQLite engine in a temporary directory with all tables created."""
+    path = os.path.join(tempfile.mkdtemp(prefix="appt-bench-"), name)
+    engine = create_engine(f"sqlite:///{path}", echo=False, connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def seed_users(engine, doctors: int, patients: int, specializations: tuple[str, ...] = ("General",)):
+    """Insert doctors (with profiles) and patients without paying for bcrypt."""
+    with Session(engine) as session:
+        doctor_users = [
+            User(email=f"doc{i}@bench.local", hashed_password="x", full_name=f"Doc {i}", role="doctor")
+            for i in range(doctors)
+        ]
+        patient_users = [
+            User(email=f"pat{i}@bench.local", hashed_password="x", full_name=f"Patient {i}", role="patient")
+            for i in range(patients)
+        ]
+        session.add_all(doctor_users + patient_users)
+        session.commit()
+        profiles = [
+            DoctorProfile(user_id=int(u.id or 0), specialization=specializations[i % len(specializations)])
+            for i, u in enumerate(doctor_users)
+        ]
+        session.add_all(profiles)
+        session.commit()
+        return [int(p.id or 0) for p in profiles], [int(u.id or 0) for u in patient_users]
+
+
+@contextmanager
+def timed(label: str, count: int | None = None):
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if count:
+        print(f"{label:<40} {elapsed * 1000:10.1f} ms  {count / elapsed:12,.0f} /s")
+    else:
+        print(f"{label:<40} {elapsed * 1000:10.1f} ms")
+
+
+def asgi_get(app, path: str, query: str = "") -> tuple[int, bytes]:
+    """Issue one GET straight through the ASGI app and return (status, body)."""
+    import asyncio
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    status = 0
+    body = bytearray()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+
+    asyncio.run(app(scope, receive, send))
+    return status, bytes(body)
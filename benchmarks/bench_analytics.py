@@ -0,0 +1,95 @@
+"""Clinic analytics: SQL aggregates vs. columnar buffers.
+
+"SQL aggregates" computes the report's numbers the way one would without
+analytics.py: a GROUP BY per statistic and, for the lead-time percentiles, an
+ORDER BY ... LIMIT 1 OFFSET k per percentile. "Load" streams the columns into
+array buffers; the report is then built from them with NumPy (if installed)
+and with the pure-Python fallback. A cached report costs GET /analytics a
+lock and an attribute read.
+
+Four in five slots are booked, so --appointments 10000000 seeds 12.5M slots.
+Seeding runs inside SQLite and takes a few minutes at that size.
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from ..analytics import (
+    ANALYTICS_WINDOW_DAYS, LEAD_TIME_BUCKET_HOURS, JournalTally, _numpy, build_report, column_ops, load_columns,
+)
+from ._util import seed_users, temp_engine, timed
+
+_SEED_SLOTS = """
+WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :count - 1)
+INSERT INTO slot (doctor_id, start_time, end_time, is_booked, booked_count, start_ts, end_ts)
+SELECT :first_doctor + i % :doctors, datetime(ts, 'unixepoch'), datetime(ts + 1800, 'unixepoch'), i % 5 != 0, i % 5 != 0, ts, ts + 1800
+FROM (SELECT i, :start + (i * 1800) % :span AS ts FROM n)
+"""
+
+_SEED_APPOINTMENTS = """
+INSERT INTO appointment (doctor_id, patient_id, slot_id, created_at)
+SELECT doctor_id, :patient, id, datetime(start_ts - abs(random()) % (45 * 86400), 'unixepoch')
+FROM slot WHERE is_booked
+"""
+
+
+def sql_aggregates(engine, start: int, end: int) -> None:
+    window = {"start": start, "end": end}
+    in_window = "s.start_ts >= :start AND s.start_ts < :end"
+    lead = "s.start_ts - CAST(strftime('%s', a.created_at) AS INTEGER)"
+    buckets = " ".join(f"WHEN {lead} < {hours * 3600} THEN {i}" for i, hours in enumerate(LEAD_TIME_BUCKET_HOURS))
+    joined = f"FROM appointment a JOIN slot s ON s.id = a.slot_id WHERE {in_window}"
+    with engine.connect() as conn:
+        conn.execute(text(
+            f"SELECT doctor_id, sum(capacity), sum(booked_count) FROM slot s WHERE {in_window} GROUP BY doctor_id"
+        ), window).all()
+        conn.execute(text(
+            f"SELECT ((s.start_ts / 86400 + 3) % 7) * 24 + (s.start_ts / 3600) % 24 AS h, count(*) {joined} GROUP BY h"
+        ), window).all()
+        conn.execute(text(
+            f"SELECT CASE {buckets} ELSE {len(LEAD_TIME_BUCKET_HOURS)} END AS b, count(*), sum({lead}) {joined} GROUP BY b"
+        ), window).all()
+        count = conn.execute(text(f"SELECT count(*) {joined}"), window).scalar_one()
+        for q in (0.5, 0.9):
+            conn.execute(text(f"SELECT {lead} AS lead {joined} ORDER BY lead LIMIT 1 OFFSET :k"),
+                         {**window, "k": int((count - 1) * q)}).all()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appointments", type=int, default=1_000_000)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--skip-sql", action="store_true", help="skip the SQL aggregates baseline")
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    doctor_ids, patient_ids = seed_users(engine, args.doctors, 1)
+    end = int(time.time())
+    start = end - ANALYTICS_WINDOW_DAYS * 86_400
+    slots = args.appointments * 5 // 4
+    with timed(f"seed {slots:,} slots, {args.appointments:,} appointments"):
+        with engine.begin() as conn:
+            conn.execute(text(_SEED_SLOTS), {
+                "count": slots, "first_doctor": doctor_ids[0], "doctors": args.doctors,
+                "start": start + 60, "span": (end - start - 3600) // 1800 * 1800,
+            })
+            conn.execute(text(_SEED_APPOINTMENTS), {"patient": patient_ids[0]})
+
+    print(f"{slots:,} slots and {args.appointments:,} appointments in the last {ANALYTICS_WINDOW_DAYS} days, "
+          f"{args.doctors} doctors, {datetime.now(timezone.utc):%Y-%m-%d}")
+    if not args.skip_sql:
+        with timed("SQL aggregates"):
+            sql_aggregates(engine, start, end)
+    with timed("load columns", args.appointments):
+        columns = load_columns([engine], start, end)
+    counts = JournalTally("/nonexistent").per_doctor(start, end)
+    backends = [True, False] if _numpy() is not None else [False]
+    for use_numpy in backends:
+        ops = column_ops(use_numpy)
+        with timed(f"compute ({ops.backend})", args.appointments):
+            report = build_report(columns, counts, ops, start, end)
+    assert report.lead_time.appointments == args.appointments
+
+
+if __name__ == "__main__":
+    main()
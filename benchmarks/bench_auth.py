@@ -0,0 +1,87 @@
+"""Cost of the get_current_user dependency with token revocation.
+
+"No revocation" is the dependency as it was: decode the JWT, load the user.
+"Revocation set" is get_current_user now, which also checks the token's jti
+against the per-process set of revoked ids. "Query per request" is the usual
+alternative of looking the jti up in the RevokedToken table on every call.
+The table is seeded with --revoked unexpired revocations.
+"""
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from sqlalchemy import insert
+from sqlmodel import Session, select
+from .. import auth
+from ..auth import ALGORITHM, SECRET_KEY, create_access_token, get_current_user
+from ..models import RevokedToken, User
+from ..revocation import RevocationList
+from ..versions import VersionWatcher
+from ._util import seed_users, temp_engine
+
+
+def no_revocation(token: str, session: Session) -> User:
+    from jose import jwt
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user = session.get(User, int(payload["sub"]))
+    assert user is not None
+    return user
+
+
+def query_per_request(token: str, session: Session) -> User:
+    from jose import jwt
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    assert session.exec(select(RevokedToken.jti).where(RevokedToken.jti == payload["jti"])).first() is None
+    user = session.get(User, int(payload["sub"]))
+    assert user is not None
+    return user
+
+
+def per_call_us(engine, check: Callable[[str, Session], User], tokens: list[str], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for token in tokens:
+            # A session per call, as the request dependency gets
+            with Session(engine) as session:
+                check(token, session)
+        samples.append((time.perf_counter() - start) / len(tokens))
+    return statistics.median(samples) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--revoked", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    _, patient_ids = seed_users(engine, 1, 100)
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    with Session(engine) as session:
+        session.exec(insert(RevokedToken), params=[
+            {"jti": uuid.uuid4().hex, "expires_at": expires} for _ in range(args.revoked)
+        ])
+        session.commit()
+    auth.revoked_tokens = RevocationList(engine, VersionWatcher(engine))
+    tokens = [
+        create_access_token({"sub": str(patient_ids[i % len(patient_ids)]), "role": "patient"})
+        for i in range(args.calls)
+    ]
+
+    print(f"{args.calls:,} authenticated calls, {args.revoked:,} revoked tokens on record")
+    baseline = per_call_us(engine, no_revocation, tokens, args.repeat)
+    for label, check in (
+        ("no revocation", no_revocation),
+        ("revocation set", lambda token, session: get_current_user(token, session)),
+        ("query per request", query_per_request),
+    ):
+        us = baseline if check is no_revocation else per_call_us(engine, check, tokens, args.repeat)
+        print(f"{label:<20} {us:8.1f} us/call   {us - baseline:+7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
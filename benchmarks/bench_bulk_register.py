@@ -0,0 +1,83 @@
+"""Clinic onboarding: registering users one at a time vs. crud.create_users.
+
+"One at a time" does what POST /auth/register does for every row: look the
+email up, then create_user, which commits the user and, for doctors, the
+profile separately. "Bulk" checks every email with one IN query, hashes on
+auth.HASH_WORKERS processes and inserts users and profiles with two
+statements in one transaction. Each is run once with real bcrypt hashes and
+once, on more users, with hashing swapped for a constant so only the database
+work is timed.
+"""
+import argparse
+import time
+from contextlib import contextmanager
+from sqlmodel import Session
+from .. import auth, crud
+from ..auth import get_user_by_email
+from ..crud import create_user, create_users
+from ..schemas import UserCreate
+from ._util import temp_engine
+
+
+def rows(count: int, prefix: str) -> list[UserCreate]:
+    return [
+        UserCreate(
+            email=f"{prefix}{i}@clinic.example.com", password=f"pw-{i}", full_name=f"User {i}",
+            role="doctor" if i % 5 == 0 else "patient", specialization="General" if i % 5 == 0 else None,
+        )
+        for i in range(count)
+    ]
+
+
+def one_at_a_time(engine, users: list[UserCreate]) -> None:
+    with Session(engine) as session:
+        for row in users:
+            assert get_user_by_email(session, row.email) is None
+            create_user(session, row.email, row.password, row.full_name or "", row.role, row.specialization)
+
+
+def bulk(engine, users: list[UserCreate]) -> None:
+    with Session(engine) as session:
+        results = create_users(session, users)
+    assert all(result.status == "created" for result in results)
+
+
+@contextmanager
+def without_hashing():
+    hash_one, hash_many = crud.get_password_hash, crud.hash_passwords
+    crud.get_password_hash = lambda password: "x"
+    crud.hash_passwords = lambda passwords: ["x"] * len(passwords)
+    try:
+        yield
+    finally:
+        crud.get_password_hash, crud.hash_passwords = hash_one, hash_many
+
+
+def compare(label: str, count: int) -> None:
+    timings = []
+    for register in (one_at_a_time, bulk):
+        engine = temp_engine()
+        users = rows(count, register.__name__)
+        start = time.perf_counter()
+        register(engine, users)
+        timings.append(time.perf_counter() - start)
+    one, many = timings
+    print(f"{label:<24} one at a time {one * 1000:9.1f} ms   bulk {many * 1000:9.1f} ms   {one / many:5.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500, help="users for the database-only run")
+    parser.add_argument("--hashed-users", type=int, default=40, help="users for the run with bcrypt")
+    parser.add_argument("--workers", type=int, default=auth.HASH_WORKERS, help="hashing processes for bulk")
+    args = parser.parse_args()
+    auth.HASH_WORKERS = args.workers
+
+    print(f"one in five users a doctor, {args.workers} hashing processes")
+    with without_hashing():
+        compare(f"{args.users} users, database", args.users)
+    compare(f"{args.hashed_users} users, with bcrypt", args.hashed_users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Doctor dashboard with a long history: full page vs. windowed page plus fragments."""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from sqlmodel import Session, select
+from ..models import Appointment, Slot
+from ..readmodels import (
+    calendar_buckets, doctor_appointment_cards, doctor_appointment_page, doctor_appointment_window,
+    doctor_card, slot_counts, slot_page, slot_rows, slot_window,
+)
+from ..template import (
+    DASHBOARD_WINDOW_DAYS, FRAGMENT_PAGE_SIZE, appointment_page_html, get_doctor_dashboard, slot_page_html,
+)
+from ._util import seed_users, temp_engine
+
+
+def seed(engine, slots: int, today: datetime) -> int:
+    """slots 20-minute slots, 24 per day, centred on today so most of them are history."""
+    (doctor_id,), patient_ids = seed_users(engine, 1, 500)
+    first_day = today - timedelta(days=slots // 24 - 30)
+    with Session(engine) as session:
+        session.add_all(
+            Slot(doctor_id=doctor_id,
+                 start_time=first_day + timedelta(days=i // 24, hours=8, minutes=20 * (i % 24)),
+                 end_time=first_day + timedelta(days=i // 24, hours=8, minutes=20 * (i % 24) + 20),
+                 is_booked=i % 3 == 0)
+            for i in range(slots)
+        )
+        session.commit()
+        booked = session.exec(select(Slot.id).where(Slot.is_booked == True)).all()
+        session.add_all(
+            Appointment(doctor_id=doctor_id, patient_id=patient_ids[i % len(patient_ids)], slot_id=slot_id, reason="Checkup")
+            for i, slot_id in enumerate(booked)
+        )
+        session.commit()
+    return doctor_id
+
+
+def measure(engine, render: Callable[[Session], str], repeat: int) -> tuple[float, int]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            size = len(render(session).encode())
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slots", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time())
+    window_end = today + timedelta(days=DASHBOARD_WINDOW_DAYS)
+    engine = temp_engine()
+    doctor_id = seed(engine, args.slots, today)
+
+    def full(session: Session) -> str:
+        doctor = doctor_card(session, doctor_id)
+        assert doctor is not None
+        return get_doctor_dashboard(
+            doctor, slot_rows(session, doctor_id), doctor_appointment_cards(session, doctor_id), "",
+            slot_counts(session, doctor_id), calendar_buckets(session, doctor_id, today, window_end),
+            today, DASHBOARD_WINDOW_DAYS,
+        )
+
+    def windowed(session: Session) -> str:
+        doctor = doctor_card(session, doctor_id)
+        assert doctor is not None
+        return get_doctor_dashboard(
+            doctor, slot_window(session, doctor_id, today, window_end),
+            doctor_appointment_window(session, doctor_id, today, window_end), "",
+            slot_counts(session, doctor_id), calendar_buckets(session, doctor_id, today, window_end),
+            today, DASHBOARD_WINDOW_DAYS,
+        )
+
+    def past_slots(session: Session) -> str:
+        return slot_page_html(slot_page(session, doctor_id, (today, 0), FRAGMENT_PAGE_SIZE + 1, descending=True), "past")
+
+    def past_appointments(session: Session) -> str:
+        rows = doctor_appointment_page(session, doctor_id, (today, 0), FRAGMENT_PAGE_SIZE + 1, descending=True)
+        return appointment_page_html(rows, "past")
+
+    print(f"doctor with {args.slots:,} slots, {DASHBOARD_WINDOW_DAYS}-day window, {FRAGMENT_PAGE_SIZE}-row fragments")
+    for label, render in [
+        ("full page (every slot and appointment)", full),
+        ("windowed page", windowed),
+        ("past slots fragment", past_slots),
+        ("past appointments fragment", past_appointments),
+    ]:
+        elapsed, size = measure(engine, render, args.repeat)
+        print(f"  {label:<40} {elapsed * 1000:8.1f} ms  {size / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
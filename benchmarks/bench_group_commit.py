@@ -0,0 +1,160 @@
+"""Booking throughput: one commit per request vs. the group-commit writer.
+
+Client threads book slots the way the booking route does: check the slot,
+insert the appointment, mark the slot booked, bump the data versions. "Per
+request" gives every booking its own transaction, taking the write lock up
+front with BEGIN IMMEDIATE so concurrent checks cannot both pass; one that
+times out waiting for the lock is retried, and the retries are reported. "Group
+commit" hands the same function to a GroupWriter running on its own event
+loop, once per batch size. With --duplicates N every slot is requested by N
+different clients, so all but one request per slot ends in a conflict.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, select
+from ..models import Appointment, Slot, epoch_seconds
+from ..policies import policy_cache  # noqa: F401 - stamps deadlines on insert, as in the app
+from ..sharding import ShardSet
+from ..versions import bump_versions, SLOTS, APPOINTMENTS
+from ..writer import GroupWriter
+from ._util import seed_users
+
+
+class Conflict(Exception):
+    pass
+
+
+def booking(doctor_id: int, slot_id: int, patient_id: int) -> Callable[[Session], Appointment]:
+    def book(session: Session) -> Appointment:
+        slot = session.get(Slot, slot_id)
+        if slot is None or slot.is_booked:
+            raise Conflict(slot_id)
+        slot.is_booked = True
+        session.add(slot)
+        appt = Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id)
+        session.add(appt)
+        bump_versions(session, SLOTS, APPOINTMENTS)
+        return appt
+    return book
+
+
+def build(doctors: int, slots: int, clients: int) -> tuple[ShardSet, list[tuple[int, int]], list[int]]:
+    path = os.path.join(tempfile.mkdtemp(prefix="appt-bench-"), "bench.db")
+    # One pooled connection per client, so per-request clients wait on the lock and not the pool
+    bind = create_engine(f"sqlite:///{path}", echo=False, pool_size=clients, connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(bind)
+    doctor_ids, patient_ids = seed_users(bind, doctors, 100)
+    first = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    with Session(bind) as session:
+        rows = []
+        for i in range(slots):
+            start = first + timedelta(minutes=20 * (i // doctors))
+            rows.append({
+                "doctor_id": doctor_ids[i % doctors], "start_time": start, "end_time": start + timedelta(minutes=20),
+                "start_ts": epoch_seconds(start), "end_ts": epoch_seconds(start) + 1200,
+            })
+        session.exec(insert(Slot), params=rows)
+        session.commit()
+        targets = [(int(d), int(s)) for s, d in session.exec(select(Slot.id, Slot.doctor_id).order_by(Slot.id)).all()]
+    return ShardSet(bind), targets, patient_ids
+
+
+def per_request(shard_set: ShardSet, retries: list[int]) -> Callable[[Callable[[Session], Appointment], int], Appointment]:
+    def submit(apply: Callable[[Session], Appointment], doctor_id: int) -> Appointment:
+        while True:
+            try:
+                with shard_set.session() as session:
+                    session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                    result = apply(session)
+                    session.commit()
+                    return result
+            except OperationalError:
+                retries.append(1)
+    return submit
+
+
+def drive(submit, requests: list[list[tuple[int, int, int]]]) -> tuple[float, int, int]:
+    """Run one client thread per request list; returns (elapsed, booked, conflicts)."""
+    counts = [[0, 0] for _ in requests]
+    start = threading.Barrier(len(requests) + 1)
+
+    def client(index: int) -> None:
+        start.wait()
+        for doctor_id, slot_id, patient_id in requests[index]:
+            try:
+                submit(booking(doctor_id, slot_id, patient_id), doctor_id)
+                counts[index][0] += 1
+            except Conflict:
+                counts[index][1] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return elapsed, sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+def run(mode: str, batch_size: int, max_wait: float, clients: int, per_client: int, doctors: int,
+        duplicates: int) -> tuple[float, int, int, int]:
+    total = clients * per_client
+    shard_set, targets, patient_ids = build(doctors, -(-total // duplicates), clients)
+    # Request k goes to slot k // duplicates; dealing requests round-robin puts
+    # the copies of one slot on different clients
+    requests: list[list[tuple[int, int, int]]] = [[] for _ in range(clients)]
+    for k in range(total):
+        doctor_id, slot_id = targets[k // duplicates]
+        requests[k % clients].append((doctor_id, slot_id, patient_ids[k % clients % len(patient_ids)]))
+
+    if mode == "per-request":
+        retries: list[int] = []
+        return (*drive(per_request(shard_set, retries), requests), len(retries))
+
+    writer = GroupWriter(shard_set, batch_size=batch_size, max_wait=max_wait)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(writer.start(), loop).result()
+    try:
+        return (*drive(lambda apply, doctor_id: writer.submit_threadsafe(apply, doctor_id), requests), 0)
+    finally:
+        asyncio.run_coroutine_threadsafe(writer.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--bookings", type=int, default=100, help="requests per client")
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--duplicates", type=int, default=2, help="clients requesting each slot")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    total = args.clients * args.bookings
+    print(f"{args.clients} client threads, {total:,} booking requests, each slot requested {args.duplicates}x")
+    modes = [("per-request", 1)] + [("group", int(size)) for size in args.batch_sizes.split(",")]
+    for mode, size in modes:
+        elapsed, booked, conflicts, retried = run(
+            mode, size, args.max_wait_ms / 1000, args.clients, args.bookings, args.doctors, args.duplicates,
+        )
+        label = "per-request" if mode == "per-request" else f"group, batch {size}"
+        print(f"{label:<16} {total / elapsed:8,.0f} requests/s   {booked / elapsed:8,.0f} bookings/s"
+              f"   {booked:6,} booked   {conflicts:6,} conflicts   {retried:5,} retried")
+
+
+if __name__ == "__main__":
+    main()
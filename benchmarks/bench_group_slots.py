@@ -0,0 +1,164 @@
+"""Many patients booking seats of one group session at the same moment.
+
+Every client thread has its own session and tries to book one seat, as
+concurrent POST /appointments requests would. "Read-check-write" loads the
+slot, checks booked_count against capacity and writes the incremented count
+back, which is how the single-seat path treated is_booked. "Slot lease" adds
+the hold table's per-slot lease around it, as single-seat bookings do, so
+clients that find the lease taken back off and retry. "Conditional update"
+is seats.take_seat, committed per request and, as with APP_GROUP_COMMIT=1,
+through the group writer. Clients outnumber seats, so every approach should
+end with a full session and no seat sold twice.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, ContextManager, Iterator
+from sqlalchemy import Engine, create_engine, func
+from sqlmodel import Session, select
+from ..holds import HoldTable
+from ..models import Appointment, Slot
+from ..seats import take_seat
+from ..sharding import ShardSet
+from ..writer import GroupWriter
+from ._util import seed_users, temp_engine
+
+Book = Callable[[Session, int, int, int], bool]
+
+
+class SoldOut(Exception):
+    pass
+
+
+def read_check_write(session: Session, slot_id: int, patient_id: int, doctor_id: int) -> bool:
+    slot = session.get(Slot, slot_id)
+    if slot is None or slot.booked_count >= slot.capacity:
+        session.rollback()
+        return False
+    slot.booked_count = slot.booked_count + 1
+    slot.is_booked = slot.booked_count >= slot.capacity
+    session.add(Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id))
+    session.commit()
+    return True
+
+
+def conditional_update(session: Session, slot_id: int, patient_id: int, doctor_id: int) -> bool:
+    if not take_seat(session, slot_id):
+        session.rollback()
+        return False
+    session.add(Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id))
+    session.commit()
+    return True
+
+
+@contextmanager
+def plain(book: Book, engine: Engine) -> Iterator[Book]:
+    yield book
+
+
+@contextmanager
+def slot_lease(engine: Engine) -> Iterator[Book]:
+    table = HoldTable()
+
+    def book(session: Session, slot_id: int, patient_id: int, doctor_id: int) -> bool:
+        while (hold := table.acquire(slot_id, doctor_id, patient_id)) is None:
+            time.sleep(0.0005)
+        try:
+            return read_check_write(session, slot_id, patient_id, doctor_id)
+        finally:
+            table.release(hold.hold_id)
+    yield book
+
+
+@contextmanager
+def group_writer(engine: Engine) -> Iterator[Book]:
+    writer = GroupWriter(ShardSet(engine))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(writer.start(), loop).result()
+
+    def book(session: Session, slot_id: int, patient_id: int, doctor_id: int) -> bool:
+        def apply(session: Session) -> Appointment:
+            if not take_seat(session, slot_id):
+                raise SoldOut(slot_id)
+            appt = Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id)
+            session.add(appt)
+            return appt
+        try:
+            writer.submit_threadsafe(apply, doctor_id)
+            return True
+        except SoldOut:
+            return False
+
+    try:
+        yield book
+    finally:
+        asyncio.run_coroutine_threadsafe(writer.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+def run(label: str, approach: Callable[[Engine], ContextManager[Book]], clients: int, capacity: int) -> None:
+    engine = temp_engine()
+    (doctor_id,), patient_ids = seed_users(engine, 1, clients)
+    start = datetime.now(timezone.utc) + timedelta(days=1)
+    with Session(engine) as session:
+        slot = Slot(doctor_id=doctor_id, start_time=start, end_time=start + timedelta(hours=1), capacity=capacity)
+        session.add(slot)
+        session.commit()
+        slot_id = int(slot.id or 0)
+    # One connection per client, like one per request worker
+    engine = create_engine(engine.url, pool_size=clients, connect_args={"check_same_thread": False, "timeout": 60})
+
+    booked = [False] * clients
+    errors: list[BaseException] = []
+    barrier = threading.Barrier(clients)
+
+    def client(n: int) -> None:
+        with Session(engine) as session:
+            session.connection()  # check the connection out before the race starts
+            session.rollback()
+            barrier.wait()
+            try:
+                booked[n] = book(session, slot_id, patient_ids[n], doctor_id)
+            except Exception as e:
+                errors.append(e)
+
+    with approach(engine) as book:
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        began = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - began
+
+    with Session(engine) as session:
+        count = session.exec(select(Slot.booked_count).where(Slot.id == slot_id)).one()
+        appointments = session.exec(select(func.count()).select_from(Appointment)).one()
+    oversold = max(appointments - capacity, 0)
+    print(f"{label:<26} {elapsed * 1000:8.1f} ms   succeeded {sum(booked):>4}   failed {len(errors):>3}   "
+          f"appointments {appointments:>4}   booked_count {count:>4}   oversold {oversold:>3}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--capacity", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, one group session with {args.capacity} seats")
+    for _ in range(args.rounds):
+        run("read-check-write", lambda engine: plain(read_check_write, engine), args.clients, args.capacity)
+        run("slot lease", slot_lease, args.clients, args.capacity)
+        run("conditional update", lambda engine: plain(conditional_update, engine), args.clients, args.capacity)
+        run("conditional, group commit", group_writer, args.clients, args.capacity)
+
+
+if __name__ == "__main__":
+    main()
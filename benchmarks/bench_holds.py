@@ -0,0 +1,103 @@
+"""Hold and confirm throughput with many patients contending for few slots."""
+import argparse
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session, select
+from ..holds import HoldTable, confirm_hold
+from ..models import Appointment, Slot
+from ._util import seed_users, temp_engine, timed
+
+
+def bench_lease_table(threads: int, ops: int, slots: int) -> None:
+    table = HoldTable()
+    per_thread = ops // threads
+    granted = [0] * threads
+
+    def worker(n: int) -> None:
+        rnd = random.Random(n)
+        for _ in range(per_thread):
+            hold = table.acquire(rnd.randrange(slots), 1, n)
+            if hold is not None:
+                granted[n] += 1
+                table.release(hold.hold_id)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    with timed(f"acquire+release ({threads} threads)", per_thread * threads):
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+    print(f"  granted {sum(granted):,} of {per_thread * threads:,} attempts")
+
+
+def bench_hold_confirm(threads: int, slots: int, patients: int) -> None:
+    engine = temp_engine()
+    (doctor_id,), patient_ids = seed_users(engine, 1, patients)
+    start = datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc)
+    with Session(engine) as session:
+        session.add_all(
+            Slot(doctor_id=doctor_id, start_time=start + timedelta(minutes=20 * i), end_time=start + timedelta(minutes=20 * (i + 1)))
+            for i in range(slots)
+        )
+        session.commit()
+        slot_ids = list(session.exec(select(Slot.id)).all())
+
+    table = HoldTable()
+    attempts = [0] * threads
+    confirmed = [0] * threads
+    remaining = set(slot_ids)
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        rnd = random.Random(n)
+        with Session(engine) as session:
+            while True:
+                with lock:
+                    if not remaining:
+                        return
+                    slot_id = rnd.choice(tuple(remaining))
+                patient_id = patient_ids[rnd.randrange(len(patient_ids))]
+                attempts[n] += 1
+                hold = table.acquire(int(slot_id or 0), doctor_id, patient_id)
+                if hold is None:
+                    continue
+                with lock:
+                    remaining.discard(slot_id)
+                claimed = table.claim(hold.hold_id, patient_id)
+                if claimed is None:
+                    continue
+                try:
+                    confirm_hold(session, claimed)
+                    confirmed[n] += 1
+                finally:
+                    table.release(hold.hold_id)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    with timed(f"hold+confirm {slots} slots ({threads} threads)", slots):
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+
+    with Session(engine) as session:
+        booked = len(session.exec(select(Slot).where(Slot.is_booked == True)).all())
+        appts = len(session.exec(select(Appointment)).all())
+    print(f"  attempts {sum(attempts):,}, confirmed {sum(confirmed):,}, booked slots {booked:,}, appointments {appts:,}")
+    assert booked == appts == sum(confirmed), "double booking detected"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--slots", type=int, default=500)
+    parser.add_argument("--patients", type=int, default=200)
+    args = parser.parse_args()
+
+    bench_lease_table(args.threads, args.ops, max(1, args.slots // 10))
+    bench_hold_confirm(args.threads, args.slots, args.patients)
+
+
+if __name__ == "__main__":
+    main()
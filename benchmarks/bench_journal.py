@@ -0,0 +1,85 @@
+"""Event journal: caller latency of per-event fsync vs. group commit, and mmap replay speed."""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from ..journal import EventJournal, read_events, replay
+from ._util import timed
+
+
+def sample_event(i: int) -> dict:
+    return {"type": "booked", "at": "2031-01-01T08:00:00+00:00", "pid": 1,
+            "appointment_id": i, "slot_id": i, "doctor_id": 1, "patient_id": i % 500}
+
+
+def run_writers(threads: int, per_thread: int, write) -> list[float]:
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def worker(base: int) -> None:
+        local = []
+        for i in range(per_thread):
+            start = time.perf_counter()
+            write(sample_event(base + i))
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(t * per_thread,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies
+
+
+def report(label: str, latencies: list[float], elapsed: float) -> None:
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f"{label:<28} p50 {p50:9.1f} us   p99 {p99:9.1f} us   {len(latencies) / elapsed:10,.0f} events/s durable")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--events", type=int, default=500, help="per thread")
+    parser.add_argument("--replay-events", type=int, default=200_000)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp(prefix="appt-journal-")
+
+    path = os.path.join(directory, "sync.jsonl")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    fd_lock = threading.Lock()
+
+    def write_sync(record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with fd_lock:
+            os.write(fd, line)
+            os.fsync(fd)
+
+    start = time.perf_counter()
+    latencies = run_writers(args.threads, args.events, write_sync)
+    report("fsync per event", latencies, time.perf_counter() - start)
+    os.close(fd)
+
+    journal = EventJournal(os.path.join(directory, "group.jsonl"))
+    start = time.perf_counter()
+    latencies = run_writers(args.threads, args.events, lambda record: journal.append([record]))
+    journal.flush()
+    report("group commit (append)", latencies, time.perf_counter() - start)
+    journal.close()
+
+    path = os.path.join(directory, "replay.jsonl")
+    with open(path, "wb") as f:
+        for i in range(args.replay_events):
+            f.write(json.dumps(sample_event(i), separators=(",", ":")).encode() + b"\n")
+    with timed("mmap replay", args.replay_events):
+        replay(record for record, _ in read_events(path))
+
+
+if __name__ == "__main__":
+    main()
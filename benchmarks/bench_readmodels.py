@@ -0,0 +1,107 @@
+"""ORM hydration vs. column projections: memory per 100k rows and fetch time."""
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, cast
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, select
+from ..models import Appointment, Slot
+from ..readmodels import calendar_buckets, doctor_appointment_cards, doctor_card, slot_counts, slot_rows
+from ..template import get_doctor_dashboard
+from ._util import seed_users, temp_engine
+
+
+def seed(engine, rows: int) -> int:
+    (doctor_id,), patient_ids = seed_users(engine, 1, 500)
+    start = datetime(2031, 1, 1, 8, 0, tzinfo=timezone.utc)
+    with Session(engine) as session:
+        session.add_all(
+            Slot(doctor_id=doctor_id, start_time=start + timedelta(minutes=20 * i),
+                 end_time=start + timedelta(minutes=20 * i + 20), is_booked=i % 2 == 0)
+            for i in range(rows)
+        )
+        session.commit()
+        booked = session.exec(select(Slot.id).where(Slot.is_booked == True)).all()
+        session.add_all(
+            Appointment(doctor_id=doctor_id, patient_id=patient_ids[i % len(patient_ids)], slot_id=slot_id, reason="Checkup")
+            for i, slot_id in enumerate(booked)
+        )
+        session.commit()
+    return doctor_id
+
+
+def orm_slots(session: Session, doctor_id: int) -> list[Any]:
+    return list(session.exec(select(Slot).where(Slot.doctor_id == doctor_id)).all())
+
+
+def orm_appointments(session: Session, doctor_id: int) -> list[Any]:
+    stmt = (
+        select(Appointment)
+        .where(Appointment.doctor_id == doctor_id)
+        .options(selectinload(cast(Any, Appointment.patient)), selectinload(cast(Any, Appointment.slot)))
+    )
+    return list(session.exec(stmt).all())
+
+
+def retained(engine, fetch: Callable[[Session], list[Any]]) -> tuple[int, int]:
+    """Bytes still allocated while the fetched rows (and their session) are alive."""
+    gc.collect()
+    tracemalloc.start()
+    with Session(engine) as session:
+        rows = fetch(session)
+        size, _ = tracemalloc.get_traced_memory()
+        count = len(rows)
+    tracemalloc.stop()
+    return size, count
+
+
+def timed_fetch(engine, fetch: Callable[[Session], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            fetch(session)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    doctor_id = seed(engine, args.rows)
+
+    cases = [
+        ("slots", lambda s: orm_slots(s, doctor_id), lambda s: slot_rows(s, doctor_id)),
+        ("appointments + patient + slot", lambda s: orm_appointments(s, doctor_id), lambda s: doctor_appointment_cards(s, doctor_id)),
+    ]
+    for label, orm_fetch, row_fetch in cases:
+        orm_mem, count = retained(engine, orm_fetch)
+        row_mem, _ = retained(engine, row_fetch)
+        orm_time = timed_fetch(engine, orm_fetch, args.repeat)
+        row_time = timed_fetch(engine, row_fetch, args.repeat)
+        print(f"{label} ({count:,} rows)")
+        print(f"  memory per 100k rows   orm {orm_mem * 100_000 / count / 2**20:8.1f} MiB   rows {row_mem * 100_000 / count / 2**20:8.1f} MiB")
+        print(f"  fetch time             orm {orm_time * 1000:8.1f} ms    rows {row_time * 1000:8.1f} ms")
+
+    def dashboard(session: Session) -> str:
+        doctor = doctor_card(session, doctor_id)
+        assert doctor is not None
+        start = datetime(2031, 1, 1)
+        return get_doctor_dashboard(
+            doctor, slot_rows(session, doctor_id), doctor_appointment_cards(session, doctor_id), "",
+            slot_counts(session, doctor_id), calendar_buckets(session, doctor_id, start, start + timedelta(days=14)),
+            start, 14,
+        )
+
+    print(f"doctor dashboard request (projections)  {timed_fetch(engine, dashboard, args.repeat) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Slot recommendation latency as the number of candidate doctors grows.
+
+"Load all" is the by-hand approach: every candidate's free slots (what
+GET /doctors/{id}/slots returns), filtered to the preference windows, scored
+and sorted. "Merged streams" is recommendations.recommend, which reads each
+doctor's slots a page at a time and stops once the top K are settled. Each
+doctor has --days days of 16 half-hour slots, and the request is "weekday
+mornings, the sooner the better", top 10.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlmodel import Session
+from ..models import epoch_seconds
+from ..readmodels import slot_rows
+from ..recommendations import recommend
+from ..schemas import PreferenceWindow, RankingWeights
+from ._util import seed_users, temp_engine
+
+_SEED_SLOTS = """
+WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :count - 1)
+INSERT INTO slot (doctor_id, start_time, end_time, is_booked, start_ts, end_ts)
+SELECT doctor_id, datetime(ts, 'unixepoch'), datetime(ts + 1800, 'unixepoch'), abs(random()) % 3 = 0, ts, ts + 1800
+FROM (SELECT :first_doctor + i / :per_doctor AS doctor_id,
+             :start + (i % :per_doctor) / 16 * 86400 + 8 * 3600 + (i % 16) * 1800 AS ts FROM n)
+"""
+
+WINDOWS = [PreferenceWindow(weekdays=[0, 1, 2, 3, 4], start="08:00", end="12:00")]
+LIMIT = 10
+
+
+def load_all(session: Session, doctor_ids: list[int]) -> list[tuple[float, int]]:
+    now_ts = int(time.time())
+    scored = []
+    for doctor_id in doctor_ids:
+        for slot in slot_rows(session, doctor_id, only_available=True):
+            start = epoch_seconds(slot.start_time)
+            if start < now_ts:
+                continue
+            weekday, second = (start // 86_400 + 3) % 7, start % 86_400
+            if weekday < 5 and 8 * 3600 <= second < 12 * 3600:
+                scored.append(((start - now_ts) / 3600, slot.id))
+    return sorted(scored)[:LIMIT]
+
+
+def merged(session: Session, doctor_ids: list[int]) -> list[tuple[float, int]]:
+    rows = recommend(session, WINDOWS, RankingWeights(), LIMIT, doctor_ids=doctor_ids)
+    return [(row.score, row.slot_id) for row in rows]
+
+
+def latency_ms(engine, find, doctor_ids: list[int], repeat: int) -> tuple[float, list[int]]:
+    samples = []
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            found = find(session, doctor_ids)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, [slot_id for _, slot_id in found]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--doctors", default="10,50,200,1000")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    counts = [int(n) for n in args.doctors.split(",")]
+
+    engine = temp_engine()
+    doctor_ids, _ = seed_users(engine, max(counts), 1)
+    per_doctor = args.days * 16
+    start_ts = int(time.time()) // 86400 * 86400 + 86400
+    with engine.begin() as conn:
+        conn.execute(text(_SEED_SLOTS), {
+            "count": per_doctor * len(doctor_ids), "first_doctor": doctor_ids[0], "per_doctor": per_doctor,
+            "start": start_ts,
+        })
+
+    print(f"{per_doctor} slots per doctor (a third booked), top {LIMIT}, "
+          f"weekday mornings from {datetime.now(timezone.utc):%a %Y-%m-%d}")
+    for count in counts:
+        candidates = doctor_ids[:count]
+        before, expected = latency_ms(engine, load_all, candidates, args.repeat)
+        after, found = latency_ms(engine, merged, candidates, args.repeat)
+        assert found == expected, (found, expected)
+        print(f"{count:>5} doctors   load all {before:9.1f} ms   merged streams {after:8.1f} ms   {before / after:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Reminder queue throughput: schedule, cancel and batched dispatch of 1M reminders."""
+import argparse
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from ..reminders import FileSink, Reminder, ReminderQueue
+from ._util import timed
+
+
+class CountingSink:
+    def __init__(self):
+        self.sent = 0
+        self.batches = 0
+
+    def send(self, batch: list[Reminder]) -> None:
+        self.sent += len(batch)
+        self.batches += 1
+
+
+def make_reminders(count: int) -> list[Reminder]:
+    base = datetime(2031, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(7)
+    reminders = []
+    for i in range(count):
+        start = base + timedelta(minutes=20 * rng.randrange(count))
+        reminders.append(Reminder(i, start.timestamp() - 86_400, start, f"pat{i % 5000}@bench.local", "Patient", "Doc"))
+    return reminders
+
+
+def drain(queue: ReminderQueue, sink, batch_size: int) -> None:
+    while True:
+        batch = queue.pop_due(float("inf"), batch_size)
+        if not batch:
+            return
+        sink.send(batch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reminders", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--file-reminders", type=int, default=100_000)
+    args = parser.parse_args()
+
+    reminders = make_reminders(args.reminders)
+    queue = ReminderQueue()
+    with timed("schedule", len(reminders)):
+        for reminder in reminders:
+            queue.schedule(reminder)
+
+    cancelled = random.Random(11).sample(range(args.reminders), args.reminders // 10)
+    with timed("cancel 10%", len(cancelled)):
+        for appointment_id in cancelled:
+            queue.cancel(appointment_id)
+
+    sink = CountingSink()
+    remaining = len(queue)
+    with timed(f"dispatch in batches of {args.batch_size}", remaining):
+        drain(queue, sink, args.batch_size)
+    assert sink.sent == remaining, (sink.sent, remaining)
+    print(f"{sink.sent:,} reminders in {sink.batches:,} batches")
+
+    queue = ReminderQueue()
+    for reminder in reminders[:args.file_reminders]:
+        queue.schedule(reminder)
+    path = os.path.join(tempfile.mkdtemp(prefix="appt-reminders-"), "reminders.jsonl")
+    with timed("dispatch to file sink", args.file_reminders):
+        drain(queue, FileSink(path), args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
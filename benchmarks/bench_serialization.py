@@ -0,0 +1,102 @@
+"""List endpoint serialization: ORM objects through response_model vs. the batch JSON path."""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+from fastapi import Depends, FastAPI
+from sqlmodel import Session, select
+from ..auth import get_current_user
+from ..database import get_session
+from ..models import Appointment, DoctorProfile, Slot, User
+from ..routers.appointment_router import router as appointment_router
+from ..routers.doctor_router import router as doctor_router
+from ..schemas import AppointmentOut, DoctorOut, SlotOut
+from ._util import asgi_get, seed_users, temp_engine
+
+
+def build_app(engine, patient_id: int) -> FastAPI:
+    app = FastAPI()
+    app.include_router(doctor_router)
+    app.include_router(appointment_router)
+
+    def bench_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = bench_session
+    app.dependency_overrides[get_current_user] = lambda: User(id=patient_id, email="", hashed_password="", role="patient")
+
+    # The ORM-object handlers as they were before the batch path
+    @app.get("/legacy/doctors/", response_model=List[DoctorOut])
+    def legacy_doctors(session: Session = Depends(get_session)):
+        return session.exec(select(DoctorProfile)).all()
+
+    @app.get("/legacy/doctors/{doctor_id}/slots", response_model=List[SlotOut])
+    def legacy_slots(doctor_id: int, only_available: bool = True, session: Session = Depends(get_session)):
+        stmt = select(Slot).where(Slot.doctor_id == doctor_id)
+        if only_available:
+            stmt = stmt.where(Slot.is_booked == False)
+        return session.exec(stmt).all()
+
+    @app.get("/legacy/appointments/me", response_model=List[AppointmentOut])
+    def legacy_appointments(session: Session = Depends(get_session)):
+        return session.exec(select(Appointment).where(Appointment.patient_id == patient_id)).all()
+
+    return app
+
+
+def seed(engine, rows: int) -> tuple[int, int]:
+    doctor_ids, (patient_id,) = seed_users(engine, rows, 1, ("Cardiology", "Dermatology", "General"))
+    doctor_id = doctor_ids[0]
+    start = datetime(2031, 1, 1, 8, 0, tzinfo=timezone.utc)
+    with Session(engine) as session:
+        session.add_all(
+            Slot(doctor_id=doctor_id, start_time=start + timedelta(minutes=20 * i), end_time=start + timedelta(minutes=20 * i + 20))
+            for i in range(rows)
+        )
+        session.commit()
+        slot_ids = session.exec(select(Slot.id)).all()
+        session.add_all(
+            Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id, reason="Checkup")
+            for slot_id in slot_ids
+        )
+        session.commit()
+    return doctor_id, patient_id
+
+
+def measure(app, path: str, repeat: int) -> tuple[float, bytes]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status, body = asgi_get(app, path)
+        timings.append(time.perf_counter() - start)
+        assert status == 200, (path, status, body[:200])
+    return statistics.median(timings), body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    doctor_id, patient_id = seed(engine, args.rows)
+    app = build_app(engine, patient_id)
+
+    print(f"{args.rows:,} rows per response, median of {args.repeat}")
+    for label, path in [
+        ("GET /doctors/", "/doctors/"),
+        ("GET /doctors/{id}/slots", f"/doctors/{doctor_id}/slots"),
+        ("GET /appointments/me", "/appointments/me"),
+    ]:
+        legacy, legacy_body = measure(app, "/legacy" + path, args.repeat)
+        fast, fast_body = measure(app, path, args.repeat)
+        same = "identical" if legacy_body == fast_body else "DIFFERENT"
+        print(f"{label:<26} orm {legacy * 1000:8.1f} ms   batch {fast * 1000:8.1f} ms   x{legacy / fast:4.1f}   body {same}")
+
+
+if __name__ == "__main__":
+    main()
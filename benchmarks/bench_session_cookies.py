@@ -0,0 +1,83 @@
+"""Identity lookup on HTML pages: plain cookie plus queries vs. signed session cookie.
+
+"Before" is what the pages did with the plain user_id cookie: load the User
+row and, for a doctor, the DoctorProfile card. "Signed, cold" verifies the
+HMAC and decodes the claims of every cookie; "signed, cached" is the steady
+state, where each visitor's cookie was verified before. Half of the visitors
+are doctors.
+"""
+import argparse
+import statistics
+import time
+from typing import Callable
+from fastapi import Request
+from sqlmodel import Session, select
+from ..auth import SECRET_KEY
+from ..models import DoctorProfile, User
+from ..readmodels import doctor_card_for_user
+from ..session_cookies import SESSION_COOKIE, SessionSigner
+from ._util import seed_users, temp_engine
+
+
+def request_with(cookie: str) -> Request:
+    return Request({"type": "http", "headers": [(b"cookie", cookie.encode("ascii"))]})
+
+
+def before(engine, requests: list[Request]) -> None:
+    with Session(engine) as session:
+        for request in requests:
+            user = session.get(User, int(request.cookies["user_id"]))
+            assert user is not None
+            if request.cookies["user_role"] == "doctor":
+                assert doctor_card_for_user(session, int(user.id or 0)) is not None
+            # Each page load gets its own session; don't let the identity map help
+            session.expunge_all()
+
+
+def signed(signer: SessionSigner) -> Callable[[object, list[Request]], None]:
+    def run(engine, requests: list[Request]) -> None:
+        for request in requests:
+            assert signer.verify(request.cookies[SESSION_COOKIE]) is not None
+    return run
+
+
+def per_call_us(engine, run: Callable[[object, list[Request]], None], requests: list[Request], repeat: int,
+                setup: Callable[[], None] = lambda: None) -> float:
+    samples = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run(engine, requests)
+        samples.append((time.perf_counter() - start) / len(requests))
+    return statistics.median(samples) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--visitors", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    _, patient_ids = seed_users(engine, args.visitors // 2, args.visitors - args.visitors // 2)
+    with Session(engine) as session:
+        doctors = session.exec(select(DoctorProfile.user_id, DoctorProfile.id)).all()
+    signer = SessionSigner([SECRET_KEY])
+    plain, cookies = [], []
+    for user_id, profile_id in doctors:
+        plain.append(request_with(f"user_id={user_id}; user_role=doctor"))
+        cookies.append(request_with(f"{SESSION_COOKIE}={signer.sign(user_id, 'doctor', 'Doc', profile_id, 'General')}"))
+    for user_id in patient_ids:
+        plain.append(request_with(f"user_id={user_id}; user_role=patient"))
+        cookies.append(request_with(f"{SESSION_COOKIE}={signer.sign(user_id, 'patient', 'Patient')}"))
+
+    print(f"{args.visitors:,} visitors, half of them doctors")
+    baseline = per_call_us(engine, before, plain, args.repeat)
+    cold = per_call_us(engine, signed(signer), cookies, args.repeat, setup=signer._verify_cached.cache_clear)  # type: ignore[attr-defined]
+    cached = per_call_us(engine, signed(signer), cookies, args.repeat)
+    for label, us in (("before (queries)", baseline), ("signed, cold", cold), ("signed, cached", cached)):
+        print(f"{label:<18} {us:8.2f} us/page   {baseline / us:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Booking write throughput as the number of doctor shards grows.
+
+Several worker processes book slots spread over all doctors, one transaction
+per booking through a routed session, the way the API does. Shard count 0 is
+the single-file layout. Transactions that find their file locked are rolled
+back and retried, and the retries are reported.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlmodel import create_engine, select
+from ..models import Appointment, Slot, epoch_seconds
+from ..policies import policy_cache  # noqa: F401 - stamps deadlines on insert, as in the app
+from ..sharding import ShardSet, route_doctor
+from ..versions import bump_versions, SLOTS, APPOINTMENTS
+from ._util import seed_users
+
+
+def build(count: int, doctors: int, slots_per_doctor: int) -> tuple[ShardSet, list[tuple[int, int]], list[int]]:
+    directory = tempfile.mkdtemp(prefix="appt-shards-")
+    bind = create_engine(f"sqlite:///{os.path.join(directory, 'global.db')}", echo=False)
+    shard_set = ShardSet(bind, count, f"sqlite:///{directory}/shard{{index}}.db")
+    shard_set.init()
+    doctor_ids, patient_ids = seed_users(bind, doctors, 100)
+    first = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    slots = []
+    for doctor_id in doctor_ids:
+        with shard_set.session() as session:
+            route_doctor(session, doctor_id)
+            starts = [first + timedelta(minutes=20 * i) for i in range(slots_per_doctor)]
+            session.exec(insert(Slot), params=[
+                {"doctor_id": doctor_id, "start_time": start, "end_time": start + timedelta(minutes=20),
+                 "start_ts": epoch_seconds(start), "end_ts": epoch_seconds(start) + 1200}
+                for start in starts
+            ])
+            session.commit()
+            slot_ids = session.exec(select(Slot.id).where(Slot.doctor_id == doctor_id).order_by(Slot.id)).all()
+            slots.append([(doctor_id, int(slot_id)) for slot_id in slot_ids])
+    # Interleave doctors so every worker writes to every shard
+    bookings = [booking for column in zip(*slots) for booking in column]
+    shard_set.dispose()
+    return shard_set, bookings, patient_ids
+
+
+def book_all(shard_set: ShardSet, bookings: list[tuple[int, int]], patient_id: int, start, retries) -> None:
+    shard_set.dispose(close=False)
+    start.wait()
+    retried = 0
+    for doctor_id, slot_id in bookings:
+        while True:
+            try:
+                with shard_set.session() as session:
+                    route_doctor(session, doctor_id)
+                    slot = session.get(Slot, slot_id)
+                    assert slot is not None and not slot.is_booked
+                    slot.is_booked = True
+                    session.add(slot)
+                    session.add(Appointment(doctor_id=doctor_id, patient_id=patient_id, slot_id=slot_id))
+                    bump_versions(session, SLOTS, APPOINTMENTS)
+                    session.commit()
+                break
+            except OperationalError:
+                retried += 1
+    retries.put(retried)
+
+
+def run(count: int, workers: int, doctors: int, bookings_per_worker: int) -> tuple[float, int]:
+    slots_per_doctor = -(-workers * bookings_per_worker // doctors)
+    shard_set, bookings, patient_ids = build(count, doctors, slots_per_doctor)
+    ctx = multiprocessing.get_context("fork")
+    start = ctx.Event()
+    retries = ctx.Queue()
+    procs = [
+        ctx.Process(target=book_all, args=(
+            shard_set, bookings[w::workers][:bookings_per_worker], patient_ids[w % len(patient_ids)], start, retries,
+        ))
+        for w in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    began = time.perf_counter()
+    start.set()
+    retried = sum(retries.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - began
+    assert all(proc.exitcode == 0 for proc in procs)
+    return workers * bookings_per_worker / elapsed, retried
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", default="0,1,2,4,8", help="0 is the single-file layout")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--doctors", type=int, default=64)
+    parser.add_argument("--bookings", type=int, default=250, help="per worker")
+    args = parser.parse_args()
+
+    print(f"{args.workers} worker processes, {args.workers * args.bookings:,} bookings over {args.doctors} doctors")
+    for count in map(int, args.shards.split(",")):
+        rate, retried = run(count, args.workers, args.doctors, args.bookings)
+        label = "single file" if count == 0 else f"{count} shards"
+        print(f"{label:<12} {rate:10,.0f} bookings/s   {retried:6,} retried transactions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Slot time queries on the datetime columns (before) vs. the epoch columns (after).
+
+"Before" reproduces the old code paths on the same data: range filters and
+sorts on the naive start_time column behind a (doctor_id, start_time) index,
+sorting the booking list in Python, and the cancel-window check patching the
+timezone of an ORM-loaded slot. "After" runs the readmodels queries, which
+filter and sort on the integer start_ts column in SQL and decode aware
+datetimes from it, and decides cancellations from the appointment's
+precomputed cancellable_until_ts.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, Table, insert
+from sqlalchemy.orm import registry
+from sqlmodel import Session, select
+from ..models import Appointment, Slot, epoch_seconds
+from ..policies import DEFAULT_CANCELLATION_NOTICE, can_cancel
+from ..readmodels import slot_rows, slot_window
+from ._util import seed_users, temp_engine
+
+
+class LegacySlot:
+    """The slot table as the old code mapped it: plain DateTime columns, no epoch columns."""
+
+
+registry().map_imperatively(LegacySlot, Table(
+    "slot",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("doctor_id", Integer),
+    Column("start_time", DateTime),
+    Column("end_time", DateTime),
+    Column("is_booked", Boolean),
+))
+LEGACY_COLUMNS = (LegacySlot.id, LegacySlot.start_time, LegacySlot.end_time, LegacySlot.is_booked)  # type: ignore[attr-defined]
+
+FIRST_START = datetime(2031, 1, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def seed(engine, doctors: int, slots_per_doctor: int) -> tuple[list[int], list[int]]:
+    doctor_ids, patient_ids = seed_users(engine, doctors, 100)
+    with Session(engine) as session:
+        for doctor_id in doctor_ids:
+            rows = []
+            for i in range(slots_per_doctor):
+                start = FIRST_START + timedelta(minutes=20 * i)
+                end = start + timedelta(minutes=20)
+                rows.append({
+                    "doctor_id": doctor_id, "start_time": start, "end_time": end, "is_booked": i % 3 == 0,
+                    "start_ts": epoch_seconds(start), "end_ts": epoch_seconds(end),
+                })
+            session.exec(insert(Slot), params=rows)
+        booked = session.exec(
+            select(Slot.id, Slot.doctor_id, Slot.start_ts).where(Slot.is_booked == True).limit(2000)
+        ).all()
+        notice = int(DEFAULT_CANCELLATION_NOTICE.total_seconds())
+        session.exec(insert(Appointment), params=[
+            {"doctor_id": doctor_id, "patient_id": patient_ids[i % len(patient_ids)], "slot_id": slot_id,
+             "created_at": FIRST_START, "cancellable_until_ts": start_ts - notice}
+            for i, (slot_id, doctor_id, start_ts) in enumerate(booked)
+        ])
+        session.commit()
+        appointment_ids = list(session.exec(select(Appointment.id)).all())
+    with engine.begin() as conn:
+        # The index the old queries relied on
+        conn.exec_driver_sql("CREATE INDEX ix_slot_doctor_id_start_time ON slot (doctor_id, start_time)")
+    return doctor_ids, [int(a) for a in appointment_ids]
+
+
+def range_before(session: Session, doctor_id: int, start: datetime, end: datetime) -> list[Any]:
+    naive_start, naive_end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    stmt = (
+        select(*LEGACY_COLUMNS)
+        .where(LegacySlot.doctor_id == doctor_id,  # type: ignore[attr-defined]
+               LegacySlot.start_time >= naive_start, LegacySlot.start_time < naive_end)  # type: ignore[attr-defined]
+        .order_by(LegacySlot.start_time, LegacySlot.id)  # type: ignore[attr-defined]
+    )
+    return list(session.exec(stmt).all())
+
+
+def listing_before(session: Session, doctor_id: int) -> list[Any]:
+    rows = session.exec(select(*LEGACY_COLUMNS).where(LegacySlot.doctor_id == doctor_id)).all()  # type: ignore[attr-defined]
+    return sorted(rows, key=lambda s: s.start_time)
+
+
+def cancel_window_before(session: Session, appointment_ids: list[int], now: datetime) -> list[bool]:
+    decisions = []
+    for appointment_id in appointment_ids:
+        appointment = session.get(Appointment, appointment_id)
+        assert appointment is not None and appointment.slot is not None
+        slot_time = appointment.slot.start_time
+        if slot_time.tzinfo is None:
+            slot_time = slot_time.replace(tzinfo=timezone.utc)
+        decisions.append((slot_time - now).total_seconds() / 3600 > 10)
+    return decisions
+
+
+def cancel_window_after(session: Session, appointment_ids: list[int], now: datetime) -> list[bool]:
+    decisions = []
+    for appointment_id in appointment_ids:
+        appointment = session.get(Appointment, appointment_id)
+        assert appointment is not None
+        decisions.append(can_cancel(appointment, now))
+    return decisions
+
+
+def median_ms(engine, runs: list[Callable[[Session], Any]], repeat: int) -> list[float]:
+    """Median time of each run, interleaved so machine noise hits them alike."""
+    timings: list[list[float]] = [[] for _ in runs]
+    for _ in range(repeat):
+        for run, samples in zip(runs, timings):
+            with Session(engine) as session:
+                start = time.perf_counter()
+                run(session)
+                samples.append(time.perf_counter() - start)
+    return [statistics.median(samples) * 1000 for samples in timings]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--slots-per-doctor", type=int, default=4000)
+    parser.add_argument("--window-days", type=int, default=14)
+    parser.add_argument("--cancels", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    doctor_ids, appointment_ids = seed(engine, args.doctors, args.slots_per_doctor)
+    doctor_id = doctor_ids[len(doctor_ids) // 2]
+    window_start = FIRST_START + timedelta(days=10)
+    window_end = window_start + timedelta(days=args.window_days)
+    now = FIRST_START - timedelta(days=1)
+    cancels = appointment_ids[:args.cancels]
+    print(f"{args.doctors * args.slots_per_doctor:,} slots, {args.slots_per_doctor:,} per doctor")
+
+    cases = [
+        (f"{args.window_days}-day range",
+         lambda s: range_before(s, doctor_id, window_start, window_end),
+         lambda s: slot_window(s, doctor_id, window_start, window_end)),
+        ("sorted listing (booking page)",
+         lambda s: listing_before(s, doctor_id),
+         lambda s: slot_rows(s, doctor_id)),
+        (f"cancel window x{len(cancels)}",
+         lambda s: cancel_window_before(s, cancels, now),
+         lambda s: cancel_window_after(s, cancels, now)),
+    ]
+    for label, before, after in cases:
+        with Session(engine) as session:
+            assert len(before(session)) == len(after(session)), label
+        before_ms, after_ms = median_ms(engine, [before, after], args.repeat)
+        print(f"{label:<32} before {before_ms:8.2f} ms   after {after_ms:8.2f} ms   {before_ms / after_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
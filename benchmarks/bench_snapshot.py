@@ -0,0 +1,103 @@
+"""Building the doctors x buckets availability matrix: slot list JSON vs. snapshot.
+
+"Slot lists" is what the scheduling optimizer did: GET
+/doctors/{id}/slots?only_available=false for every doctor, parse the JSON and
+set the buckets each slot covers. "Export" is snapshots.export_snapshot;
+"open + scan" maps the file and reads every doctor's two bitmaps, which is
+all a consumer has to do once the file exists.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlmodel import Session
+from ..database import get_session
+from ..models import epoch_seconds
+from ..routers.doctor_router import router as doctor_router
+from ..snapshots import SNAPSHOT_BUCKET_SECONDS, AvailabilitySnapshot, export_snapshot, row_bytes
+from ..versions import VersionWatcher
+from ._util import asgi_get, seed_users, temp_engine, timed
+
+_SEED_SLOTS = """
+WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :count - 1)
+INSERT INTO slot (doctor_id, start_time, end_time, is_booked, booked_count, start_ts, end_ts)
+SELECT doctor_id, datetime(ts, 'unixepoch'), datetime(ts + 1800, 'unixepoch'), booked, booked, ts, ts + 1800
+FROM (SELECT doctor_id, ts, abs(random()) % 2 AS booked FROM (SELECT :first_doctor + i / :per_doctor AS doctor_id,
+             :start + (i % :per_doctor) / 16 * 86400 + 8 * 3600 + (i % 16) * 1800 AS ts FROM n))
+"""
+
+
+def from_slot_lists(app: FastAPI, doctor_ids: list[int], start_ts: int, buckets: int) -> int:
+    width = row_bytes(buckets)
+    marked = 0
+    for doctor_id in doctor_ids:
+        status, body = asgi_get(app, f"/doctors/{doctor_id}/slots", "only_available=false")
+        assert status == 200
+        free, booked = bytearray(width), bytearray(width)
+        for slot in json.loads(body):
+            start = epoch_seconds(datetime.fromisoformat(slot["start_time"]))
+            end = epoch_seconds(datetime.fromisoformat(slot["end_time"]))
+            states = [bits for bits, on in ((free, slot["seats_left"] > 0), (booked, slot["seats_left"] < slot["capacity"])) if on]
+            for bucket in range((start - start_ts) // SNAPSHOT_BUCKET_SECONDS, (end - 1 - start_ts) // SNAPSHOT_BUCKET_SECONDS + 1):
+                if 0 <= bucket < buckets:
+                    for bits in states:
+                        bits[bucket >> 3] |= 1 << (bucket & 7)
+        marked += int.from_bytes(free, "little").bit_count() + int.from_bytes(booked, "little").bit_count()
+    return marked
+
+
+def scan(path: str) -> int:
+    marked = 0
+    with AvailabilitySnapshot(path) as snapshot:
+        for doctor_id in snapshot.doctor_ids:
+            free, booked = snapshot.row(doctor_id)
+            marked += int.from_bytes(free, "little").bit_count() + int.from_bytes(booked, "little").bit_count()
+            free.release()
+            booked.release()
+    return marked
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--days", type=int, default=28)
+    args = parser.parse_args()
+
+    engine = temp_engine()
+    doctor_ids, _ = seed_users(engine, args.doctors, 1)
+    now = int(time.time())
+    start_ts = now // 86400 * 86400 + 86400
+    per_doctor = args.days * 16
+    with engine.begin() as conn:
+        conn.execute(text(_SEED_SLOTS), {
+            "count": per_doctor * args.doctors, "first_doctor": doctor_ids[0], "per_doctor": per_doctor, "start": start_ts,
+        })
+
+    app = FastAPI()
+    app.include_router(doctor_router)
+
+    def bench_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = bench_session
+    path = os.path.join(tempfile.mkdtemp(prefix="appt-snapshot-"), "availability.snap")
+    buckets = args.days * 86400 // SNAPSHOT_BUCKET_SECONDS
+    print(f"{args.doctors} doctors x {buckets} buckets, {per_doctor * args.doctors:,} slots of 30 minutes")
+    with timed("slot lists"):
+        expected = from_slot_lists(app, doctor_ids, start_ts, buckets)
+    with timed("export"):
+        export_snapshot(path, datetime.fromtimestamp(start_ts, timezone.utc), args.days,
+                        bind=engine, engines=[engine], watcher=VersionWatcher(engine))
+    with timed("open + scan"):
+        marked = scan(path)
+    assert marked == expected, (marked, expected)
+    print(f"snapshot is {os.path.getsize(path):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Cold-start timing: `import main` and lifespan readiness, each in a fresh interpreter."""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PACKAGE = (__package__ or "benchmarks").rpartition(".")[0]
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runs in the child. The database lives in the child's cwd (DATABASE_URL is relative).
+PROBE = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from {package} import main
+t1 = time.perf_counter()
+
+async def ready():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+t2 = asyncio.run(ready())
+print(json.dumps({{"import": t1 - t0, "ready": t2 - t1, "crypto_loaded": "jose" in sys.modules}}))
+"""
+
+
+def probe(cwd: str, warmup: bool) -> dict:
+    env = dict(os.environ, PYTHONPATH=PACKAGE_PARENT, APP_WARMUP="1" if warmup else "0")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(package=PACKAGE)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def report(label: str, runs: list[dict]) -> None:
+    imp = statistics.median(r["import"] for r in runs) * 1000
+    ready = statistics.median(r["ready"] for r in runs) * 1000
+    crypto = "yes" if runs[-1]["crypto_loaded"] else "no"
+    print(f"{label:<32} import {imp:8.1f} ms   ready {ready:8.1f} ms   crypto loaded: {crypto}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for warmup in (False, True):
+        suffix = " + warmup" if warmup else ""
+        fresh = []
+        for _ in range(args.runs):
+            fresh.append(probe(tempfile.mkdtemp(prefix="appt-start-"), warmup))
+        report("fresh database" + suffix, fresh)
+
+        cwd = tempfile.mkdtemp(prefix="appt-start-")
+        probe(cwd, warmup)
+        existing = [probe(cwd, warmup) for _ in range(args.runs)]
+        report("up-to-date database" + suffix, existing)
+
+
+if __name__ == "__main__":
+    main()
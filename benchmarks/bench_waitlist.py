@@ -0,0 +1,66 @@
+"""Waitlist promotion cost as the waitlist grows."""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlmodel import Session, select
+from ..models import Slot, WaitlistEntry, WaitlistMatch, epoch_seconds
+from ..waitlist import promote_waitlisted
+from ._util import seed_users, temp_engine
+
+
+def seed(engine, entries: int, slots: int, per_entry: int) -> list[int]:
+    (doctor_id,), patient_ids = seed_users(engine, 1, 1000)
+    start = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    with Session(engine) as session:
+        session.exec(insert(Slot), params=[
+            {"doctor_id": doctor_id, "start_time": start + timedelta(minutes=20 * i),
+             "end_time": start + timedelta(minutes=20 * i + 20), "is_booked": True,
+             "start_ts": epoch_seconds(start + timedelta(minutes=20 * i)),
+             "end_ts": epoch_seconds(start + timedelta(minutes=20 * i + 20))}
+            for i in range(slots)
+        ])
+        session.exec(insert(WaitlistEntry), params=[
+            {"doctor_id": doctor_id, "patient_id": patient_ids[i % len(patient_ids)],
+             "window_start": start, "window_end": start + timedelta(days=30),
+             "created_at": start}
+            for i in range(entries)
+        ])
+        slot_ids = list(session.exec(select(Slot.id)).all())
+        entry_ids = list(session.exec(select(WaitlistEntry.id)).all())
+        session.exec(insert(WaitlistMatch), params=[
+            {"slot_id": slot_ids[(i * 7 + k) % slots], "entry_id": entry_id}
+            for i, entry_id in enumerate(entry_ids)
+            for k in range(per_entry)
+        ])
+        session.commit()
+        return [int(s) for s in slot_ids]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--slots", type=int, default=2000)
+    parser.add_argument("--per-entry", type=int, default=20, help="slots matched by each entry")
+    parser.add_argument("--promotions", type=int, default=200)
+    args = parser.parse_args()
+
+    for size in map(int, args.sizes.split(",")):
+        engine = temp_engine()
+        slot_ids = seed(engine, size, args.slots, args.per_entry)
+        timings = []
+        for slot_id in slot_ids[:args.promotions]:
+            with Session(engine) as session:
+                slot = session.get(Slot, slot_id)
+                assert slot is not None
+                start = time.perf_counter()
+                promote_waitlisted(session, slot)
+                session.commit()
+                timings.append(time.perf_counter() - start)
+        print(f"{size:>9,} entries ({size * args.per_entry:>10,} matches)   "
+              f"promotion + commit median {statistics.median(timings) * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,25 @@
+import argparse
+import getpass
+import sys
+from typing import Sequence
+from sqlalchemy.dialects.sqlite import insert
 from sqlmodel import Session, select
 from .models import User, DoctorProfile
-from .auth import get_password_hash
+from .auth import get_password_hash, hash_passwords
+from .schemas import BulkUserResult, UserCreate
+from .versions import bump_versions, USERS, DOCTORS
+
+PASSWORD_TOO_LONG = "Password is too long (bcrypt supports max 72 bytes)."
 
 def create_user(session: Session, email: str, password: str, full_name: str, role: str, specialization: str | None = None):
     # bcrypt only processes the first 72 bytes of the password.
     # If a longer password is passed, the bcrypt backend raises ValueError.
     if len(password.encode("utf-8")) > 72:
-        raise ValueError("Password is too long (bcrypt supports max 72 bytes).")
+        raise ValueError(PASSWORD_TOO_LONG)
 
     user = User(email=email, hashed_password=get_password_hash(password), full_name=full_name, role=role)
     session.add(user)
+    bump_versions(session, USERS)
     session.commit()
     session.refresh(user)
 
@@ -19,13 +29,101 @@ def create_user(session: Session, email: str, password: str, full_name: str, rol
     if role == "doctor":
         dp = DoctorProfile(user_id=int(user.id), specialization=specialization or "General")
         session.add(dp)
+        bump_versions(session, DOCTORS)
         session.commit()
         session.refresh(dp)
         return user, dp
     return user, None
 
+def create_users(session: Session, rows: Sequence[UserCreate]) -> list[BulkUserResult]:
+    """Register many users in one transaction and commit. One result per row, in order.
+
+    Rows that register would reject (missing full_name, password too long,
+    email already taken or repeated earlier in rows) are reported and
+    skipped; the rest are inserted together. Roles are limited to patient
+    and doctor by UserCreate itself.
+    """
+    results = [BulkUserResult(index=i, email=row.email, status="created") for i, row in enumerate(rows)]
+    taken = set(session.exec(select(User.email).where(User.email.in_({row.email for row in rows}))).all())
+    accepted: list[int] = []
+    for i, row in enumerate(rows):
+        if not row.full_name:
+            results[i].status, results[i].detail = "invalid", "full_name is required"
+        elif len(row.password.encode("utf-8")) > 72:
+            results[i].status, results[i].detail = "invalid", PASSWORD_TOO_LONG
+        elif row.email in taken:
+            results[i].status, results[i].detail = "duplicate", "Email already registered"
+        else:
+            taken.add(row.email)
+            accepted.append(i)
+    if not accepted:
+        return results
+
+    hashes = hash_passwords([rows[i].password for i in accepted])
+    # An email registered since the check above is skipped rather than failing the batch
+    stmt = insert(User).on_conflict_do_nothing(index_elements=[User.email]).returning(User.id, User.email)
+    user_ids = {email: user_id for user_id, email in session.exec(stmt, params=[
+        {"email": rows[i].email, "hashed_password": hashed, "full_name": rows[i].full_name, "role": rows[i].role}
+        for i, hashed in zip(accepted, hashes)
+    ]).all()}
+
+    doctors = [i for i in accepted if rows[i].email in user_ids and rows[i].role == "doctor"]
+    profile_ids: dict[int, int] = {}
+    if doctors:
+        stmt = insert(DoctorProfile).returning(DoctorProfile.id, DoctorProfile.user_id)
+        profile_ids = {user_id: profile_id for profile_id, user_id in session.exec(stmt, params=[
+            {"user_id": user_ids[rows[i].email], "specialization": rows[i].specialization or "General"}
+            for i in doctors
+        ]).all()}
+    for i in accepted:
+        user_id = user_ids.get(rows[i].email)
+        if user_id is None:
+            results[i].status, results[i].detail = "duplicate", "Email already registered"
+            continue
+        results[i].user_id = user_id
+        results[i].doctor_id = profile_ids.get(user_id)
+
+    if user_ids:
+        bump_versions(session, USERS, *([DOCTORS] if doctors else []))
+    session.commit()
+    return results
+
 def list_doctors(session: Session, specialization: str | None = None):
     stmt = select(DoctorProfile)
     if specialization:
         stmt = stmt.where(DoctorProfile.specialization == specialization)
-    return session.exec(stmt).all()
\ No newline at end of file
+    return session.exec(stmt).all()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Create the first admin; register only ever creates patients and doctors.
+
+        python -m doctor_appointment.crud create-admin --email admin@clinic.example.com --full-name "Clinic Admin"
+    """
+    from .auth import get_user_by_email
+    from .database import init_db
+    from .sharding import open_session
+
+    parser = argparse.ArgumentParser(description="Manage users from the command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+    admin = commands.add_parser("create-admin", help="create an admin account; the password is prompted for")
+    admin.add_argument("--email", required=True)
+    admin.add_argument("--full-name", required=True)
+    args = parser.parse_args(argv)
+
+    init_db()
+    with open_session() as session:
+        if get_user_by_email(session, args.email):
+            sys.exit(f"{args.email} is already registered")
+        password = getpass.getpass("Password: ")
+        if not password or password != getpass.getpass("Repeat password: "):
+            sys.exit("Passwords are empty or do not match")
+        try:
+            user, _ = create_user(session, args.email, password, args.full_name, "admin")
+        except ValueError as e:
+            sys.exit(str(e))
+    print(f"created admin {user.id} <{args.email}>")
+
+
+if __name__ == "__main__":
+    main()
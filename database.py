@@ -1,11 +1,137 @@
-from sqlmodel import SQLModel, create_engine, Session
+import os
+from typing import Callable, Optional, Sequence
+from sqlalchemy import Connection, MetaData, Table
+from sqlmodel import create_engine
 
 DATABASE_URL = "sqlite:///./dev.db"
 engine = create_engine(DATABASE_URL, echo=False)
 
+# Set APP_SHARDS=N to keep each doctor's slots and appointments in one of N
+# extra files instead of DATABASE_URL (see sharding.py).
+SHARD_COUNT = int(os.environ.get("APP_SHARDS", "0"))
+SHARD_URL_TEMPLATE = "sqlite:///./dev-shard{index}.db"
+
+# Bump SCHEMA_VERSION whenever a table or column is added. The version is kept
+# in SQLite's user_version header field, so an up-to-date database costs a
+# single PRAGMA at startup instead of a metadata reflection pass.
+SCHEMA_VERSION = 13
+
+def _add_slot_doctor_start_index(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_slot_doctor_id_start_time ON slot (doctor_id, start_time)"
+    )
+
+def _add_appointment_indexes(conn: Connection) -> None:
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_appointment_doctor_id ON appointment (doctor_id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_appointment_patient_id ON appointment (patient_id)")
+
+def _add_reminder_indexes(conn: Connection) -> None:
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_slot_start_time ON slot (start_time)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_appointment_slot_id ON appointment (slot_id)")
+
+def _add_slot_epoch_columns(conn: Connection) -> None:
+    # Slot times become UTC epoch integers for range and sort queries. Stored
+    # datetimes are naive UTC, which is what strftime('%s') assumes.
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(slot)")}
+    for column in ("start_ts", "end_ts"):
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE slot ADD COLUMN {column} INTEGER")
+    conn.exec_driver_sql(
+        "UPDATE slot SET start_ts = CAST(strftime('%s', start_time) AS INTEGER), "
+        "end_ts = CAST(strftime('%s', end_time) AS INTEGER) WHERE start_ts IS NULL"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_slot_doctor_id_start_ts ON slot (doctor_id, start_ts)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_slot_start_ts ON slot (start_ts)")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_slot_doctor_id_start_time")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_slot_start_time")
+
+def _add_appointment_cancellable_until(conn: Connection) -> None:
+    from .policies import DEFAULT_CANCELLATION_NOTICE
+
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(appointment)")}
+    if "cancellable_until_ts" not in columns:
+        conn.exec_driver_sql("ALTER TABLE appointment ADD COLUMN cancellable_until_ts INTEGER")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_appointment_cancellable_until_ts ON appointment (cancellable_until_ts)"
+    )
+    # No policies existed before this version, so every booking had the default notice
+    conn.exec_driver_sql(
+        "UPDATE appointment SET cancellable_until_ts = "
+        "(SELECT start_ts FROM slot WHERE slot.id = appointment.slot_id) - ? "
+        "WHERE cancellable_until_ts IS NULL AND slot_id IS NOT NULL",
+        (int(DEFAULT_CANCELLATION_NOTICE.total_seconds()),),
+    )
+
+def _add_slot_seats(conn: Connection) -> None:
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(slot)")}
+    if "capacity" not in columns:
+        conn.exec_driver_sql("ALTER TABLE slot ADD COLUMN capacity INTEGER NOT NULL DEFAULT 1")
+    if "booked_count" not in columns:
+        conn.exec_driver_sql("ALTER TABLE slot ADD COLUMN booked_count INTEGER NOT NULL DEFAULT 0")
+    # Every existing slot has a single seat, taken if it was booked
+    conn.exec_driver_sql("UPDATE slot SET booked_count = 1 WHERE is_booked AND booked_count = 0")
+
+def _rematch_waitlist_windows(conn: Connection) -> None:
+    # Windows sent with an offset used to be stored in that offset's wall
+    # clock, which cannot be undone. Stored windows are now read as UTC, as
+    # every naive or UTC window already was; match each one against the slots
+    # it covers read that way.
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO waitlistmatch (slot_id, entry_id) "
+        "SELECT slot.id, e.id FROM waitlistentry e JOIN slot ON slot.doctor_id = e.doctor_id "
+        "AND slot.start_ts >= CAST(strftime('%s', e.window_start) AS INTEGER) "
+        "AND slot.start_ts < CAST(strftime('%s', e.window_end) AS INTEGER)"
+    )
+
+def _truncate_slot_times(conn: Connection) -> None:
+    # start_ts and end_ts always dropped the fraction; make the stored
+    # datetimes match them.
+    for column in ("start_time", "end_time"):
+        conn.exec_driver_sql(
+            f"UPDATE slot SET {column} = substr({column}, 1, 19) || '.000000' "
+            f"WHERE {column} IS NOT NULL AND substr({column}, 21) NOT IN ('', '000000')"
+        )
+
+# Steps needed to bring an existing database up to the given version, on top
+# of create_all() creating any missing tables. They must be idempotent.
+MIGRATIONS: dict[int, Callable[[Connection], None]] = {
+    2: _add_slot_doctor_start_index,
+    3: _add_appointment_indexes,
+    4: _add_reminder_indexes,
+    8: _add_slot_epoch_columns,
+    9: _add_appointment_cancellable_until,
+    11: _add_slot_seats,
+    12: _rematch_waitlist_windows,
+    13: _truncate_slot_times,
+}
+
+def get_schema_version(conn: Connection) -> int:
+    return int(conn.exec_driver_sql("PRAGMA user_version").scalar() or 0)
+
+def upgrade_schema(
+    conn: Connection,
+    metadata: MetaData,
+    tables: Optional[Sequence[Table]] = None,
+    migrate: bool = True,
+) -> None:
+    """Bring one database file up to SCHEMA_VERSION."""
+    current = get_schema_version(conn)
+    if current >= SCHEMA_VERSION:
+        return
+    metadata.create_all(conn, tables=tables)
+    if migrate:
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            step = MIGRATIONS.get(version)
+            if step is not None:
+                step(conn)
+    conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
 def init_db():
-    SQLModel.metadata.create_all(engine)
+    from . import models  # noqa: F401 - registers every table on SQLModel.metadata
+    from .sharding import shards
+    shards.init()
 
 def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+    from .sharding import shards
+    with shards.session() as session:
+        yield session
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+# Rendered HTML blocks kept per process. Keys carry the data versions the block
+# was rendered from (see versions.py), so a bump makes old entries unreachable
+# and they age out of the LRU.
+FRAGMENT_CACHE_MAX_ENTRIES = 4096
+
+# Upper bound on the lifetime of blocks whose text depends on the clock, such
+# as "can cancel" on appointment cards, even when they report a longer validity.
+TIME_SENSITIVE_TTL_SECONDS = 300.0
+
+
+class FragmentCache:
+    """Bounded LRU of rendered HTML fragments.
+
+    Entries are either version-keyed only (ttl=None) or additionally expire
+    after ttl seconds, for fragments that go stale as time passes even when
+    the underlying data does not change.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = FRAGMENT_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                html, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return html
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, html: str, ttl: Optional[float] = None) -> None:
+        expires_at = float("inf") if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._entries[key] = (html, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key: Hashable, render: Callable[[], tuple[str, Optional[float]]]) -> str:
+        """Return the cached fragment for key, rendering it on a miss.
+
+        render returns (html, ttl); ttl is None for fragments that only change
+        when the data versions in the key do.
+        """
+        html = self.get(key)
+        if html is None:
+            html, ttl = render()
+            if ttl is None or ttl > 0:
+                self.put(key, html, ttl)
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+fragment_cache = FragmentCache()
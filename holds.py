@@ -0,0 +1,145 @@
+import heapq
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from sqlmodel import Session
+from .models import Appointment
+from .seats import take_seat
+from .versions import bump_versions, SLOTS, APPOINTMENTS
+
+HOLD_TTL_SECONDS = 120
+MAX_HOLD_TTL_SECONDS = 900
+
+
+@dataclass
+class Hold:
+    hold_id: str
+    slot_id: int
+    doctor_id: int
+    patient_id: int
+    expires_at: float
+    pinned: bool = False
+
+
+class HoldTable:
+    """In-memory lease table mapping slots to the patient currently holding them.
+
+    Expiry is tracked with a min-heap of (expires_at, hold_id). Entries are never
+    removed from the heap eagerly; stale ones (released or extended holds) are
+    skipped when they reach the top, so every operation only pays for the holds
+    that actually expired.
+
+    Leases only exclude other requests of the same process; under serve.py
+    two workers can lease the same slot. A lease is therefore never trusted
+    as proof that the slot is free: confirm_hold() books with a conditional
+    update, and the loser gets an error instead of a second booking.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._by_id: dict[str, Hold] = {}
+        self._by_slot: dict[int, Hold] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def _drop(self, hold: Hold) -> None:
+        self._by_id.pop(hold.hold_id, None)
+        if self._by_slot.get(hold.slot_id) is hold:
+            del self._by_slot[hold.slot_id]
+
+    def _expire(self, now: float) -> None:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, hold_id = heapq.heappop(heap)
+            hold = self._by_id.get(hold_id)
+            # Pinned holds are being confirmed and are dropped by release()
+            if hold is not None and not hold.pinned and hold.expires_at <= now:
+                self._drop(hold)
+
+    def acquire(self, slot_id: int, doctor_id: int, patient_id: int, ttl: float = HOLD_TTL_SECONDS) -> Optional[Hold]:
+        """Lease a slot to a patient. Returns None if someone else holds it.
+
+        Re-acquiring a slot the patient already holds extends the lease.
+        """
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            hold = self._by_slot.get(slot_id)
+            if hold is not None:
+                if hold.patient_id != patient_id or hold.pinned:
+                    return None
+                hold.expires_at = now + ttl
+            else:
+                hold = Hold(
+                    hold_id=secrets.token_urlsafe(16),
+                    slot_id=slot_id,
+                    doctor_id=doctor_id,
+                    patient_id=patient_id,
+                    expires_at=now + ttl,
+                )
+                self._by_id[hold.hold_id] = hold
+                self._by_slot[slot_id] = hold
+            heapq.heappush(self._heap, (hold.expires_at, hold.hold_id))
+            return hold
+
+    def get(self, hold_id: str) -> Optional[Hold]:
+        with self._lock:
+            self._expire(self._clock())
+            return self._by_id.get(hold_id)
+
+    def holder(self, slot_id: int) -> Optional[int]:
+        """Patient id currently holding the slot, if any."""
+        with self._lock:
+            self._expire(self._clock())
+            hold = self._by_slot.get(slot_id)
+            return hold.patient_id if hold else None
+
+    def claim(self, hold_id: str, patient_id: int) -> Optional[Hold]:
+        """Pin a live hold for confirmation so it cannot expire mid-commit."""
+        with self._lock:
+            self._expire(self._clock())
+            hold = self._by_id.get(hold_id)
+            if hold is None or hold.patient_id != patient_id or hold.pinned:
+                return None
+            hold.pinned = True
+            return hold
+
+    def release(self, hold_id: str) -> Optional[Hold]:
+        with self._lock:
+            hold = self._by_id.get(hold_id)
+            if hold is not None:
+                self._drop(hold)
+            return hold
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._by_id)
+
+
+slot_holds = HoldTable()
+
+
+def confirm_hold(session: Session, hold: Hold, reason: Optional[str] = None) -> Appointment:
+    """Turn a claimed hold into an appointment.
+
+    The slot row is not loaded; the seat is taken with a conditional update,
+    which raises ValueError if the slot was booked in the meantime, by another
+    worker's hold or a booking that raced the lease.
+    """
+    if not take_seat(session, hold.slot_id):
+        session.rollback()
+        raise ValueError("Slot already booked")
+    appt = Appointment(
+        doctor_id=hold.doctor_id,
+        patient_id=hold.patient_id,
+        slot_id=hold.slot_id,
+        reason=reason,
+    )
+    session.add(appt)
+    bump_versions(session, SLOTS, APPOINTMENTS)
+    session.commit()
+    session.refresh(appt)
+    return appt
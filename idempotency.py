@@ -0,0 +1,211 @@
+"""Idempotency-Key support for mutating API routes.
+
+Routers opt in with route_class=IdempotentRoute. A POST, PUT, PATCH or
+DELETE carrying an Idempotency-Key header first claims the key in the
+IdempotencyRecord table. The request that wins the claim runs the handler and
+stores its response; retries with the same key replay the stored response
+(with an Idempotent-Replayed header) instead of running the handler again.
+Retries that arrive while the first request is still running wait for it:
+within a process on a shared future, across worker processes by polling the
+record.
+
+Server errors are not stored, so a retry after a 5xx runs the handler again.
+Endpoints marked with @read_only, such as searches sent as POST, are never
+stored.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Coroutine, Optional, TypeVar
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from .auth import decode_token
+from .database import engine
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = timedelta(hours=24)
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+# How long a retry waits for the first request with its key to finish.
+IDEMPOTENCY_WAIT_SECONDS = 10.0
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Keys whose first request is running in this process
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _caller(request: Request) -> str:
+    """The authenticated subject of the request's bearer token.
+
+    Access tokens are reissued on every refresh, so scoping by the token
+    itself would let a retry made after a refresh run the handler again.
+    Requests without a valid token fall back to the raw header.
+    """
+    from jose import JWTError
+    authorization = request.headers.get("authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            subject = decode_token(token).get("sub")
+        except JWTError:
+            subject = None
+        if subject is not None:
+            return f"sub:{subject}"
+    return f"header:{authorization}"
+
+
+def _record_key(request: Request, key: str) -> str:
+    # Scope keys to the caller so two clients can never see each other's responses
+    return hashlib.sha256(f"{_caller(request)}\0{key}".encode()).hexdigest()
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{request.url.query}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _claim(record_key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+    """Claim record_key for this request. Returns None on success, else the existing record."""
+    now = _now()
+    with Session(engine) as session:
+        session.exec(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at < now))
+        stmt = insert(IdempotencyRecord).values(
+            key=record_key, fingerprint=fingerprint, created_at=now, expires_at=now + IDEMPOTENCY_TTL,
+        ).on_conflict_do_nothing(index_elements=[IdempotencyRecord.key])
+        claimed = session.exec(stmt).rowcount == 1
+        session.commit()
+        if claimed:
+            return None
+        return session.get(IdempotencyRecord, record_key)
+
+
+def _store(record_key: str, response: Response) -> None:
+    with Session(engine) as session:
+        record = session.get(IdempotencyRecord, record_key)
+        if record is None:
+            return
+        record.status_code = response.status_code
+        record.media_type = response.media_type
+        record.body = bytes(response.body)
+        session.add(record)
+        session.commit()
+
+
+def _forget(record_key: str) -> None:
+    with Session(engine) as session:
+        session.exec(delete(IdempotencyRecord).where(IdempotencyRecord.key == record_key))
+        session.commit()
+
+
+def _replay(record: IdempotencyRecord) -> Response:
+    return Response(
+        content=record.body or b"",
+        status_code=record.status_code or 200,
+        media_type=record.media_type,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _wait_for(record_key: str, deadline: float) -> None:
+    loop = asyncio.get_running_loop()
+    inflight = _inflight.get(record_key)
+    if inflight is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(inflight), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            pass
+    else:
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+async def _run_once(
+    request: Request,
+    key: str,
+    handler: Callable[[Request], Coroutine[Any, Any, Response]],
+) -> Response:
+    if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        return JSONResponse({"detail": f"{IDEMPOTENCY_HEADER} is too long"}, status_code=400)
+
+    record_key = _record_key(request, key)
+    fingerprint = _fingerprint(request, await request.body())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        record = await run_in_threadpool(_claim, record_key, fingerprint)
+        if record is None:
+            break
+        if record.fingerprint != fingerprint:
+            return JSONResponse(
+                {"detail": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                status_code=422,
+            )
+        if record.status_code is not None:
+            return _replay(record)
+        if loop.time() >= deadline:
+            return JSONResponse(
+                {"detail": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                status_code=409,
+            )
+        await _wait_for(record_key, deadline)
+
+    done = loop.create_future()
+    _inflight[record_key] = done
+    try:
+        try:
+            response = await handler(request)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+        if response.status_code >= 500:
+            await run_in_threadpool(_forget, record_key)
+        else:
+            await run_in_threadpool(_store, record_key, response)
+        return response
+    except BaseException:
+        await run_in_threadpool(_forget, record_key)
+        raise
+    finally:
+        del _inflight[record_key]
+        done.set_result(None)
+
+
+def read_only(endpoint: F) -> F:
+    """Mark an endpoint that only reads despite its method, e.g. a search sent as POST.
+
+    IdempotentRoute passes such requests straight through: storing and
+    replaying their responses would only serve stale results.
+    """
+    endpoint._read_only = True  # type: ignore[attr-defined]
+    return endpoint
+
+
+class IdempotentRoute(APIRoute):
+    """APIRoute that honours the Idempotency-Key header on mutating methods."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        if not self.methods & MUTATING_METHODS or getattr(self.endpoint, "_read_only", False):
+            return handler
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return await handler(request)
+            return await _run_once(request, key, handler)
+
+        return idempotent_handler
@@ -0,0 +1,358 @@
+"""Append-only journal of booking events.
+
+Every committed slot creation, booking and cancellation is appended to a JSON
+Lines file, one event per line:
+
+    {"type": "booked", "at": "...", "pid": 123, "appointment_id": 7, "slot_id": 3, ...}
+
+Events are captured by mapper listeners at flush time, so every write path is
+covered, and handed to the journal only once the transaction commits.
+Appends return immediately; a background thread writes whatever has
+accumulated and fsyncs it as one group, so a booking pays for a list append
+rather than a disk flush. Events buffered in the last
+JOURNAL_FLUSH_INTERVAL seconds before a crash can be lost.
+
+If writing or fsyncing fails (a full disk, say), the error is printed and kept
+in EventJournal.error, flush() stops waiting, and the writer reopens the file
+and retries the same group with a doubling delay of up to JOURNAL_RETRY_MAX
+seconds. Meanwhile at most JOURNAL_MAX_BUFFERED events are kept; older ones
+are dropped and counted in EventJournal.dropped.
+
+    python -m doctor_appointment.journal replay     # compare with the database
+    python -m doctor_appointment.journal tail -f    # follow new events
+"""
+import argparse
+import atexit
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession, object_session
+from .models import Appointment, Slot
+
+JOURNAL_PATH = "./booking-events.jsonl"
+
+# How long the writer lingers after the first buffered event to gather a group.
+JOURNAL_FLUSH_INTERVAL = 0.005
+JOURNAL_RETRY_INTERVAL = 0.5
+JOURNAL_RETRY_MAX = 30.0
+JOURNAL_MAX_BUFFERED = 100_000
+
+SLOT_CREATED = "slot_created"
+BOOKED = "booked"
+CANCELLED = "cancelled"
+
+_PENDING_KEY = "journal_events"
+
+
+class EventJournal:
+    """Buffered, group-fsynced appender for one journal file.
+
+    Several worker processes may share the file: it is opened with O_APPEND
+    and each group is written with a single write() call.
+    """
+
+    def __init__(
+        self,
+        path: str = JOURNAL_PATH,
+        flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+        max_buffered: int = JOURNAL_MAX_BUFFERED,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._reset()
+
+    def _reset(self) -> None:
+        self._cond = threading.Condition()
+        self._buffer: list[bytes] = []
+        self._appended = 0
+        self._durable = 0
+        self._generation = 0
+        self._fd: Optional[int] = None
+        # The last write or fsync failure, until a group gets through again
+        self.error: Optional[OSError] = None
+        self.dropped = 0
+
+    def append(self, events: Iterable[dict[str, Any]]) -> None:
+        lines = [json.dumps(e, separators=(",", ":"), default=_encode).encode() + b"\n" for e in events]
+        if not lines:
+            return
+        with self._cond:
+            if self._fd is None:
+                self._start_writer()
+            self._buffer.extend(lines)
+            self._appended += len(lines)
+            excess = len(self._buffer) - self.max_buffered
+            if excess > 0:
+                del self._buffer[:excess]
+                if not self.dropped:
+                    print(f"booking journal: {self.path} is not being written, dropping the oldest events",
+                          file=sys.stderr)
+                self.dropped += excess
+                self._durable += excess  # they will never be written; flush() must not wait for them
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything appended so far is on disk.
+
+        Returns False on timeout, or at once while the file cannot be written.
+        """
+        with self._cond:
+            target = self._appended
+            self._cond.wait_for(lambda: self._durable >= target or self.error is not None, timeout)
+            return self._durable >= target and self.error is None
+
+    def close(self) -> None:
+        self.flush(timeout=5)
+        with self._cond:
+            if self._fd is not None and self._fd >= 0:
+                os.close(self._fd)
+            self._fd = None
+            self._generation += 1
+            self._cond.notify_all()
+
+    def after_fork(self) -> None:
+        # The child has no writer thread, and the lock or buffer may have been
+        # mid-use in the parent; start over with a descriptor of its own.
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._reset()
+
+    def _start_writer(self) -> None:
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        args = (self._fd, self._generation)
+        threading.Thread(target=self._write_groups, args=args, name="event-journal", daemon=True).start()
+
+    def _reopen(self, generation: int) -> int:
+        with self._cond:
+            if self._generation != generation:
+                return -1
+            if self._fd is not None and self._fd >= 0:
+                try:
+                    os.close(self._fd)
+                except OSError:
+                    pass
+            try:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            except OSError as e:
+                # Still failing; the next write on -1 raises and comes back here
+                self.error = e
+                self._fd = -1
+            return self._fd
+
+    def _write_groups(self, fd: int, generation: int) -> None:
+        pending = b""  # taken from the buffer but not yet written
+        count = 0  # events taken from the buffer but not yet fsynced
+        delay = JOURNAL_RETRY_INTERVAL
+        while True:
+            if not count:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._buffer or self._generation != generation)
+                    if self._generation != generation:
+                        return
+                time.sleep(self.flush_interval)
+                with self._cond:
+                    group, self._buffer = self._buffer, []
+                pending, count = b"".join(group), len(group)
+            try:
+                while pending:
+                    pending = pending[os.write(fd, pending):]
+                os.fsync(fd)
+            except OSError as e:
+                with self._cond:
+                    if self._generation != generation:
+                        return
+                    self.error = e
+                    self._cond.notify_all()
+                print(f"booking journal: writing {self.path} failed, retrying in {delay:g}s: {e}", file=sys.stderr)
+                time.sleep(delay)
+                delay = min(delay * 2, JOURNAL_RETRY_MAX)
+                fd = self._reopen(generation)
+                continue
+            with self._cond:
+                self._durable += count
+                if self.error is not None:
+                    print(f"booking journal: writing {self.path} again; {self.dropped} events were dropped",
+                          file=sys.stderr)
+                    self.error = None
+                self._cond.notify_all()
+            count, delay = 0, JOURNAL_RETRY_INTERVAL
+
+
+def _encode(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+booking_journal = EventJournal()
+atexit.register(booking_journal.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=booking_journal.after_fork)
+
+
+def _event(event_type: str, **fields: Any) -> dict[str, Any]:
+    return {"type": event_type, "at": datetime.now(timezone.utc).isoformat(), "pid": os.getpid(), **fields}
+
+
+def _stage(target: Any, record: dict[str, Any]) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, []).append(record)
+
+
+@event.listens_for(Slot, "after_insert")
+def _slot_created(mapper, connection, slot: Slot) -> None:
+    _stage(slot, _event(SLOT_CREATED, slot_id=slot.id, doctor_id=slot.doctor_id,
+                        start_time=slot.start_time, end_time=slot.end_time))
+
+
+@event.listens_for(Appointment, "after_insert")
+def _booked(mapper, connection, appt: Appointment) -> None:
+    _stage(appt, _event(BOOKED, appointment_id=appt.id, slot_id=appt.slot_id,
+                        doctor_id=appt.doctor_id, patient_id=appt.patient_id))
+
+
+@event.listens_for(Appointment, "after_delete")
+def _cancelled(mapper, connection, appt: Appointment) -> None:
+    _stage(appt, _event(CANCELLED, appointment_id=appt.id, slot_id=appt.slot_id,
+                        doctor_id=appt.doctor_id, patient_id=appt.patient_id))
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _append_after_commit(session: OrmSession) -> None:
+    events = session.info.pop(_PENDING_KEY, None)
+    if events:
+        booking_journal.append(events)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _drop_after_rollback(session: OrmSession) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _complete_lines(buf: Any, start: int, end: int) -> Iterator[tuple[dict[str, Any], int]]:
+    """Decode whole lines in buf[start:end], yielding (event, offset after it)."""
+    pos = start
+    while pos < end:
+        nl = buf.find(b"\n", pos, end)
+        if nl < 0:
+            # A partially written last line; it is picked up once complete.
+            return
+        line = buf[pos:nl]
+        pos = nl + 1
+        if line.strip():
+            yield json.loads(line), pos
+
+
+def read_events(path: str = JOURNAL_PATH, offset: int = 0) -> Iterator[tuple[dict[str, Any], int]]:
+    """Yield (event, next offset) for every complete event after offset."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from _complete_lines(buf, offset, size)
+
+
+def journal_end(path: str = JOURNAL_PATH) -> int:
+    """Offset just past the last complete event, for readers that start at the tail."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return buf.rfind(b"\n") + 1
+
+
+def tail_events(path: str = JOURNAL_PATH, offset: int = 0, poll_interval: float = 0.5) -> Iterator[dict[str, Any]]:
+    """Follow the journal like `tail -f`, remapping whenever the file grows."""
+    while True:
+        if os.path.exists(path):
+            for record, offset in read_events(path, offset):
+                yield record
+        time.sleep(poll_interval)
+
+
+def replay(events: Iterable[dict[str, Any]]) -> tuple[set[int], dict[int, int]]:
+    """Rebuild slot state from events.
+
+    Returns (slots created in the journal, seats taken per slot seen). Workers
+    flush their groups independently, so lines from different processes are
+    not strictly in commit order; events are replayed in timestamp order
+    instead. Order matters because SQLite may hand a cancelled appointment's
+    id to the next booking.
+    """
+    created: set[int] = set()
+    live: dict[int, int] = {}
+    for record in sorted(events, key=lambda e: e["at"]):
+        kind = record["type"]
+        if kind == SLOT_CREATED:
+            created.add(record["slot_id"])
+        elif kind == BOOKED:
+            live[record["appointment_id"]] = record["slot_id"]
+        elif kind == CANCELLED:
+            live.pop(record["appointment_id"], None)
+    booked = dict.fromkeys(created, 0)
+    for slot_id in live.values():
+        if slot_id is not None:
+            booked[slot_id] = booked.get(slot_id, 0) + 1
+    return created, booked
+
+
+def verify(path: str = JOURNAL_PATH) -> int:
+    """Compare replayed slot state with the database; returns the mismatch count.
+
+    Only slots created in the journal have their whole history in it. Other
+    slots it touched may carry bookings made before the journal was turned on,
+    so they are counted as partially journaled rather than compared.
+    """
+    from sqlmodel import select
+    from .sharding import fan_out, open_session
+
+    created, booked = replay(record for record, _ in read_events(path))
+    with open_session() as session:
+        actual = dict(fan_out(session, lambda s: s.exec(select(Slot.id, Slot.booked_count)).all()))
+
+    mismatches = 0
+    for slot_id in sorted(created):
+        expected = booked[slot_id]
+        if slot_id not in actual:
+            print(f"slot {slot_id}: in journal, missing from database")
+            mismatches += 1
+        elif actual[slot_id] != expected:
+            print(f"slot {slot_id}: journal says {expected} seats taken, database says {actual[slot_id]}")
+            mismatches += 1
+    partial = len(booked.keys() - created)
+    unseen = len(actual.keys() - booked.keys())
+    print(f"{len(created)} slots replayed, {partial} partially journaled, "
+          f"{unseen} slots predate the journal, {mismatches} mismatches")
+    return mismatches
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect the booking event journal")
+    parser.add_argument("--path", default=JOURNAL_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("replay", help="rebuild slot state from the journal and compare it with the database")
+    tail = commands.add_parser("tail", help="print journal events")
+    tail.add_argument("-f", "--follow", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        sys.exit(1 if verify(args.path) else 0)
+    records = tail_events(args.path) if args.follow else (record for record, _ in read_events(args.path))
+    try:
+        for record in records:
+            print(json.dumps(record))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
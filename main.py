@@ -1,15 +1,39 @@
+import os
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from .database import init_db
+from .journal import booking_journal
+from .warmup import warmup
+from .writer import WRITE_BATCH_SIZE, WRITE_MAX_WAIT, group_writer
 from .routers.auth_router import router as auth_router
 from .routers.doctor_router import router as doctor_router
 from .routers.appointment_router import router as appointment_router
+from .routers.analytics_router import router as analytics_router
 from .template import router as frontend_router
 
+# Set APP_WARMUP=1 to prime the pool, compiled SQL, validators and crypto
+# before the app starts accepting requests.
+WARMUP_ON_STARTUP = os.environ.get("APP_WARMUP") == "1"
+
+# Set APP_GROUP_COMMIT=1 to commit bookings, cancellations and new slots in
+# batches through a single writer (see writer.py).
+GROUP_COMMIT = os.environ.get("APP_GROUP_COMMIT") == "1"
+# Largest batch, and how long (in milliseconds) the writer waits for one to fill.
+GROUP_COMMIT_BATCH_SIZE = max(int(os.environ.get("APP_WRITE_BATCH_SIZE", WRITE_BATCH_SIZE)), 1)
+GROUP_COMMIT_MAX_WAIT = max(float(os.environ.get("APP_WRITE_MAX_WAIT_MS", WRITE_MAX_WAIT * 1000)), 0.0) / 1000
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    if WARMUP_ON_STARTUP:
+        warmup()
+    if GROUP_COMMIT:
+        group_writer.batch_size = GROUP_COMMIT_BATCH_SIZE
+        group_writer.max_wait = GROUP_COMMIT_MAX_WAIT
+        await group_writer.start()
     yield
+    await group_writer.stop()
+    booking_journal.close()
 
 
 app = FastAPI(title="Virtual Doctor Appointment", lifespan=lifespan)
@@ -18,6 +42,7 @@ app.include_router(frontend_router)
 app.include_router(auth_router)
 app.include_router(doctor_router)
 app.include_router(appointment_router)
+app.include_router(analytics_router)
 
 @app.get("/api")
 def root():
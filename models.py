@@ -1,7 +1,70 @@
-from typing import Optional, List
+from functools import lru_cache
+from typing import Any, Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import CheckConstraint, DateTime, Index, Integer, event, inspect
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime, timezone
 
+
+def as_utc(value: datetime) -> datetime:
+    """Naive datetimes are taken to be UTC already; aware ones are converted."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def slot_time(value: datetime) -> datetime:
+    """A slot boundary in UTC, to the whole second its epoch column can hold."""
+    return as_utc(value).replace(microsecond=0)
+
+
+def epoch_seconds(value: datetime) -> int:
+    return int(as_utc(value).timestamp())
+
+
+@lru_cache(maxsize=1 << 16)
+def from_epoch(seconds: int) -> datetime:
+    # Slot times sit on a coarse grid, so the same few thousand values are
+    # decoded over and over; datetimes are immutable and safe to share.
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+class EpochUTC(TypeDecorator):
+    """UTC epoch seconds read back as timezone-aware datetimes.
+
+    Read models select Slot.start_ts and end_ts through this type rather than
+    the DateTime columns: decoding an integer is cheaper than parsing the
+    stored string and attaching a timezone to it.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[datetime], dialect: Any) -> Optional[int]:
+        return None if value is None else epoch_seconds(value)
+
+    def result_processor(self, dialect: Any, coltype: Any) -> Any:
+        # Skips the per-value process_result_value indirection
+        def process(value: Optional[int]) -> Optional[datetime]:
+            return None if value is None else from_epoch(value)
+        return process
+
+
+class UTCDateTime(TypeDecorator):
+    """DateTime stored as naive UTC and loaded back timezone-aware.
+
+    SQLite has no timezone support, so whatever offset a value arrives with is
+    folded into UTC on the way in rather than dropped.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[datetime], dialect: Any) -> Optional[datetime]:
+        return None if value is None else as_utc(value).replace(tzinfo=None)
+
+    def process_result_value(self, value: Optional[datetime], dialect: Any) -> Optional[datetime]:
+        return None if value is None else value.replace(tzinfo=timezone.utc)
+
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     email: str = Field(index=True, unique=True)
@@ -25,24 +88,134 @@ class DoctorProfile(SQLModel, table=True):
 
 
 class Slot(SQLModel, table=True):
+    __table_args__ = (Index("ix_slot_doctor_id_start_ts", "doctor_id", "start_ts"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     doctor_id: int = Field(foreign_key="doctorprofile.id")
-    start_time: datetime
-    end_time: Optional[datetime] = None
+    start_time: datetime = Field(sa_type=UTCDateTime)
+    end_time: Optional[datetime] = Field(default=None, sa_type=UTCDateTime)
     is_booked: bool = Field(default=False)
+    # Seats offered and taken; group sessions have capacity > 1. is_booked
+    # means no seat is left and is kept in step by seats.py.
+    capacity: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+    booked_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # start_time and end_time as UTC epoch seconds, kept in sync on flush.
+    # Range, sort and cancel-window queries run against these integers.
+    start_ts: Optional[int] = Field(default=None, index=True)
+    end_ts: Optional[int] = None
 
     doctor: Optional[DoctorProfile] = Relationship(back_populates="slots")
     appointments: List["Appointment"] = Relationship(back_populates="slot")
 
+    @property
+    def seats_left(self) -> int:
+        return self.capacity - self.booked_count
+
+
+def _sync_slot_epochs(slot: Slot) -> None:
+    # Whole seconds in both, so the datetime and epoch columns always agree
+    slot.start_time = slot_time(slot.start_time)
+    slot.end_time = slot_time(slot.end_time) if slot.end_time else None
+    slot.start_ts = epoch_seconds(slot.start_time)
+    slot.end_ts = epoch_seconds(slot.end_time) if slot.end_time else None
+
+
+@event.listens_for(Slot, "before_insert")
+def _slot_inserted(mapper: Any, connection: Any, slot: Slot) -> None:
+    _sync_slot_epochs(slot)
+
+
+@event.listens_for(Slot, "before_update")
+def _slot_updated(mapper: Any, connection: Any, slot: Slot) -> None:
+    # Most updates only flip is_booked; leave the epoch columns alone then
+    attrs = inspect(slot).attrs
+    if attrs.start_time.history.has_changes() or attrs.end_time.history.has_changes():
+        _sync_slot_epochs(slot)
+
 
 class Appointment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    doctor_id: int = Field(foreign_key="doctorprofile.id")
-    patient_id: int = Field(foreign_key="user.id")
-    slot_id: Optional[int] = Field(foreign_key="slot.id")
+    doctor_id: int = Field(foreign_key="doctorprofile.id", index=True)
+    patient_id: int = Field(foreign_key="user.id", index=True)
+    slot_id: Optional[int] = Field(foreign_key="slot.id", index=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     reason: Optional[str] = None
+    # Last moment (UTC epoch seconds) the patient may cancel, fixed by the
+    # doctor's cancellation policy when the appointment is booked (policies.py)
+    cancellable_until_ts: Optional[int] = Field(default=None, index=True)
 
     doctor: Optional[DoctorProfile] = Relationship(back_populates="appointments")
     patient: Optional[User] = Relationship(back_populates="appointments_as_patient")
-    slot: Optional[Slot] = Relationship(back_populates="appointments")
\ No newline at end of file
+    slot: Optional[Slot] = Relationship(back_populates="appointments")
+
+    @property
+    def cancellable_until(self) -> Optional[datetime]:
+        return None if self.cancellable_until_ts is None else from_epoch(self.cancellable_until_ts)
+
+
+class CacheVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
+
+
+class WaitlistEntry(SQLModel, table=True):
+    __table_args__ = (Index("ix_waitlistentry_doctor_id_window_start", "doctor_id", "window_start"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    doctor_id: int = Field(foreign_key="doctorprofile.id")
+    patient_id: int = Field(foreign_key="user.id", index=True)
+    window_start: datetime = Field(sa_type=UTCDateTime)
+    window_end: datetime = Field(sa_type=UTCDateTime)
+    reason: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class WaitlistMatch(SQLModel, table=True):
+    # One row per slot an entry would accept. The (slot_id, entry_id) primary
+    # key doubles as the index that finds the earliest waiting entry for a slot.
+    slot_id: int = Field(foreign_key="slot.id", primary_key=True)
+    entry_id: int = Field(foreign_key="waitlistentry.id", primary_key=True, index=True)
+
+
+class DoctorAvailability(SQLModel, table=True):
+    # Denormalized per-doctor summary over [window_start, window_end),
+    # maintained by availability.py.
+    doctor_id: int = Field(foreign_key="doctorprofile.id", primary_key=True)
+    free_slots: int = Field(default=0, index=True)
+    booked_slots: int = 0
+    next_free_start: Optional[datetime] = Field(default=None, index=True, sa_type=UTCDateTime)
+    window_start: datetime = Field(sa_type=UTCDateTime)
+    window_end: datetime = Field(sa_type=UTCDateTime)
+    stale_at: datetime = Field(index=True, sa_type=UTCDateTime)
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    # key is a hash of the caller's credentials and their Idempotency-Key;
+    # status_code stays NULL while the first request is still running.
+    key: str = Field(primary_key=True)
+    fingerprint: str
+    status_code: Optional[int] = None
+    media_type: Optional[str] = None
+    body: Optional[bytes] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime = Field(index=True)
+
+
+class CancellationPolicy(SQLModel, table=True):
+    # Applies to one doctor or to every doctor of a specialization; doctor
+    # rules win over specialization rules.
+    __table_args__ = (
+        CheckConstraint("(doctor_id IS NULL) != (specialization IS NULL)", name="ck_cancellationpolicy_scope"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    doctor_id: Optional[int] = Field(default=None, foreign_key="doctorprofile.id", unique=True)
+    specialization: Optional[str] = Field(default=None, unique=True)
+    notice_minutes: int
+
+
+class RevokedToken(SQLModel, table=True):
+    # jti of a logged-out access token or a used refresh token. Rows are
+    # pruned once the token would have expired anyway.
+    jti: str = Field(primary_key=True)
+    expires_at: datetime = Field(index=True, sa_type=UTCDateTime)
@@ -0,0 +1,246 @@
+"""Cancellation policies.
+
+A patient may cancel an appointment up to a notice period before it starts.
+The notice comes from the doctor's own CancellationPolicy row if there is one,
+else from the row for the doctor's specialization, else from
+DEFAULT_CANCELLATION_NOTICE.
+
+When an appointment is inserted its deadline is written into the indexed
+Appointment.cancellable_until_ts column (slot start minus notice), so the
+dashboards and both cancel paths decide with a plain comparison in the query
+they already run. Changing a policy recomputes the deadlines of the affected
+upcoming appointments in one UPDATE, but only ever moves them later: a patient
+who booked under a shorter notice keeps the deadline they were promised, while
+a shorter notice applies at once. Appointments that have already started keep
+theirs.
+
+Resolved notices are cached per process and keyed on the POLICIES and DOCTORS
+data versions, so a change made by any process is picked up within
+VERSION_POLL_INTERVAL.
+
+    python -m doctor_appointment.policies list
+    python -m doctor_appointment.policies set --specialization Cardiology --minutes 1440
+    python -m doctor_appointment.policies clear --doctor 3
+"""
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal, NamedTuple, Optional
+from sqlalchemy import Connection, Engine, delete, event, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+from .models import Appointment, CancellationPolicy, DoctorProfile, Slot, epoch_seconds
+from .sharding import ShardedSession, fan_out, open_session, shards
+from .versions import APPOINTMENTS, DOCTORS, POLICIES, VersionWatcher, bump_versions, data_versions
+
+DEFAULT_CANCELLATION_NOTICE = timedelta(hours=10)
+MAX_CANCELLATION_NOTICE = timedelta(days=30)
+
+_DEFAULT_NOTICE_MINUTES = int(DEFAULT_CANCELLATION_NOTICE.total_seconds() // 60)
+
+
+class ResolvedPolicy(NamedTuple):
+    notice_minutes: int
+    source: Literal["doctor", "specialization", "default"]
+
+    @property
+    def notice(self) -> timedelta:
+        return timedelta(minutes=self.notice_minutes)
+
+
+def _doctor_rule(doctor_id: Any) -> Any:
+    return select(CancellationPolicy.notice_minutes).where(CancellationPolicy.doctor_id == doctor_id).scalar_subquery()
+
+
+def _specialization_rule(doctor_id: Any) -> Any:
+    return (
+        select(CancellationPolicy.notice_minutes)
+        .join(DoctorProfile, DoctorProfile.specialization == CancellationPolicy.specialization)
+        .where(DoctorProfile.id == doctor_id)
+        .scalar_subquery()
+    )
+
+
+def notice_minutes_expr(doctor_id: Any) -> Any:
+    """SQL expression for a doctor's notice in minutes; doctor_id may be a column."""
+    return func.coalesce(_doctor_rule(doctor_id), _specialization_rule(doctor_id), _DEFAULT_NOTICE_MINUTES)
+
+
+def resolve_policy(conn: Connection, doctor_id: int) -> ResolvedPolicy:
+    """Look a doctor's policy up in the database, bypassing the cache."""
+    doctor_minutes, specialization_minutes = conn.execute(
+        select(_doctor_rule(doctor_id), _specialization_rule(doctor_id))
+    ).one()
+    if doctor_minutes is not None:
+        return ResolvedPolicy(doctor_minutes, "doctor")
+    if specialization_minutes is not None:
+        return ResolvedPolicy(specialization_minutes, "specialization")
+    return ResolvedPolicy(_DEFAULT_NOTICE_MINUTES, "default")
+
+
+class PolicyCache:
+    """Per-process cache of resolved policies, one generation per database."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watchers: dict[Engine, VersionWatcher] = {bind: data_versions for bind in shards.all_engines()}
+        self._generations: dict[Engine, tuple[tuple[int, int], dict[int, ResolvedPolicy]]] = {}
+
+    def _entries(self, bind: Engine) -> dict[int, ResolvedPolicy]:
+        with self._lock:
+            watcher = self._watchers.get(bind)
+            if watcher is None:
+                watcher = self._watchers[bind] = VersionWatcher(bind)
+        versions = watcher.snapshot()
+        key = (versions.get(POLICIES, 0), versions.get(DOCTORS, 0))
+        with self._lock:
+            generation = self._generations.get(bind)
+            if generation is None or generation[0] != key:
+                generation = self._generations[bind] = (key, {})
+            return generation[1]
+
+    def get(self, conn: Connection | Session, doctor_id: int) -> ResolvedPolicy:
+        if isinstance(conn, Session):
+            conn = conn.connection()
+        entries = self._entries(conn.engine)
+        policy = entries.get(doctor_id)
+        if policy is None:
+            policy = entries[doctor_id] = resolve_policy(conn, doctor_id)
+        return policy
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generations.clear()
+
+
+policy_cache = PolicyCache()
+
+
+def can_cancel(appt: Appointment, now: Optional[datetime] = None) -> bool:
+    """Whether the patient may still cancel. Appointments without a slot have no deadline."""
+    if appt.cancellable_until_ts is None:
+        return True
+    return epoch_seconds(now or datetime.now(timezone.utc)) < appt.cancellable_until_ts
+
+
+def _recompute_deadlines(session: Session, doctors: Any, now: datetime) -> int:
+    """Loosen the deadlines of the upcoming appointments of doctors (a select of ids) to the current rules.
+
+    A longer notice applies to new bookings only; existing deadlines never move earlier.
+    """
+    upcoming = select(Slot.id).where(Slot.doctor_id.in_(doctors), Slot.start_ts > epoch_seconds(now))
+    start_ts = select(Slot.start_ts).where(Slot.id == Appointment.slot_id).scalar_subquery()
+    deadline = start_ts - notice_minutes_expr(Appointment.doctor_id) * 60
+    stmt = (
+        update(Appointment)
+        .where(
+            Appointment.doctor_id.in_(doctors),
+            Appointment.slot_id.in_(upcoming),
+            Appointment.cancellable_until_ts < deadline,
+        )
+        .values(cancellable_until_ts=deadline)
+    )
+    return session.exec(stmt).rowcount
+
+
+def _reevaluate(session: Session, doctors: Any) -> int:
+    """Recompute deadlines after a rule change in the session and commit."""
+    now = datetime.now(timezone.utc)
+    if not isinstance(session, ShardedSession):
+        changed = _recompute_deadlines(session, doctors, now)
+        bump_versions(session, POLICIES, APPOINTMENTS)
+        session.commit()
+        return changed
+
+    # Shards read the rules through their attached global file, so the rule
+    # commits first and each shard then recomputes in its own transaction
+    bump_versions(session, POLICIES)
+    session.commit()
+
+    def recompute(shard_session: Session) -> list[int]:
+        changed = _recompute_deadlines(shard_session, doctors, now)
+        bump_versions(shard_session, APPOINTMENTS)
+        shard_session.commit()
+        return [changed]
+
+    return sum(fan_out(session, recompute))
+
+
+def _scope(doctor_id: Optional[int], specialization: Optional[str]) -> tuple[Any, Any]:
+    if (doctor_id is None) == (specialization is None):
+        raise ValueError("A policy applies to exactly one doctor or one specialization")
+    if doctor_id is not None:
+        return CancellationPolicy.doctor_id == doctor_id, select(DoctorProfile.id).where(DoctorProfile.id == doctor_id)
+    return (
+        CancellationPolicy.specialization == specialization,
+        select(DoctorProfile.id).where(DoctorProfile.specialization == specialization),
+    )
+
+
+def set_policy(
+    session: Session,
+    notice: timedelta,
+    doctor_id: Optional[int] = None,
+    specialization: Optional[str] = None,
+) -> int:
+    """Create or replace a rule and commit. Returns how many appointments got a later deadline."""
+    if notice < timedelta(0) or notice > MAX_CANCELLATION_NOTICE:
+        raise ValueError(f"Notice must be between 0 and {MAX_CANCELLATION_NOTICE.days} days")
+    _, doctors = _scope(doctor_id, specialization)
+    minutes = int(notice.total_seconds() // 60)
+    conflict = [CancellationPolicy.doctor_id] if doctor_id is not None else [CancellationPolicy.specialization]
+    stmt = insert(CancellationPolicy).values(doctor_id=doctor_id, specialization=specialization, notice_minutes=minutes)
+    session.exec(stmt.on_conflict_do_update(index_elements=conflict, set_={"notice_minutes": minutes}))
+    return _reevaluate(session, doctors)
+
+
+def clear_policy(session: Session, doctor_id: Optional[int] = None, specialization: Optional[str] = None) -> int:
+    """Remove a rule and commit. Returns how many appointments got a later deadline."""
+    match, doctors = _scope(doctor_id, specialization)
+    session.exec(delete(CancellationPolicy).where(match))
+    return _reevaluate(session, doctors)
+
+
+@event.listens_for(Appointment, "before_insert")
+def _stamp_deadline(mapper, connection: Connection, appt: Appointment) -> None:
+    if appt.slot_id is None or appt.cancellable_until_ts is not None:
+        return
+    notice = policy_cache.get(connection, appt.doctor_id).notice_minutes * 60
+    # Rendered into the INSERT itself, so the slot's start costs no extra round trip
+    appt.cancellable_until_ts = (  # type: ignore[assignment]
+        select(Slot.start_ts - notice).where(Slot.id == appt.slot_id).scalar_subquery()
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    from .database import init_db
+
+    parser = argparse.ArgumentParser(description="Manage cancellation policies")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show every rule")
+    for name in ("set", "clear"):
+        command = commands.add_parser(name)
+        scope = command.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--doctor", type=int, help="doctor profile id")
+        scope.add_argument("--specialization")
+        if name == "set":
+            command.add_argument("--minutes", type=int, required=True, help="notice required before the start")
+    args = parser.parse_args(argv)
+
+    init_db()
+    with open_session() as session:
+        if args.command == "list":
+            print(f"default: {_DEFAULT_NOTICE_MINUTES} minutes")
+            for policy in session.exec(select(CancellationPolicy).order_by(CancellationPolicy.id)).all():
+                scope = f"doctor {policy.doctor_id}" if policy.doctor_id is not None else policy.specialization
+                print(f"{scope}: {policy.notice_minutes} minutes")
+            return
+        if args.command == "set":
+            changed = set_policy(session, timedelta(minutes=args.minutes), args.doctor, args.specialization)
+        else:
+            changed = clear_policy(session, args.doctor, args.specialization)
+        print(f"{changed} upcoming appointments got a later deadline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+from fastapi import HTTPException, Request, status
+
+# Every credential request pays for a full bcrypt round, so these are kept tight.
+# Set APP_CREDENTIAL_IP_PER_MINUTE / APP_CREDENTIAL_EMAIL_PER_MINUTE to change
+# them; a client may burst up to one minute's worth. Buckets live in each
+# process, so under serve.py with N workers a client can get up to N times
+# the configured rate.
+CREDENTIAL_IP_PER_MINUTE = int(os.environ.get("APP_CREDENTIAL_IP_PER_MINUTE", "20"))
+CREDENTIAL_EMAIL_PER_MINUTE = int(os.environ.get("APP_CREDENTIAL_EMAIL_PER_MINUTE", "5"))
+# Rates are tokens per second; bursts are bucket sizes.
+CREDENTIAL_IP_RATE = CREDENTIAL_IP_PER_MINUTE / 60
+CREDENTIAL_IP_BURST = CREDENTIAL_IP_PER_MINUTE
+CREDENTIAL_EMAIL_RATE = CREDENTIAL_EMAIL_PER_MINUTE / 60
+CREDENTIAL_EMAIL_BURST = CREDENTIAL_EMAIL_PER_MINUTE
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("APP_RATE_LIMIT_MAX_KEYS", "10000"))
+
+
+class RateLimiter:
+    """Token buckets per key, kept in a bounded LRU.
+
+    When more than max_keys keys are tracked the least recently seen bucket is
+    evicted. An evicted key simply starts again with a full bucket.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+
+    def hit(self, key: Hashable) -> float:
+        """Take one token for key. Returns 0 if allowed, else seconds until retry."""
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = float(self.burst)
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens, updated = bucket
+                tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+                self._buckets.move_to_end(key)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+credential_ip_limiter = RateLimiter(CREDENTIAL_IP_RATE, CREDENTIAL_IP_BURST)
+credential_email_limiter = RateLimiter(CREDENTIAL_EMAIL_RATE, CREDENTIAL_EMAIL_BURST)
+
+
+def credential_retry_after(request: Request, email: str) -> int:
+    """Charge a credential attempt to the client IP and the email.
+
+    Returns 0 when the attempt may proceed, otherwise the Retry-After seconds.
+    The email bucket is only charged once the IP bucket lets the request through.
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    wait = credential_ip_limiter.hit(client_ip)
+    if not wait:
+        wait = credential_email_limiter.hit(email.strip().lower())
+    return math.ceil(wait)
+
+
+def enforce_credential_limits(request: Request, email: str) -> None:
+    retry_after = credential_retry_after(request, email)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
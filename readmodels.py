@@ -0,0 +1,428 @@
+"""Read-only projections for list endpoints and dashboards.
+
+Each query selects just the columns a view needs and returns plain named tuples,
+skipping ORM identity-map bookkeeping, change tracking and relationship loading.
+The tuples can be handed straight to json_list_response() or to the HTML
+renderers in template.py.
+"""
+from datetime import date, datetime, timezone
+from typing import Any, Callable, Literal, NamedTuple, Optional
+from sqlalchemy import bindparam, case, func, type_coerce
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+from .models import User, DoctorProfile, DoctorAvailability, Slot, Appointment, WaitlistEntry, EpochUTC, epoch_seconds
+
+
+# Field order matches DoctorOut, DoctorAvailabilityOut, SlotOut, AppointmentOut and WaitlistOut in schemas.py
+class DoctorRow(NamedTuple):
+    id: int
+    user_id: int
+    specialization: str
+    bio: Optional[str]
+
+
+class DoctorAvailabilityRow(NamedTuple):
+    id: int
+    user_id: int
+    specialization: str
+    bio: Optional[str]
+    free_slots: Optional[int]
+    booked_slots: Optional[int]
+    next_free_start: Optional[datetime]
+
+
+class SlotRow(NamedTuple):
+    id: int
+    start_time: datetime
+    end_time: Optional[datetime]
+    is_booked: bool
+    capacity: int
+    seats_left: int
+
+
+class AppointmentRow(NamedTuple):
+    id: int
+    doctor_id: int
+    patient_id: int
+    slot_id: Optional[int]
+    created_at: datetime
+    reason: Optional[str]
+    cancellable_until: Optional[datetime]
+
+
+class WaitlistRow(NamedTuple):
+    id: int
+    doctor_id: int
+    window_start: datetime
+    window_end: datetime
+    reason: Optional[str]
+    created_at: datetime
+
+
+class DoctorCard(NamedTuple):
+    id: int
+    specialization: str
+    full_name: Optional[str]
+
+
+class PatientAppointmentCard(NamedTuple):
+    id: int
+    reason: Optional[str]
+    doctor_name: Optional[str]
+    specialization: Optional[str]
+    start_time: Optional[datetime]
+    cancellable_until: Optional[datetime]
+    # Seconds from the query's "now" until cancellable_until, computed in SQL
+    seconds_to_deadline: Optional[int]
+
+
+class DoctorAppointmentCard(NamedTuple):
+    id: int
+    reason: Optional[str]
+    patient_id: int
+    patient_name: Optional[str]
+    patient_email: Optional[str]
+    start_time: Optional[datetime]
+
+
+class PatientCard(NamedTuple):
+    id: int
+    full_name: Optional[str]
+    email: str
+
+
+class ReminderRow(NamedTuple):
+    appointment_id: int
+    start_time: datetime
+    patient_email: str
+    patient_name: Optional[str]
+    doctor_name: Optional[str]
+    booked_at: datetime
+
+
+class CalendarBucket(NamedTuple):
+    period_start: date
+    total: int
+    booked: int
+    free: int
+    first_start: Optional[datetime]
+    last_end: Optional[datetime]
+
+
+def _columns(model: Any, row_type: Any) -> list[Any]:
+    return [getattr(model, name) for name in row_type._fields]
+
+
+def _rows(session: Session, row_type: Any, stmt: Any) -> list[Any]:
+    return list(map(row_type._make, session.exec(stmt)))
+
+
+def _utc(epoch_col: Any) -> Any:
+    """Select an epoch-seconds expression as an aware UTC datetime."""
+    return type_coerce(epoch_col, EpochUTC)
+
+
+# Keyset pagination cursor: (start_time, id) of the last row already shown
+Cursor = tuple[datetime, int]
+
+
+def _keyset(stmt: Any, id_col: Any, cursor: Cursor, descending: bool) -> Any:
+    """Continue a listing ordered by slot start strictly after cursor.
+
+    Written as a range on Slot.start_ts plus a tie-break on id_col (rather
+    than a row-value comparison) so SQLite can seek the start_ts index directly.
+    """
+    at, last_id = epoch_seconds(cursor[0]), cursor[1]
+    if descending:
+        stmt = stmt.where(Slot.start_ts <= at, (Slot.start_ts < at) | (id_col < last_id))
+        return stmt.order_by(Slot.start_ts.desc(), id_col.desc())
+    stmt = stmt.where(Slot.start_ts >= at, (Slot.start_ts > at) | (id_col > last_id))
+    return stmt.order_by(Slot.start_ts, id_col)
+
+
+def _starts_between(start: datetime, end: datetime) -> Any:
+    return (Slot.start_ts >= epoch_seconds(start)) & (Slot.start_ts < epoch_seconds(end))
+
+
+_SLOT_COLUMNS = (
+    Slot.id, _utc(Slot.start_ts), _utc(Slot.end_ts), Slot.is_booked, Slot.capacity, Slot.capacity - Slot.booked_count,
+)
+_APPOINTMENT_COLUMNS = (
+    Appointment.id, Appointment.doctor_id, Appointment.patient_id, Appointment.slot_id,
+    Appointment.created_at, Appointment.reason, _utc(Appointment.cancellable_until_ts),
+)
+_DOCTOR_CARD_COLUMNS = (DoctorProfile.id, DoctorProfile.specialization, User.full_name)
+
+
+def doctor_rows(session: Session, specialization: str | None = None) -> list[DoctorRow]:
+    stmt = select(*_columns(DoctorProfile, DoctorRow))
+    if specialization:
+        stmt = stmt.where(DoctorProfile.specialization == specialization)
+    return _rows(session, DoctorRow, stmt)
+
+
+def doctor_availability_rows(
+    session: Session,
+    specialization: str | None = None,
+    sort: Literal["id", "next_free", "free_slots"] = "id",
+) -> list[DoctorAvailabilityRow]:
+    stmt = (
+        select(
+            *_columns(DoctorProfile, DoctorRow),
+            DoctorAvailability.free_slots,
+            DoctorAvailability.booked_slots,
+            DoctorAvailability.next_free_start,
+        )
+        .outerjoin(DoctorAvailability, DoctorAvailability.doctor_id == DoctorProfile.id)
+    )
+    if specialization:
+        stmt = stmt.where(DoctorProfile.specialization == specialization)
+    if sort == "next_free":
+        stmt = stmt.order_by(DoctorAvailability.next_free_start.is_(None), DoctorAvailability.next_free_start, DoctorProfile.id)
+    elif sort == "free_slots":
+        stmt = stmt.order_by(func.coalesce(DoctorAvailability.free_slots, 0).desc(), DoctorProfile.id)
+    else:
+        stmt = stmt.order_by(DoctorProfile.id)
+    return _rows(session, DoctorAvailabilityRow, stmt)
+
+
+_NEVER = datetime.max.replace(tzinfo=timezone.utc)
+
+# Python sort keys equal to the ORDER BY clauses above, for merging listings
+DOCTOR_AVAILABILITY_ORDER: dict[str, Callable[[DoctorAvailabilityRow], Any]] = {
+    "id": lambda row: row.id,
+    "next_free": lambda row: (row.next_free_start is None, row.next_free_start or _NEVER, row.id),
+    "free_slots": lambda row: (-(row.free_slots or 0), row.id),
+}
+
+
+def slot_rows(session: Session, doctor_id: int, only_available: bool = False) -> list[SlotRow]:
+    stmt = select(*_SLOT_COLUMNS).where(Slot.doctor_id == doctor_id)
+    if only_available:
+        stmt = stmt.where(Slot.is_booked == False)
+    return _rows(session, SlotRow, stmt.order_by(Slot.start_ts, Slot.id))
+
+
+def slot_window(session: Session, doctor_id: int, start: datetime, end: datetime) -> list[SlotRow]:
+    """Slots starting in [start, end), earliest first."""
+    stmt = (
+        select(*_SLOT_COLUMNS)
+        .where(Slot.doctor_id == doctor_id, _starts_between(start, end))
+        .order_by(Slot.start_ts, Slot.id)
+    )
+    return _rows(session, SlotRow, stmt)
+
+
+def slot_page(session: Session, doctor_id: int, cursor: Cursor, limit: int, descending: bool = False) -> list[SlotRow]:
+    stmt = select(*_SLOT_COLUMNS).where(Slot.doctor_id == doctor_id)
+    stmt = _keyset(stmt, Slot.id, cursor, descending)
+    return _rows(session, SlotRow, stmt.limit(limit))
+
+
+# Built once and reused with new parameters: free_slot_page runs for every
+# candidate doctor of a recommendation request, and constructing the
+# statement would cost more than running it.
+_FREE_SLOT_PAGE = (
+    select(*_SLOT_COLUMNS)
+    .where(
+        Slot.doctor_id == bindparam("doctor_id"),
+        Slot.is_booked == False,
+        Slot.start_ts >= bindparam("after_ts"),
+        (Slot.start_ts > bindparam("after_ts")) | (Slot.id > bindparam("after_id")),
+        Slot.start_ts < bindparam("end_ts"),
+    )
+    .order_by(Slot.start_ts, Slot.id)
+    .limit(bindparam("limit"))
+)
+
+
+def free_slot_page(session: Session, doctor_id: int, cursor: Cursor, end: datetime, limit: int) -> list[SlotRow]:
+    """Up to limit free slots after cursor that start before end, earliest first."""
+    params = {
+        "doctor_id": doctor_id, "after_ts": epoch_seconds(cursor[0]), "after_id": cursor[1],
+        "end_ts": epoch_seconds(end), "limit": limit,
+    }
+    return list(map(SlotRow._make, session.exec(_FREE_SLOT_PAGE, params=params)))
+
+
+def appointment_rows(
+    session: Session,
+    patient_id: int | None = None,
+    doctor_id: int | None = None,
+    cancellable_at: datetime | None = None,
+) -> list[AppointmentRow]:
+    """Appointments, optionally only those the patient may still cancel at cancellable_at."""
+    stmt = select(*_APPOINTMENT_COLUMNS)
+    if patient_id is not None:
+        stmt = stmt.where(Appointment.patient_id == patient_id)
+    if doctor_id is not None:
+        stmt = stmt.where(Appointment.doctor_id == doctor_id)
+    if cancellable_at is not None:
+        stmt = stmt.where(Appointment.cancellable_until_ts > epoch_seconds(cancellable_at))
+    return _rows(session, AppointmentRow, stmt)
+
+
+def waitlist_rows(session: Session, patient_id: int) -> list[WaitlistRow]:
+    stmt = (
+        select(*_columns(WaitlistEntry, WaitlistRow))
+        .where(WaitlistEntry.patient_id == patient_id)
+        .order_by(WaitlistEntry.window_start)
+    )
+    return _rows(session, WaitlistRow, stmt)
+
+
+def doctor_profile_id(session: Session, user_id: int) -> Optional[int]:
+    return session.exec(select(DoctorProfile.id).where(DoctorProfile.user_id == user_id)).first()
+
+
+def doctor_cards(session: Session) -> list[DoctorCard]:
+    stmt = select(*_DOCTOR_CARD_COLUMNS).outerjoin(User, User.id == DoctorProfile.user_id)
+    return _rows(session, DoctorCard, stmt)
+
+
+def doctor_card(session: Session, doctor_id: int) -> Optional[DoctorCard]:
+    stmt = (
+        select(*_DOCTOR_CARD_COLUMNS)
+        .outerjoin(User, User.id == DoctorProfile.user_id)
+        .where(DoctorProfile.id == doctor_id)
+    )
+    row = session.exec(stmt).first()
+    return DoctorCard._make(row) if row else None
+
+
+def doctor_card_for_user(session: Session, user_id: int) -> Optional[DoctorCard]:
+    stmt = (
+        select(*_DOCTOR_CARD_COLUMNS)
+        .join(User, User.id == DoctorProfile.user_id)
+        .where(DoctorProfile.user_id == user_id)
+    )
+    row = session.exec(stmt).first()
+    return DoctorCard._make(row) if row else None
+
+
+def patient_appointment_cards(session: Session, patient_id: int, now: datetime) -> list[PatientAppointmentCard]:
+    stmt = (
+        select(
+            Appointment.id, Appointment.reason, User.full_name, DoctorProfile.specialization, _utc(Slot.start_ts),
+            _utc(Appointment.cancellable_until_ts), Appointment.cancellable_until_ts - epoch_seconds(now),
+        )
+        .outerjoin(DoctorProfile, DoctorProfile.id == Appointment.doctor_id)
+        .outerjoin(User, User.id == DoctorProfile.user_id)
+        .outerjoin(Slot, Slot.id == Appointment.slot_id)
+        .where(Appointment.patient_id == patient_id)
+    )
+    return _rows(session, PatientAppointmentCard, stmt)
+
+
+def _doctor_appointment_select(doctor_id: int) -> Any:
+    return (
+        select(Appointment.id, Appointment.reason, Appointment.patient_id, User.full_name, User.email, _utc(Slot.start_ts))
+        .outerjoin(User, User.id == Appointment.patient_id)
+        .outerjoin(Slot, Slot.id == Appointment.slot_id)
+        .where(Appointment.doctor_id == doctor_id)
+    )
+
+
+def doctor_appointment_cards(session: Session, doctor_id: int) -> list[DoctorAppointmentCard]:
+    return _rows(session, DoctorAppointmentCard, _doctor_appointment_select(doctor_id))
+
+
+def doctor_appointment_window(session: Session, doctor_id: int, start: datetime, end: datetime) -> list[DoctorAppointmentCard]:
+    """Appointments whose slot starts in [start, end), soonest first."""
+    stmt = (
+        _doctor_appointment_select(doctor_id)
+        .where(_starts_between(start, end))
+        .order_by(Slot.start_ts, Appointment.id)
+    )
+    return _rows(session, DoctorAppointmentCard, stmt)
+
+
+def doctor_appointment_page(
+    session: Session,
+    doctor_id: int,
+    cursor: Cursor,
+    limit: int,
+    descending: bool = True,
+) -> list[DoctorAppointmentCard]:
+    stmt = _keyset(_doctor_appointment_select(doctor_id), Appointment.id, cursor, descending)
+    return _rows(session, DoctorAppointmentCard, stmt.limit(limit))
+
+
+def doctor_patient_page(session: Session, doctor_id: int, after_id: int, limit: int) -> list[PatientCard]:
+    """Distinct patients who booked with the doctor, in id order after after_id."""
+    patient_ids = select(Appointment.patient_id).where(Appointment.doctor_id == doctor_id)
+    stmt = (
+        select(User.id, User.full_name, User.email)
+        .where(User.id.in_(patient_ids), User.id > after_id)
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return _rows(session, PatientCard, stmt)
+
+
+def slot_counts(session: Session, doctor_id: int) -> tuple[int, int]:
+    """(available, booked) slot totals for a doctor, counted in SQL."""
+    stmt = select(Slot.is_booked, func.count()).where(Slot.doctor_id == doctor_id).group_by(Slot.is_booked)
+    counts = {bool(is_booked): count for is_booked, count in session.exec(stmt)}
+    return counts.get(False, 0), counts.get(True, 0)
+
+
+def calendar_buckets(
+    session: Session,
+    doctor_id: int,
+    start: datetime,
+    end: datetime,
+    granularity: Literal["day", "week"] = "day",
+) -> list[CalendarBucket]:
+    """Per-day or per-week slot aggregates for slots starting in [start, end).
+
+    Grouping happens in SQLite over the (doctor_id, start_ts) index, so the
+    cost follows the size of the range rather than the doctor's history. Days
+    are UTC days and weeks start on Monday.
+    """
+    if granularity == "week":
+        period = func.date(Slot.start_ts, "unixepoch", "-6 days", "weekday 1")
+    else:
+        period = func.date(Slot.start_ts, "unixepoch")
+    booked = func.sum(case((Slot.is_booked == True, 1), else_=0))
+    stmt = (
+        select(
+            period,
+            func.count(),
+            booked,
+            _utc(func.min(Slot.start_ts)),
+            _utc(func.max(func.coalesce(Slot.end_ts, Slot.start_ts))),
+        )
+        .where(Slot.doctor_id == doctor_id, _starts_between(start, end))
+        .group_by(period)
+        .order_by(period)
+    )
+    return [
+        CalendarBucket(date.fromisoformat(day), total, booked_count or 0, total - (booked_count or 0), first, last)
+        for day, total, booked_count, first, last in session.exec(stmt)
+    ]
+
+
+def _reminder_select() -> Any:
+    patient = aliased(User)
+    doctor_user = aliased(User)
+    return (
+        select(
+            Appointment.id, _utc(Slot.start_ts), patient.email, patient.full_name, doctor_user.full_name,
+            Appointment.created_at,
+        )
+        .join(Appointment, Appointment.slot_id == Slot.id)
+        .join(patient, patient.id == Appointment.patient_id)
+        .outerjoin(DoctorProfile, DoctorProfile.id == Appointment.doctor_id)
+        .outerjoin(doctor_user, doctor_user.id == DoctorProfile.user_id)
+    )
+
+
+def reminder_rows_between(session: Session, start: datetime, end: datetime) -> list[ReminderRow]:
+    """Booked appointments whose slot starts in [start, end), via the start_ts index."""
+    stmt = _reminder_select().where(_starts_between(start, end))
+    return _rows(session, ReminderRow, stmt)
+
+
+def reminder_rows_for(session: Session, appointment_ids: list[int]) -> list[ReminderRow]:
+    return _rows(session, ReminderRow, _reminder_select().where(Appointment.id.in_(appointment_ids)))
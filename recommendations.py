@@ -0,0 +1,139 @@
+"""Slot recommendations across many doctors.
+
+recommend() ranks free slots by
+
+    score = weights.soonness * hours until the slot starts
+          + weights.preference * penalty_hours of the best window it falls in
+
+and returns the limit lowest scores. Slots outside every preference window
+are skipped; with no windows every slot qualifies at no penalty.
+
+Each candidate doctor's free slots are read as a stream off the
+(doctor_id, start_ts) index, a page of RECOMMEND_PAGE_ROWS at a time, and the
+streams are merged by start time with a heap. The soonness term only grows
+along the merged stream and the penalty never drops below the smallest
+window penalty, so once that lower bound can no longer beat the current
+top-K the remaining slots are never fetched. A request therefore costs about
+one small query per candidate doctor plus whatever pages the winners came
+from, not every free slot in the horizon.
+"""
+import heapq
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from operator import attrgetter
+from typing import Iterator, NamedTuple, Optional, Sequence
+from sqlmodel import Session
+from .models import as_utc, epoch_seconds
+from .readmodels import SlotRow, doctor_rows, free_slot_page
+from .schemas import PreferenceWindow, RankingWeights
+from .sharding import ShardedSession
+
+RECOMMEND_HORIZON = timedelta(days=30)
+MAX_RECOMMEND_HORIZON = timedelta(days=90)
+RECOMMEND_PAGE_ROWS = 16
+
+
+class Recommendation(NamedTuple):
+    doctor_id: int
+    specialization: str
+    slot_id: int
+    start_time: datetime
+    end_time: Optional[datetime]
+    score: float
+
+
+class _Candidate(NamedTuple):
+    start_ts: int
+    doctor_id: int
+    slot: SlotRow
+
+
+@dataclass(frozen=True)
+class _Window:
+    weekdays: frozenset[int]
+    start: int  # seconds after local midnight
+    end: int
+    penalty: float
+
+    @classmethod
+    def of(cls, window: PreferenceWindow) -> "_Window":
+        end = 86_400 if window.end is None or window.end == time(0) else _seconds(window.end)
+        return cls(frozenset(window.weekdays), _seconds(window.start), end, window.penalty_hours)
+
+
+def _seconds(value: time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _doctor_stream(session: Session, doctor_id: int, start: datetime, end: datetime) -> Iterator[_Candidate]:
+    cursor = (start, 0)
+    while True:
+        page = free_slot_page(session, doctor_id, cursor, end, RECOMMEND_PAGE_ROWS)
+        for slot in page:
+            yield _Candidate(epoch_seconds(slot.start_time), doctor_id, slot)
+        if len(page) < RECOMMEND_PAGE_ROWS:
+            return
+        cursor = (page[-1].start_time, page[-1].id)
+
+
+def recommend(
+    session: Session,
+    windows: Sequence[PreferenceWindow] = (),
+    weights: RankingWeights = RankingWeights(),
+    limit: int = 10,
+    specialization: Optional[str] = None,
+    doctor_ids: Optional[Sequence[int]] = None,
+    earliest: Optional[datetime] = None,
+    latest: Optional[datetime] = None,
+    utc_offset_minutes: int = 0,
+) -> list[Recommendation]:
+    """The limit best free slots in [earliest, latest), best first."""
+    now = datetime.now(timezone.utc)
+    start = max(as_utc(earliest), now) if earliest else now
+    end = as_utc(latest) if latest else start + RECOMMEND_HORIZON
+    doctors = {doc.id: doc.specialization for doc in doctor_rows(session, specialization)}
+    if doctor_ids is not None:
+        wanted = set(doctor_ids)
+        doctors = {doctor_id: spec for doctor_id, spec in doctors.items() if doctor_id in wanted}
+    prepared = [_Window.of(window) for window in windows] or [_Window(frozenset(range(7)), 0, 86_400, 0.0)]
+    min_penalty = weights.preference * min(window.penalty for window in prepared)
+    now_ts, offset = epoch_seconds(start), utc_offset_minutes * 60
+    per_hour = weights.soonness / 3600
+
+    with ExitStack() as stack:
+        # Sharded: one session per shard, each pinned to it
+        shard_sessions: dict[int, Session] = {}
+
+        def session_for(doctor_id: int) -> Session:
+            if not isinstance(session, ShardedSession):
+                return session
+            index = session.shards.shard_for(doctor_id)
+            if index not in shard_sessions:
+                shard_sessions[index] = stack.enter_context(session.shards.session(index))
+            return shard_sessions[index]
+
+        streams = [_doctor_stream(session_for(doctor_id), doctor_id, start, end) for doctor_id in sorted(doctors)]
+        # Max-heap on (score, start, slot id) holding the best `limit` so far
+        best: list[tuple[float, int, int, _Candidate]] = []
+        for candidate in heapq.merge(*streams, key=attrgetter("start_ts")):
+            wait = per_hour * (candidate.start_ts - now_ts)
+            if len(best) == limit and wait + min_penalty >= -best[0][0]:
+                break
+            local = candidate.start_ts + offset
+            weekday, second = (local // 86_400 + 3) % 7, local % 86_400
+            penalties = [w.penalty for w in prepared if weekday in w.weekdays and w.start <= second < w.end]
+            if not penalties:
+                continue
+            score = wait + weights.preference * min(penalties)
+            entry = (-score, -candidate.start_ts, -candidate.slot.id, candidate)
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+    ranked = sorted(best, reverse=True)
+    return [
+        Recommendation(c.doctor_id, doctors[c.doctor_id], c.slot.id, c.slot.start_time, c.slot.end_time, -score)
+        for score, _, _, c in ranked
+    ]
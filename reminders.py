@@ -0,0 +1,360 @@
+"""Appointment reminders.
+
+    python -m doctor_appointment.reminders --sink file:reminders.jsonl
+    python -m doctor_appointment.reminders --sink smtp:localhost:1025
+
+Run one reminder process next to the web workers. It loads the appointments
+starting within REMINDER_HORIZON from the start_ts index into a priority
+queue ordered by reminder time, follows the booking journal (see journal.py)
+to pick up bookings and cancellations as they happen, and extends the loaded
+range as time moves on. Due reminders are handed to a sink in batches.
+
+After every fully delivered round the scheduler writes a dispatch mark to
+REMINDER_MARK_PATH: the time up to which everything due has been sent, for
+every appointment it knew of then. On restart, reminders that were due by the
+mark for appointments booked REMINDER_MARK_SLACK before it are skipped, so a
+deploy does not resend the last day's reminders. Delivery stays at least
+once: a crash between a sink accepting a batch and the mark being written
+resends that batch, and bookings close to the mark are sent again rather
+than risk being missed.
+"""
+import argparse
+import heapq
+import json
+import os
+import smtplib
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Callable, Iterable, Optional, Protocol
+from sqlmodel import Session
+from .journal import BOOKED, CANCELLED, JOURNAL_PATH, journal_end, read_events
+from .models import as_utc
+from .readmodels import ReminderRow, reminder_rows_between, reminder_rows_for
+from .sharding import fan_out, open_session
+
+# Patients are reminded this long before their appointment.
+REMINDER_LEAD = timedelta(hours=24)
+
+# Appointments starting within this range (beyond the lead time) are kept in memory.
+REMINDER_HORIZON = timedelta(hours=24)
+
+REMINDER_BATCH_SIZE = 500
+REMINDER_POLL_INTERVAL = 5.0
+
+REMINDER_SENDER = "reminders@doctor-appointment.local"
+
+REMINDER_MARK_PATH = "./reminder-mark.json"
+
+# Bookings this close to the mark may not have reached the queue through the
+# journal before the round that wrote it.
+REMINDER_MARK_SLACK = timedelta(seconds=30)
+
+
+def _timestamp(value: datetime) -> float:
+    return as_utc(value).timestamp()
+
+
+@dataclass(frozen=True)
+class Reminder:
+    appointment_id: int
+    due_at: float
+    start_time: datetime
+    patient_email: str
+    patient_name: Optional[str]
+    doctor_name: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: ReminderRow, lead: timedelta = REMINDER_LEAD) -> "Reminder":
+        return cls(
+            appointment_id=row.appointment_id,
+            due_at=_timestamp(row.start_time - lead),
+            start_time=row.start_time,
+            patient_email=row.patient_email,
+            patient_name=row.patient_name,
+            doctor_name=row.doctor_name,
+        )
+
+
+class ReminderQueue:
+    """Min-heap of reminders by due time.
+
+    Cancelling or rescheduling only touches the id -> reminder map; the heap
+    entry goes stale and is skipped when it reaches the top.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[float, int]] = []
+        self._pending: dict[int, Reminder] = {}
+
+    def schedule(self, reminder: Reminder) -> None:
+        current = self._pending.get(reminder.appointment_id)
+        self._pending[reminder.appointment_id] = reminder
+        if current is None or current.due_at != reminder.due_at:
+            heapq.heappush(self._heap, (reminder.due_at, reminder.appointment_id))
+
+    def cancel(self, appointment_id: int) -> bool:
+        return self._pending.pop(appointment_id, None) is not None
+
+    def next_due(self) -> Optional[float]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float, limit: int = REMINDER_BATCH_SIZE) -> list[Reminder]:
+        batch: list[Reminder] = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and len(batch) < limit:
+            due_at, appointment_id = heapq.heappop(heap)
+            reminder = self._pending.get(appointment_id)
+            if reminder is not None and reminder.due_at == due_at:
+                del self._pending[appointment_id]
+                batch.append(reminder)
+        return batch
+
+    def _drop_stale(self) -> None:
+        heap = self._heap
+        while heap:
+            due_at, appointment_id = heap[0]
+            reminder = self._pending.get(appointment_id)
+            if reminder is not None and reminder.due_at == due_at:
+                return
+            heapq.heappop(heap)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class ReminderSink(Protocol):
+    def send(self, batch: list[Reminder]) -> None: ...
+
+
+class FileSink:
+    """Appends each reminder as a JSON line; handy for tests and dry runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, batch: list[Reminder]) -> None:
+        with open(self.path, "a") as f:
+            for r in batch:
+                f.write(json.dumps({
+                    "appointment_id": r.appointment_id,
+                    "to": r.patient_email,
+                    "start_time": r.start_time.isoformat(),
+                    "doctor": r.doctor_name,
+                }) + "\n")
+
+
+class SmtpSink:
+    """Sends one email per reminder over a single SMTP connection per batch.
+
+    For local testing point it at a debugging server, e.g.
+    `python -m aiosmtpd -n -l localhost:1025`.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 1025, sender: str = REMINDER_SENDER):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send(self, batch: list[Reminder]) -> None:
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            for r in batch:
+                msg = EmailMessage()
+                msg["From"] = self.sender
+                msg["To"] = r.patient_email
+                msg["Subject"] = f"Reminder: appointment on {r.start_time.strftime('%B %d at %I:%M %p')}"
+                msg.set_content(
+                    f"Hello {r.patient_name or ''},\n\n"
+                    f"This is a reminder of your appointment with Dr. {r.doctor_name or ''} "
+                    f"on {r.start_time.strftime('%B %d, %Y at %I:%M %p')} (UTC).\n"
+                )
+                smtp.send_message(msg)
+
+
+def sink_from_spec(spec: str) -> ReminderSink:
+    kind, _, rest = spec.partition(":")
+    if kind == "file":
+        return FileSink(rest or "reminders.jsonl")
+    if kind == "smtp":
+        host, _, port = rest.partition(":")
+        return SmtpSink(host or "localhost", int(port or 1025))
+    raise ValueError(f"unknown reminder sink {spec!r}; use file:PATH or smtp:HOST:PORT")
+
+
+def read_mark(path: str) -> Optional[datetime]:
+    try:
+        with open(path) as f:
+            return datetime.fromisoformat(json.load(f)["dispatched_until"])
+    except FileNotFoundError:
+        return None
+
+
+def write_mark(path: str, dispatched_until: datetime) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"dispatched_until": dispatched_until.isoformat()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ReminderScheduler:
+    """Keeps the queue in step with the database and dispatches due reminders."""
+
+    def __init__(
+        self,
+        sink: ReminderSink,
+        bind=None,
+        journal_path: str = JOURNAL_PATH,
+        lead: timedelta = REMINDER_LEAD,
+        horizon: timedelta = REMINDER_HORIZON,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+        mark_path: Optional[str] = REMINDER_MARK_PATH,
+    ):
+        self.sink = sink
+        self.queue = ReminderQueue()
+        self._bind = bind
+        self.journal_path = journal_path
+        self.lead = lead
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self._clock = clock
+        self._journal_offset = 0
+        self._loaded_until: Optional[datetime] = None
+        self.mark_path = mark_path
+        self._mark: Optional[datetime] = None
+        # Everything committed before this is in the queue
+        self._synced_at: Optional[datetime] = None
+
+    def _now(self) -> datetime:
+        return self._clock().astimezone(timezone.utc)
+
+    def start(self) -> None:
+        if self.mark_path is not None:
+            self._mark = read_mark(self.mark_path)
+        # Note the journal position first so nothing committed during the
+        # initial load is missed; replaying an event twice is harmless.
+        now = self._now()
+        self._journal_offset = journal_end(self.journal_path)
+        self._synced_at = now
+        self._load(now, now + self.lead + self.horizon)
+
+    def _schedule(self, row: ReminderRow) -> None:
+        reminder = Reminder.from_row(row, self.lead)
+        mark = self._mark
+        if mark is not None and reminder.due_at <= mark.timestamp():
+            if as_utc(row.booked_at) <= mark - REMINDER_MARK_SLACK:
+                return  # sent before the last restart
+        self.queue.schedule(reminder)
+
+    def _session(self) -> Session:
+        # Without an explicit bind, read the app database across all shards
+        return open_session() if self._bind is None else Session(self._bind)
+
+    def _load(self, start: datetime, end: datetime) -> None:
+        with self._session() as session:
+            rows = fan_out(session, lambda s: reminder_rows_between(s, start, end))
+        for row in rows:
+            self._schedule(row)
+        self._loaded_until = end
+
+    def extend(self) -> None:
+        """Load the part of the horizon that time has moved into."""
+        end = self._now() + self.lead + self.horizon
+        if self._loaded_until is None or end - self._loaded_until >= timedelta(minutes=1):
+            self._load(self._loaded_until or self._now(), end)
+
+    def apply_journal(self) -> int:
+        """Apply bookings and cancellations committed since the last call."""
+        synced_at = self._now()
+        if not os.path.exists(self.journal_path):
+            self._synced_at = synced_at
+            return 0
+        booked: set[int] = set()
+        applied = 0
+        for record, offset in read_events(self.journal_path, self._journal_offset):
+            self._journal_offset = offset
+            if record["type"] == BOOKED:
+                booked.add(record["appointment_id"])
+            elif record["type"] == CANCELLED:
+                booked.discard(record["appointment_id"])
+                self.queue.cancel(record["appointment_id"])
+            else:
+                continue
+            applied += 1
+        if booked:
+            self.apply_bookings(booked)
+        self._synced_at = synced_at
+        return applied
+
+    def apply_bookings(self, appointment_ids: Iterable[int]) -> None:
+        ids = list(appointment_ids)
+        with self._session() as session:
+            rows = fan_out(session, lambda s: reminder_rows_for(s, ids))
+        for row in rows:
+            # Beyond the loaded range the next extend() picks it up
+            if self._loaded_until is None or row.start_time < self._loaded_until:
+                self._schedule(row)
+
+    def dispatch_due(self) -> int:
+        dispatched_at = self._now()
+        now = _timestamp(dispatched_at)
+        sent = 0
+        while True:
+            batch = self.queue.pop_due(now, self.batch_size)
+            if not batch:
+                self._advance_mark(dispatched_at)
+                return sent
+            try:
+                self.sink.send(batch)
+            except Exception:
+                # Put the batch back so the next round retries it
+                for reminder in batch:
+                    self.queue.schedule(reminder)
+                raise
+            sent += len(batch)
+
+    def _advance_mark(self, dispatched_at: datetime) -> None:
+        # Only appointments known by the last sync were in the queue just now
+        if self.mark_path is None or self._synced_at is None:
+            return
+        mark = min(dispatched_at, self._synced_at)
+        if self._mark is None or mark > self._mark:
+            write_mark(self.mark_path, mark)
+            self._mark = mark
+
+    def run(self, poll_interval: float = REMINDER_POLL_INTERVAL, once: bool = False) -> None:
+        self.start()
+        while True:
+            self.apply_journal()
+            self.extend()
+            try:
+                self.dispatch_due()
+            except (OSError, smtplib.SMTPException) as e:
+                print(f"reminder delivery failed, will retry: {e}", file=sys.stderr)
+            if once:
+                return
+            time.sleep(poll_interval)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Send appointment reminders")
+    parser.add_argument("--sink", default="file:reminders.jsonl", help="file:PATH or smtp:HOST:PORT")
+    parser.add_argument("--journal", default=JOURNAL_PATH)
+    parser.add_argument("--mark", default=REMINDER_MARK_PATH, help="where the dispatch mark is kept")
+    parser.add_argument("--poll-interval", type=float, default=REMINDER_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="dispatch what is due now and exit")
+    args = parser.parse_args(argv)
+    scheduler = ReminderScheduler(sink_from_spec(args.sink), journal_path=args.journal, mark_path=args.mark)
+    try:
+        scheduler.run(args.poll_interval, once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
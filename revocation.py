@@ -0,0 +1,65 @@
+"""Revoked token ids.
+
+Access tokens are checked without a query, so logging out or rotating a
+refresh token records the token's jti in the RevokedToken table and bumps the
+REVOKED_TOKENS data version. Each process keeps the unexpired jtis in a set
+that is reloaded only when that version moves: a token that was never revoked
+costs get_current_user a set lookup, and a revocation made by another worker
+takes effect within VERSION_POLL_INTERVAL.
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import Engine, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+from .database import engine
+from .models import RevokedToken
+from .versions import REVOKED_TOKENS, VersionWatcher, bump_versions, data_versions
+
+
+class RevocationList:
+    """Per-process copy of the unexpired revoked jtis."""
+
+    def __init__(self, bind: Engine = engine, watcher: VersionWatcher = data_versions):
+        self.bind = bind
+        self._watcher = watcher
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._jtis: frozenset[str] = frozenset()
+
+    def _load(self) -> frozenset[str]:
+        now = datetime.now(timezone.utc)
+        with Session(self.bind) as session:
+            return frozenset(session.exec(select(RevokedToken.jti).where(RevokedToken.expires_at > now)).all())
+
+    def is_revoked(self, jti: str) -> bool:
+        version = self._watcher.get(REVOKED_TOKENS)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._jtis = self._load()
+                    self._version = version
+        return jti in self._jtis
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+            self._jtis = frozenset()
+
+
+revoked_tokens = RevocationList()
+
+
+def revoke(session: Session, jti: str, expires_at: datetime) -> bool:
+    """Revoke jti in the session's transaction. Returns False if it already was.
+
+    Expired rows are pruned on the way, so the table only ever holds tokens
+    that would otherwise still be accepted.
+    """
+    session.exec(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.now(timezone.utc)))
+    stmt = insert(RevokedToken).values(jti=jti, expires_at=expires_at)
+    revoked = session.exec(stmt.on_conflict_do_nothing(index_elements=[RevokedToken.jti])).rowcount == 1
+    if revoked:
+        bump_versions(session, REVOKED_TOKENS)
+    return revoked
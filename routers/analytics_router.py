@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from ..analytics import analytics_cache
+from ..auth import require_role
+from ..models import User
+from ..schemas import AnalyticsOut
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.get("/", response_model=AnalyticsOut)
+def get_analytics(current_user: User = Depends(require_role("admin"))):
+    """Utilization, booking lead times, busiest hours and cancellation rates over the last 90 days (admins only).
+
+    Served from a per-process cache that is refreshed in the background every
+    few minutes, so figures can lag the latest bookings.
+    """
+    return analytics_cache.get()
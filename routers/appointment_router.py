@@ -1,12 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timezone
 from ..database import get_session
 from ..auth import require_role, get_current_user
-from ..models import Slot, Appointment, DoctorProfile, User
-from ..schemas import AppointmentCreate, AppointmentOut
+from ..models import Slot, Appointment, DoctorProfile, User, WaitlistEntry
+from ..schemas import AppointmentCreate, AppointmentOut, HoldCreate, HoldOut, HoldConfirm, WaitlistCreate, WaitlistOut
+from ..holds import slot_holds, confirm_hold, HOLD_TTL_SECONDS, MAX_HOLD_TTL_SECONDS
+from ..versions import bump_versions, SLOTS, APPOINTMENTS
+from ..serialization import json_list_response
+from ..idempotency import IdempotentRoute
+from ..waitlist import join_waitlist, leave_waitlist, promote_waitlisted
+from ..policies import can_cancel
+from ..readmodels import appointment_rows, doctor_profile_id, waitlist_rows
+from ..seats import has_seat, release_seat, take_seat
+from ..sharding import fan_out, route_doctor, route_row
+from ..writer import commit_write
 
-router = APIRouter(prefix="/appointments", tags=["appointments"])
+router = APIRouter(prefix="/appointments", tags=["appointments"], route_class=IdempotentRoute)
 
 
 @router.post("/", response_model=AppointmentOut)
@@ -22,6 +33,7 @@ def book_appointment(
         raise HTTPException(status_code=401, detail="Invalid user")
 
     # Check if doctor exists
+    route_doctor(session, payload.doctor_id)
     doctor = session.get(DoctorProfile, payload.doctor_id)
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
@@ -40,81 +52,235 @@ def book_appointment(
     slot_id = slot.id
     if slot_id is None:
         raise HTTPException(status_code=500, detail="Slot id not generated")
+
+    def book(session: Session) -> Appointment:
+        if slot.capacity > 1 and has_seat(session, slot_id, int(patient_id)):
+            raise HTTPException(status_code=400, detail="You already have a seat in this session")
+
+        # May run in the group writer's session; the conditional update is what decides
+        if not take_seat(session, slot_id):
+            raise HTTPException(status_code=400, detail="Slot already booked")
+
+        # Create the appointment
+        appt = Appointment(
+            doctor_id=payload.doctor_id, 
+            patient_id=int(patient_id), 
+            slot_id=int(slot_id), 
+            reason=payload.reason
+        )
+        
+        # Save to database
+        session.add(appt)
+        bump_versions(session, SLOTS, APPOINTMENTS)
+        return appt
+
+    # Group sessions are not held; their seats are only counted
+    if slot.capacity > 1:
+        return commit_write(session, book, doctor_id=payload.doctor_id)
+
+    # Take a short lease so a concurrent hold cannot grab the slot mid-booking
+    hold = slot_holds.acquire(int(slot_id), payload.doctor_id, int(patient_id))
+    if hold is None:
+        raise HTTPException(status_code=400, detail="Slot is on hold by another patient")
+
+    try:
+        appt = commit_write(session, book, doctor_id=payload.doctor_id)
+    finally:
+        slot_holds.release(hold.hold_id)
     
-    # Create the appointment
-    appt = Appointment(
-        doctor_id=payload.doctor_id, 
-        patient_id=int(patient_id), 
-        slot_id=int(slot_id), 
-        reason=payload.reason
+    return appt
+
+
+@router.post("/holds", response_model=HoldOut)
+def create_hold(
+    payload: HoldCreate,
+    current_user: User = Depends(require_role("patient")),
+    session: Session = Depends(get_session)
+):
+    """Hold a slot for the current patient for a limited time"""
+
+    patient_id = current_user.id
+    if patient_id is None:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    ttl = payload.ttl_seconds or HOLD_TTL_SECONDS
+    if ttl <= 0 or ttl > MAX_HOLD_TTL_SECONDS:
+        raise HTTPException(status_code=422, detail=f"ttl_seconds must be between 1 and {MAX_HOLD_TTL_SECONDS}")
+
+    route_doctor(session, payload.doctor_id)
+    slot = session.get(Slot, payload.slot_id)
+    if not slot or slot.id is None:
+        raise HTTPException(status_code=404, detail="Slot not found")
+
+    if slot.doctor_id != payload.doctor_id:
+        raise HTTPException(status_code=400, detail="Slot does not belong to this doctor")
+
+    if slot.is_booked:
+        raise HTTPException(status_code=400, detail="Slot already booked")
+
+    if slot.capacity > 1:
+        raise HTTPException(status_code=400, detail="Group session seats cannot be held; book one directly")
+
+    hold = slot_holds.acquire(int(slot.id), slot.doctor_id, int(patient_id), ttl)
+    if hold is None:
+        raise HTTPException(status_code=409, detail="Slot is on hold by another patient")
+
+    # A booking may have committed between the check above and the lease
+    if session.exec(select(Slot.is_booked).where(Slot.id == slot.id)).one():
+        slot_holds.release(hold.hold_id)
+        raise HTTPException(status_code=400, detail="Slot already booked")
+
+    return HoldOut(
+        hold_id=hold.hold_id,
+        doctor_id=hold.doctor_id,
+        slot_id=hold.slot_id,
+        expires_at=datetime.fromtimestamp(hold.expires_at, timezone.utc),
     )
-    
-    # Mark slot as booked
-    slot.is_booked = True
-    
-    # Save to database
-    session.add(appt)
-    session.add(slot)
-    session.commit()
-    session.refresh(appt)
-    
+
+
+@router.post("/holds/{hold_id}/confirm", response_model=AppointmentOut)
+def confirm_slot_hold(
+    hold_id: str,
+    payload: HoldConfirm,
+    current_user: User = Depends(require_role("patient")),
+    session: Session = Depends(get_session)
+):
+    """Turn a held slot into a booked appointment"""
+
+    if current_user.id is None:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    hold = slot_holds.claim(hold_id, int(current_user.id))
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+
+    try:
+        route_doctor(session, hold.doctor_id)
+        appt = confirm_hold(session, hold, payload.reason)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        slot_holds.release(hold.hold_id)
+
     return appt
 
 
+@router.delete("/holds/{hold_id}")
+def release_hold(
+    hold_id: str,
+    current_user: User = Depends(require_role("patient")),
+):
+    """Release a held slot before its lease runs out"""
+
+    hold = slot_holds.get(hold_id)
+    if hold is None or hold.pinned or hold.patient_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+
+    slot_holds.release(hold_id)
+    return {"message": "Hold released"}
+
+
+@router.post("/waitlist", response_model=WaitlistOut)
+def join_doctor_waitlist(
+    payload: WaitlistCreate,
+    current_user: User = Depends(require_role("patient")),
+    session: Session = Depends(get_session)
+):
+    """Wait for a slot with a doctor within a time window"""
+
+    if current_user.id is None:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    if not session.get(DoctorProfile, payload.doctor_id):
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    try:
+        route_doctor(session, payload.doctor_id)
+        entry = join_waitlist(
+            session, payload.doctor_id, int(current_user.id),
+            payload.window_start, payload.window_end, payload.reason,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return entry
+
+
+@router.get("/waitlist", response_model=List[WaitlistOut])
+def my_waitlist(
+    current_user: User = Depends(require_role("patient")),
+    session: Session = Depends(get_session)
+) -> Response:
+    """List the current patient's waitlist entries"""
+
+    entries = fan_out(session, lambda s: waitlist_rows(s, current_user.id or 0), key=lambda e: e.window_start)
+    return json_list_response(WaitlistOut, entries)
+
+
+@router.delete("/waitlist/{entry_id}")
+def leave_doctor_waitlist(
+    entry_id: int,
+    current_user: User = Depends(require_role("patient")),
+    session: Session = Depends(get_session)
+):
+    """Leave the waitlist"""
+
+    route_row(session, entry_id)
+    entry = session.get(WaitlistEntry, entry_id)
+    if not entry or entry.patient_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+
+    leave_waitlist(session, entry)
+    return {"message": "Left the waitlist"}
+
+
 @router.get("/me", response_model=List[AppointmentOut])
 def my_appointments(
+    cancellable: bool = False,
     current_user: User = Depends(get_current_user), 
     session: Session = Depends(get_session)
-) -> list[Appointment]:
-    """Get all appointments for the current user (patient or doctor)"""
+) -> Response:
+    """Get all appointments for the current user (patient or doctor), optionally only those that can still be cancelled"""
     
-    appointments: list[Appointment] = []
+    appointments = []
+    cancellable_at = datetime.now(timezone.utc) if cancellable else None
 
-    if current_user.role == "patient":
-        # Get appointments where user is the patient
-        stmt = select(Appointment).where(Appointment.patient_id == current_user.id)
-        appointments = list(session.exec(stmt).all())
+    if current_user.role == "patient" and current_user.id is not None:
+        # Get appointments where user is the patient, from every shard
+        patient_id = current_user.id
+        appointments = fan_out(session, lambda s: appointment_rows(s, patient_id=patient_id, cancellable_at=cancellable_at))
         
-    elif current_user.role == "doctor":
+    elif current_user.role == "doctor" and current_user.id is not None:
         # Find the doctor profile for this user
-        stmt = select(DoctorProfile).where(DoctorProfile.user_id == current_user.id)
-        doctor_profile = session.exec(stmt).first()
-        
-        if not doctor_profile:
-            return appointments
-        
-        # Get appointments where user is the doctor
-        stmt = select(Appointment).where(Appointment.doctor_id == doctor_profile.id)
-        appointments = list(session.exec(stmt).all())
+        profile_id = doctor_profile_id(session, current_user.id)
         
-    else:
-        appointments = []
+        if profile_id is not None:
+            # Get appointments where user is the doctor
+            route_doctor(session, profile_id)
+            appointments = appointment_rows(session, doctor_id=profile_id, cancellable_at=cancellable_at)
     
-    return appointments
+    return json_list_response(AppointmentOut, appointments)
 
 
 @router.get("/", response_model=List[AppointmentOut])
 def list_all_appointments(
     current_user: User = Depends(get_current_user), 
     session: Session = Depends(get_session)
-) -> list[Appointment]:
+) -> Response:
     """List all appointments (admin only or filtered by user)"""
     
-    appointments: list[Appointment] = []
-
     if current_user.role == "patient":
-        stmt = select(Appointment).where(Appointment.patient_id == current_user.id)
+        appointments = fan_out(session, lambda s: appointment_rows(s, patient_id=current_user.id or 0))
     elif current_user.role == "doctor":
-        stmt = select(DoctorProfile).where(DoctorProfile.user_id == current_user.id)
-        doctor_profile = session.exec(stmt).first()
-        if not doctor_profile:
-            return appointments
-        stmt = select(Appointment).where(Appointment.doctor_id == doctor_profile.id)
+        profile_id = doctor_profile_id(session, current_user.id or 0)
+        if profile_id is None:
+            return json_list_response(AppointmentOut, [])
+        route_doctor(session, profile_id)
+        appointments = appointment_rows(session, doctor_id=profile_id)
     else:
-        stmt = select(Appointment)
+        appointments = fan_out(session, appointment_rows)
 
-    appointments = list(session.exec(stmt).all())
-    return appointments
+    return json_list_response(AppointmentOut, appointments)
 
 
 @router.delete("/{appointment_id}")
@@ -125,6 +291,7 @@ def cancel_appointment(
 ):
     """Cancel an appointment"""
     
+    route_row(session, appointment_id)
     appointment = session.get(Appointment, appointment_id)
     
     if not appointment:
@@ -133,6 +300,13 @@ def cancel_appointment(
     # Check if user has permission to cancel
     if current_user.role == "patient" and appointment.patient_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to cancel this appointment")
+
+    # Patients are bound by the doctor's cancellation policy; doctors may cancel any time
+    if current_user.role == "patient" and not can_cancel(appointment):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cancellations for this appointment closed at {appointment.cancellable_until}",
+        )
     
     if current_user.role == "doctor":
         stmt = select(DoctorProfile).where(DoctorProfile.user_id == current_user.id)
@@ -140,15 +314,27 @@ def cancel_appointment(
         if not doctor_profile or appointment.doctor_id != doctor_profile.id:
             raise HTTPException(status_code=403, detail="Not authorized to cancel this appointment")
     
-    # Free up the slot
-    if appointment.slot_id:
-        slot = session.get(Slot, appointment.slot_id)
-        if slot:
-            slot.is_booked = False
-            session.add(slot)
-    
-    # Delete appointment
-    session.delete(appointment)
-    session.commit()
+    def cancel(session: Session) -> Optional[Appointment]:
+        appointment = session.get(Appointment, appointment_id)
+        if not appointment:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+
+        # Delete appointment
+        session.delete(appointment)
+
+        # Free up the slot, or hand it straight to the next patient on the waitlist
+        promoted = None
+        if appointment.slot_id:
+            slot = session.get(Slot, appointment.slot_id)
+            if slot:
+                release_seat(session, slot.id)
+                promoted = promote_waitlisted(session, slot)
+        
+        bump_versions(session, SLOTS, APPOINTMENTS)
+        return promoted
+
+    promoted = commit_write(session, cancel, row_id=appointment_id)
     
+    if promoted is not None:
+        return {"message": "Appointment cancelled successfully", "waitlist_appointment_id": promoted.id}
     return {"message": "Appointment cancelled successfully"}
\ No newline at end of file
@@ -1,15 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session
-from ..schemas import UserCreate, Token, Login
+from ..schemas import BulkUserCreate, BulkUserResult, LogoutRequest, RefreshRequest, UserCreate, Token, Login
 from ..database import get_session
-from ..crud import create_user
-from ..auth import authenticate_user, create_access_token
+from ..crud import create_user, create_users
+from ..auth import (
+    authenticate_user, create_access_token, create_refresh_token, decode_token, oauth2_scheme, require_role,
+    token_expiry,
+)
+from ..models import User
+from ..ratelimit import enforce_credential_limits
+from ..revocation import revoke
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+def issue_tokens(user: User) -> dict[str, Any]:
+    if user.id is None:
+        raise HTTPException(status_code=500, detail="User id not generated")
+    return {
+        "access_token": create_access_token({"sub": str(user.id), "role": user.role}),
+        "refresh_token": create_refresh_token(user.id),
+        "token_type": "bearer",
+    }
+
 @router.post("/register", response_model=Token)
-def register(payload: UserCreate, session: Session = Depends(get_session)):
+def register(payload: UserCreate, request: Request, session: Session = Depends(get_session)):
     from ..auth import get_user_by_email
+    enforce_credential_limits(request, payload.email)
     if get_user_by_email(session, payload.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     if not payload.full_name:
@@ -26,17 +43,74 @@ def register(payload: UserCreate, session: Session = Depends(get_session)):
         )
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
-    if user.id is None:
-        raise HTTPException(status_code=500, detail="User id not generated")
-    access_token = create_access_token({"sub": str(user.id), "role": user.role})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(user)
+
+@router.post("/register/bulk", response_model=List[BulkUserResult])
+def register_bulk(
+    payload: BulkUserCreate,
+    current_user: User = Depends(require_role("admin")),
+    session: Session = Depends(get_session),
+):
+    """Onboard a clinic's doctors and patients in one request (admins only).
+
+    Every row gets a result: created, duplicate or invalid. Rows are
+    independent, so one bad row does not stop the others.
+    """
+    return create_users(session, payload.users)
 
 @router.post("/login", response_model=Token)
-def login(form_data: Login, session: Session = Depends(get_session)):
+def login(form_data: Login, request: Request, session: Session = Depends(get_session)):
+    enforce_credential_limits(request, form_data.email)
     user = authenticate_user(session, form_data.email, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    if user.id is None:
-        raise HTTPException(status_code=500, detail="User id not generated")
-    access_token = create_access_token({"sub": str(user.id), "role": user.role})
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return issue_tokens(user)
+
+def _claims(token: str, token_type: str) -> Optional[dict[str, Any]]:
+    from jose import JWTError
+    try:
+        return decode_token(token, token_type)
+    except JWTError:
+        return None
+
+@router.post("/refresh", response_model=Token)
+def refresh(payload: RefreshRequest, session: Session = Depends(get_session)):
+    """Trade a refresh token for a new access and refresh token pair.
+
+    Each refresh token works once: it is revoked as the new pair is issued,
+    so a replayed one is rejected.
+    """
+    invalid = HTTPException(status_code=401, detail="Invalid refresh token")
+    claims = _claims(payload.refresh_token, "refresh")
+    if claims is None or claims.get("jti") is None:
+        raise invalid
+    try:
+        user = session.get(User, int(claims["sub"]))
+    except (KeyError, TypeError, ValueError):
+        raise invalid
+    if user is None:
+        raise invalid
+    # Another process may have used the token since the revocation list was loaded
+    if not revoke(session, claims["jti"], token_expiry(claims)):
+        raise invalid
+    session.commit()
+    return issue_tokens(user)
+
+@router.post("/logout")
+def logout(
+    payload: Optional[LogoutRequest] = None,
+    token: str = Depends(oauth2_scheme),
+    session: Session = Depends(get_session),
+):
+    """Revoke the access token and, if given, the caller's refresh token."""
+    claims = _claims(token, "access")
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    if claims.get("jti") is not None:
+        revoke(session, claims["jti"], token_expiry(claims))
+    if payload is not None and payload.refresh_token:
+        refresh_claims = _claims(payload.refresh_token, "refresh")
+        if refresh_claims is not None and refresh_claims.get("jti") is not None and refresh_claims.get("sub") == claims.get("sub"):
+            revoke(session, refresh_claims["jti"], token_expiry(refresh_claims))
+    session.commit()
+    return {"message": "Logged out"}
\ No newline at end of file
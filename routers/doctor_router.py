@@ -1,20 +1,69 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Literal
+from datetime import date, datetime, time, timedelta, timezone
 from ..database import get_session
 from ..auth import require_role
-from ..schemas import DoctorOut, SlotCreate, SlotOut
-from ..models import DoctorProfile, Slot, User
+from ..schemas import (
+    DoctorOut, DoctorAvailabilityOut, SlotCreate, SlotOut, CalendarBucketOut, CancellationPolicyIn, CancellationPolicyOut,
+    RecommendationOut, RecommendationRequest,
+)
+from ..models import DoctorProfile, Slot, User, as_utc, epoch_seconds, slot_time
+from ..versions import bump_versions, SLOTS
+from ..waitlist import match_new_slots
+from ..serialization import json_list_response
+from ..idempotency import IdempotentRoute, read_only
+from ..availability import with_stale_recomputed
+from ..policies import clear_policy, policy_cache, set_policy
+from ..recommendations import MAX_RECOMMEND_HORIZON, recommend
+from ..readmodels import doctor_rows, doctor_availability_rows, slot_rows, calendar_buckets, DOCTOR_AVAILABILITY_ORDER
+from ..sharding import fan_out, owns, route_doctor
+from ..writer import commit_write
 
-router = APIRouter(prefix="/doctors", tags=["doctors"])
+router = APIRouter(prefix="/doctors", tags=["doctors"], route_class=IdempotentRoute)
 
-@router.get("/", response_model=List[DoctorOut])
-def get_doctors(specialization: str | None = None, session: Session = Depends(get_session)):
-    stmt = select(DoctorProfile)
-    if specialization:
-        stmt = stmt.where(DoctorProfile.specialization == specialization)
-    docs = session.exec(stmt).all()
-    return docs
+MAX_CALENDAR_DAYS = 366
+
+@router.get("/", response_model=List[DoctorAvailabilityOut])
+def get_doctors(
+    specialization: str | None = None,
+    with_availability: bool = False,
+    sort: Literal["id", "next_free", "free_slots"] = "id",
+    session: Session = Depends(get_session),
+):
+    """List doctors, optionally with free/booked slot counts for the coming week and the next free slot"""
+    if not with_availability and sort == "id":
+        docs = doctor_rows(session, specialization)
+        return json_list_response(DoctorOut, docs)
+
+    def read(s: Session):
+        # Each shard only has summary rows for its own doctors
+        docs = [doc for doc in doctor_availability_rows(s, specialization, sort) if owns(s, doc.id)]
+        fresh = with_stale_recomputed(s, docs)
+        if fresh is not docs:
+            fresh.sort(key=DOCTOR_AVAILABILITY_ORDER[sort])
+        return fresh
+
+    docs = fan_out(session, read, key=DOCTOR_AVAILABILITY_ORDER[sort])
+    return json_list_response(DoctorAvailabilityOut, docs)
+
+@router.post("/recommendations", response_model=List[RecommendationOut])
+@read_only
+def recommend_slots(payload: RecommendationRequest, session: Session = Depends(get_session)):
+    """Best free slots across doctors for the given preference windows, ranked by the given weights"""
+    for window in payload.windows:
+        if window.end not in (None, time(0)) and window.end <= window.start:
+            raise HTTPException(status_code=400, detail="Preference window must end after it starts")
+    if payload.latest is not None:
+        begin = as_utc(payload.earliest) if payload.earliest else datetime.now(timezone.utc)
+        if as_utc(payload.latest) - begin > MAX_RECOMMEND_HORIZON:
+            raise HTTPException(status_code=400, detail=f"Search at most {MAX_RECOMMEND_HORIZON.days} days ahead")
+
+    rows = recommend(
+        session, payload.windows, payload.weights, payload.limit, payload.specialization, payload.doctor_ids,
+        payload.earliest, payload.latest, payload.utc_offset_minutes,
+    )
+    return json_list_response(RecommendationOut, rows)
 
 @router.post("/{doctor_id}/slots", response_model=SlotOut)
 def create_slot(
@@ -28,36 +77,101 @@ def create_slot(
     if not doc:
         raise HTTPException(status_code=403, detail="You can only add slots for your own profile")
     
+    route_doctor(session, doctor_id)
+    start_time = slot_time(payload.start_time)
+    end_time = slot_time(payload.end_time) if payload.end_time else None
+
     # Validate that end_time is after start_time
-    if payload.end_time and payload.end_time <= payload.start_time:
+    if end_time and end_time <= start_time:
         raise HTTPException(status_code=400, detail="End time must be after start time")
     
-    # Check for overlapping slots (optional, but prevents confusion)
-    stmt = select(Slot).where(
-        Slot.doctor_id == doctor_id,
-        Slot.is_booked == False
-    )
-    existing_slots = session.exec(stmt).all()
-    for existing in existing_slots:
-        if existing.end_time:
-            # Check if new slot overlaps with existing slot
-            if (payload.start_time < existing.end_time and 
-                payload.end_time and payload.end_time > existing.start_time):
+    def add(session: Session) -> Slot:
+        # Check for overlapping slots (optional, but prevents confusion)
+        if end_time:
+            overlapping = session.exec(
+                select(Slot.start_time).where(
+                    Slot.doctor_id == doctor_id,
+                    Slot.is_booked == False,
+                    Slot.start_ts < epoch_seconds(end_time),
+                    Slot.end_ts > epoch_seconds(start_time),
+                ).limit(1)
+            ).first()
+            if overlapping is not None:
                 raise HTTPException(
                     status_code=400, 
-                    detail=f"Slot overlaps with existing slot at {existing.start_time.strftime('%I:%M %p')}"
+                    detail=f"Slot overlaps with existing slot at {overlapping.strftime('%I:%M %p')}"
                 )
-    
-    slot = Slot(doctor_id=doctor_id, start_time=payload.start_time, end_time=payload.end_time)
-    session.add(slot)
-    session.commit()
-    session.refresh(slot)
-    return slot
+        
+        slot = Slot(doctor_id=doctor_id, start_time=start_time, end_time=end_time, capacity=payload.capacity)
+        session.add(slot)
+        session.flush()
+        match_new_slots(session, [slot])
+        bump_versions(session, SLOTS)
+        return slot
+
+    return commit_write(session, add, doctor_id=doctor_id)
 
 @router.get("/{doctor_id}/slots", response_model=List[SlotOut])
 def list_slots(doctor_id: int, only_available: bool = True, session: Session = Depends(get_session)):
-    stmt = select(Slot).where(Slot.doctor_id == doctor_id)
-    if only_available:
-        stmt = stmt.where(Slot.is_booked == False)
-    slots = session.exec(stmt).all()
-    return slots
\ No newline at end of file
+    route_doctor(session, doctor_id)
+    slots = slot_rows(session, doctor_id, only_available)
+    return json_list_response(SlotOut, slots)
+
+@router.get("/{doctor_id}/calendar", response_model=List[CalendarBucketOut])
+def doctor_calendar(
+    doctor_id: int,
+    start: date | None = None,
+    days: int = 14,
+    granularity: Literal["day", "week"] = "day",
+    session: Session = Depends(get_session),
+):
+    """Slot totals per day (or per week) for the date range [start, start + days)"""
+    if days < 1 or days > MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_CALENDAR_DAYS}")
+
+    begin = datetime.combine(start or datetime.now(timezone.utc).date(), time.min)
+    route_doctor(session, doctor_id)
+    buckets = calendar_buckets(session, doctor_id, begin, begin + timedelta(days=days), granularity)
+    return json_list_response(CalendarBucketOut, buckets)
+
+def _own_profile(session: Session, doctor_id: int, current_user: User) -> DoctorProfile:
+    stmt = select(DoctorProfile).where(DoctorProfile.id == doctor_id, DoctorProfile.user_id == current_user.id)
+    doc = session.exec(stmt).first()
+    if not doc:
+        raise HTTPException(status_code=403, detail="You can only change your own cancellation policy")
+    return doc
+
+@router.get("/{doctor_id}/cancellation-policy", response_model=CancellationPolicyOut)
+def get_cancellation_policy(doctor_id: int, session: Session = Depends(get_session)):
+    """How long before an appointment patients of this doctor can still cancel, and where the rule comes from"""
+    if session.get(DoctorProfile, doctor_id) is None:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+    policy = policy_cache.get(session, doctor_id)
+    return CancellationPolicyOut(doctor_id=doctor_id, notice_minutes=policy.notice_minutes, source=policy.source)
+
+@router.put("/{doctor_id}/cancellation-policy", response_model=CancellationPolicyOut)
+def put_cancellation_policy(
+    doctor_id: int,
+    payload: CancellationPolicyIn,
+    current_user: User = Depends(require_role("doctor")),
+    session: Session = Depends(get_session),
+):
+    """Set the doctor's own notice period; a shorter one also moves upcoming appointments' deadlines later"""
+    _own_profile(session, doctor_id, current_user)
+    try:
+        set_policy(session, timedelta(minutes=payload.notice_minutes), doctor_id=doctor_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CancellationPolicyOut(doctor_id=doctor_id, notice_minutes=payload.notice_minutes, source="doctor")
+
+@router.delete("/{doctor_id}/cancellation-policy", response_model=CancellationPolicyOut)
+def delete_cancellation_policy(
+    doctor_id: int,
+    current_user: User = Depends(require_role("doctor")),
+    session: Session = Depends(get_session),
+):
+    """Drop the doctor's own rule and fall back to the specialization or default policy"""
+    _own_profile(session, doctor_id, current_user)
+    clear_policy(session, doctor_id=doctor_id)
+    policy = policy_cache.get(session, doctor_id)
+    return CancellationPolicyOut(doctor_id=doctor_id, notice_minutes=policy.notice_minutes, source=policy.source)
@@ -1,17 +1,42 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
+from typing import Annotated, List, Literal, Optional
+from datetime import date, datetime, time
+
+# Roles anyone can sign up for; admins are created with
+# python -m doctor_appointment.crud create-admin
+PublicRole = Literal["patient", "doctor"]
 
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
     full_name: Optional[str] = None
-    role: str
+    role: PublicRole
     specialization: Optional[str] = None
 
+# Largest batch POST /auth/register/bulk accepts.
+MAX_BULK_USERS = 500
+
+class BulkUserCreate(BaseModel):
+    users: List[UserCreate] = Field(min_length=1, max_length=MAX_BULK_USERS)
+
+class BulkUserResult(BaseModel):
+    index: int
+    email: str
+    status: Literal["created", "duplicate", "invalid"]
+    user_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    detail: Optional[str] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class Login(BaseModel):
     email: EmailStr
@@ -25,9 +50,17 @@ class DoctorOut(BaseModel):
     specialization: str
     bio: Optional[str] = None
 
+class DoctorAvailabilityOut(DoctorOut):
+    free_slots: Optional[int] = None
+    booked_slots: Optional[int] = None
+    next_free_start: Optional[datetime] = None
+
+MAX_SLOT_CAPACITY = 500
+
 class SlotCreate(BaseModel):
     start_time: datetime
     end_time: Optional[datetime] = None
+    capacity: int = Field(default=1, ge=1, le=MAX_SLOT_CAPACITY)  # more than 1 for a group session
 
 class SlotOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -36,6 +69,8 @@ class SlotOut(BaseModel):
     start_time: datetime
     end_time: Optional[datetime]
     is_booked: bool
+    capacity: int
+    seats_left: int
 
 class AppointmentCreate(BaseModel):
     doctor_id: int
@@ -50,4 +85,124 @@ class AppointmentOut(BaseModel):
     patient_id: int
     slot_id: Optional[int]
     created_at: datetime
-    reason: Optional[str]
\ No newline at end of file
+    reason: Optional[str]
+    cancellable_until: Optional[datetime] = None
+
+class CalendarBucketOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    period_start: date
+    total: int
+    booked: int
+    free: int
+    first_start: Optional[datetime]
+    last_end: Optional[datetime]
+
+class CancellationPolicyIn(BaseModel):
+    notice_minutes: int
+
+class CancellationPolicyOut(BaseModel):
+    doctor_id: int
+    notice_minutes: int
+    source: Literal["doctor", "specialization", "default"]
+
+class HoldCreate(BaseModel):
+    doctor_id: int
+    slot_id: int
+    ttl_seconds: Optional[int] = None
+
+class HoldOut(BaseModel):
+    hold_id: str
+    doctor_id: int
+    slot_id: int
+    expires_at: datetime
+
+class HoldConfirm(BaseModel):
+    reason: Optional[str] = None
+
+class WaitlistCreate(BaseModel):
+    doctor_id: int
+    window_start: datetime
+    window_end: datetime
+    reason: Optional[str] = None
+
+class WaitlistOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    doctor_id: int
+    window_start: datetime
+    window_end: datetime
+    reason: Optional[str]
+    created_at: datetime
+
+MAX_RECOMMENDATIONS = 50
+
+class PreferenceWindow(BaseModel):
+    # Times of day in the request's utc_offset_minutes; end None runs to midnight.
+    # A slot in this window ranks as if it started penalty_hours later.
+    weekdays: List[Annotated[int, Field(ge=0, le=6)]] = Field(default=[0, 1, 2, 3, 4, 5, 6], min_length=1)  # 0 is Monday
+    start: time = time(0)
+    end: Optional[time] = None
+    penalty_hours: float = Field(default=0, ge=0)
+
+class RankingWeights(BaseModel):
+    soonness: float = Field(default=1.0, ge=0)  # score per hour until the slot starts
+    preference: float = Field(default=1.0, ge=0)  # multiplies the window's penalty_hours
+
+class RecommendationRequest(BaseModel):
+    specialization: Optional[str] = None
+    doctor_ids: Optional[List[int]] = None
+    windows: List[PreferenceWindow] = []
+    utc_offset_minutes: int = Field(default=0, ge=-14 * 60, le=14 * 60)
+    earliest: Optional[datetime] = None
+    latest: Optional[datetime] = None
+    weights: RankingWeights = RankingWeights()
+    limit: int = Field(default=10, ge=1, le=MAX_RECOMMENDATIONS)
+
+class RecommendationOut(BaseModel):
+    doctor_id: int
+    specialization: str
+    slot_id: int
+    start_time: datetime
+    end_time: Optional[datetime]
+    score: float
+
+class DoctorAnalyticsOut(BaseModel):
+    doctor_id: int
+    offered_slots: int
+    booked_slots: int
+    utilization: Optional[float]
+    bookings: int
+    cancellations: int
+    cancellation_rate: Optional[float]
+
+class LeadTimeBucketOut(BaseModel):
+    # Bookings made less than max_hours (and at least the previous bucket's
+    # max_hours) before the slot started; None is the open-ended last bucket.
+    max_hours: Optional[float]
+    appointments: int
+
+class LeadTimeOut(BaseModel):
+    appointments: int
+    mean_hours: Optional[float]
+    p50_hours: Optional[float]
+    p90_hours: Optional[float]
+    buckets: List[LeadTimeBucketOut]
+
+class BusyHourOut(BaseModel):
+    weekday: int  # 0 is Monday
+    hour: int  # UTC
+    appointments: int
+
+class AnalyticsOut(BaseModel):
+    generated_at: datetime
+    window_start: datetime
+    window_end: datetime
+    backend: Literal["numpy", "python"]
+    offered_slots: int
+    booked_slots: int
+    utilization: Optional[float]
+    doctors: List[DoctorAnalyticsOut]
+    lead_time: LeadTimeOut
+    busiest_hours: List[BusyHourOut]
@@ -0,0 +1,44 @@
+"""Seat accounting for slots.
+
+A slot offers `capacity` seats: one for an ordinary appointment, more for a
+group session. `booked_count` counts the appointments holding a seat, and
+`is_booked` is kept as "no seat left", so every query that looks for free
+slots by filtering on it works unchanged for group sessions.
+
+take_seat() and release_seat() change the count with a single conditional
+UPDATE. SQLite evaluates the condition under its write lock, so concurrent
+bookings of the last seat cannot both succeed, and no caller has to read the
+slot first.
+"""
+from sqlalchemy import update
+from sqlmodel import Session, select
+from .models import Appointment, Slot
+
+
+def take_seat(session: Session, slot_id: int) -> bool:
+    """Book one seat of slot_id in the session's transaction. False if none is left."""
+    stmt = (
+        update(Slot)
+        .where(Slot.id == slot_id, Slot.booked_count < Slot.capacity)
+        # SET expressions see the row as it was before the update
+        .values(booked_count=Slot.booked_count + 1, is_booked=Slot.booked_count + 1 >= Slot.capacity)
+        .execution_options(synchronize_session="fetch")
+    )
+    return session.exec(stmt).rowcount == 1
+
+
+def has_seat(session: Session, slot_id: int, patient_id: int) -> bool:
+    """Whether patient_id already holds a seat of slot_id; one per patient and session."""
+    stmt = select(Appointment.id).where(Appointment.slot_id == slot_id, Appointment.patient_id == patient_id)
+    return session.exec(stmt.limit(1)).first() is not None
+
+
+def release_seat(session: Session, slot_id: int) -> bool:
+    """Give one seat of slot_id back. False if none was taken."""
+    stmt = (
+        update(Slot)
+        .where(Slot.id == slot_id, Slot.booked_count > 0)
+        .values(booked_count=Slot.booked_count - 1, is_booked=False)
+        .execution_options(synchronize_session="fetch")
+    )
+    return session.exec(stmt).rowcount == 1
@@ -0,0 +1,23 @@
+from functools import lru_cache
+from typing import Any, Sequence
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[schema])  # type: ignore[valid-type]
+
+
+def json_list_response(schema: type[BaseModel], rows: Sequence[Any]) -> Response:
+    """Serialize rows to a JSON array in a single pydantic-core pass.
+
+    rows may be ORM objects or any rows with matching attributes, such as the
+    projections in readmodels.py. The body is byte-for-byte what
+    response_model=List[schema] would produce, but validation and encoding
+    happen in one batch instead of per item, and the Python json module is
+    never involved.
+    """
+    adapter = _list_adapter(schema)
+    content = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    return Response(content=content, media_type="application/json")
@@ -0,0 +1,144 @@
+"""Pre-forking multi-worker launcher.
+
+    python -m doctor_appointment.serve --workers 4 --port 8000
+
+The parent imports the app and prepares the database once, binds the listening
+socket and forks the workers, so each worker starts with everything already
+imported. Workers share the socket and keep their caches coherent through the
+CacheVersion table (see versions.py).
+
+A worker that dies is replaced. One that dies within WORKER_MIN_UPTIME
+seconds of starting is replaced after a backoff that doubles up to
+RESPAWN_BACKOFF_MAX; after MAX_QUICK_DEATHS such deaths in a row the launcher
+stops the other workers and exits with the last worker's status.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import uvicorn
+from .database import init_db
+from .main import app
+from .sharding import shards
+from .versions import data_versions
+from .warmup import warmup
+
+WORKER_MIN_UPTIME = 10.0
+RESPAWN_BACKOFF = 0.5
+RESPAWN_BACKOFF_MAX = 30.0
+MAX_QUICK_DEATHS = 5
+
+# Worker exit status when uvicorn gave up during startup (lifespan, bind), as uvicorn.run uses
+STARTUP_FAILURE = 3
+
+
+def _run_worker(sock: socket.socket, log_level: str) -> int:
+    # Never reuse connections inherited from the parent across processes
+    shards.dispose(close=False)
+    warmup()
+    data_versions.expire()
+    config = uvicorn.Config(app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    return 0 if server.started else STARTUP_FAILURE
+
+
+def _spawn(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        status = 1
+        try:
+            status = _run_worker(sock, log_level)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            # Skip the parent's atexit handlers and buffered state
+            sys.stderr.flush()
+            os._exit(status)
+    return pid
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, workers: int = 2, log_level: str = "info") -> int:
+    """Run until stopped; returns the exit status for the launcher."""
+    init_db()
+    shards.dispose()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # pid -> time it was started
+    children = {_spawn(sock, log_level): time.monotonic() for _ in range(workers)}
+    stopping = False
+    exit_status = 0
+    quick_deaths = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, wait_status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+
+        code = os.waitstatus_to_exitcode(wait_status)
+        reason = f"signal {-code}" if code < 0 else f"status {code}"
+        print(f"worker {pid} exited with {reason}", file=sys.stderr)
+        if time.monotonic() - started >= WORKER_MIN_UPTIME:
+            quick_deaths = 0
+        else:
+            quick_deaths += 1
+            if quick_deaths >= MAX_QUICK_DEATHS:
+                print(f"{quick_deaths} workers in a row died within {WORKER_MIN_UPTIME:g}s of starting; giving up",
+                      file=sys.stderr)
+                exit_status = code if code > 0 else 1
+                stop(signal.SIGTERM, None)
+                continue
+            time.sleep(min(RESPAWN_BACKOFF * 2 ** (quick_deaths - 1), RESPAWN_BACKOFF_MAX))
+            if stopping:
+                continue
+        # Replace a worker that died unexpectedly
+        children[_spawn(sock, log_level)] = time.monotonic()
+
+    sock.close()
+    return exit_status
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the API with several pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        sys.exit("serve requires a platform with os.fork(); use `uvicorn --workers` instead")
+    sys.exit(serve(args.host, args.port, args.workers, args.log_level))
+
+
+if __name__ == "__main__":
+    main()
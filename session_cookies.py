@@ -0,0 +1,189 @@
+"""Signed session cookies for the HTML frontend.
+
+The session cookie carries what the pages need to know about the visitor:
+user id, role, display name, doctor profile id and specialization, plus an
+expiry. It is signed with HMAC-SHA256, so pages take the identity from the
+cookie instead of loading the User and DoctorProfile rows. Verified cookies
+are cached by value, which makes a repeat visit cost one dict lookup.
+
+SESSION_KEYS lists the signing keys, newest first (APP_SESSION_KEYS,
+comma-separated), and default to a key derived from the JWT secret, so the
+two never share a key. New cookies are signed with the first key; a cookie signed
+with any other listed key is still accepted and is re-signed with the first
+one on its next response, keeping its expiry. Dropping a key from the list
+signs out everyone whose cookie still uses it.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Any, Callable, Coroutine, NamedTuple, Optional, Sequence
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from .auth import SECRET_KEY
+
+
+def _derive_key(secret: str, purpose: str) -> str:
+    # A key for one purpose, so a signature made for it is useless anywhere else
+    return hmac.new(secret.encode("utf-8"), purpose.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+SESSION_COOKIE = "session"
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+SESSION_CACHE_SIZE = 10_000
+SESSION_KEYS = (
+    [key for key in os.environ.get("APP_SESSION_KEYS", "").split(",") if key]
+    or [_derive_key(SECRET_KEY, "session-cookie")]
+)
+
+# Cookies the frontend used before sessions were signed; cleared on login and logout.
+LEGACY_COOKIES = ("user_id", "user_role")
+
+
+class WebIdentity(NamedTuple):
+    user_id: int
+    role: str
+    name: str
+    doctor_id: Optional[int]
+    specialization: Optional[str]
+    expires_at: int
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionSigner:
+    """Signs and verifies session cookie values."""
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        ttl: int = SESSION_TTL_SECONDS,
+        cache_size: int = SESSION_CACHE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        if not keys:
+            raise ValueError("At least one session key is required")
+        self._keys = [key.encode("utf-8") for key in keys]
+        self.ttl = ttl
+        self._clock = clock
+        self._verify_cached = lru_cache(maxsize=cache_size)(self._verify)
+
+    def _mac(self, key: bytes, body: str) -> bytes:
+        return hmac.new(key, body.encode("ascii"), hashlib.sha256).digest()
+
+    def sign(
+        self,
+        user_id: int,
+        role: str,
+        name: str,
+        doctor_id: Optional[int] = None,
+        specialization: Optional[str] = None,
+        expires_at: Optional[int] = None,
+    ) -> str:
+        claims = {
+            "uid": user_id, "role": role, "name": name, "did": doctor_id, "spec": specialization,
+            "exp": expires_at if expires_at is not None else int(self._clock()) + self.ttl,
+        }
+        body = _encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return f"{body}.{_encode(self._mac(self._keys[0], body))}"
+
+    def _verify(self, value: str) -> Optional[tuple[WebIdentity, bool]]:
+        body, _, signature = value.partition(".")
+        try:
+            mac = _decode(signature)
+            body.encode("ascii")
+        except (binascii.Error, ValueError):
+            return None
+        for index, key in enumerate(self._keys):
+            if hmac.compare_digest(self._mac(key, body), mac):
+                break
+        else:
+            return None
+        try:
+            claims = json.loads(_decode(body))
+            identity = WebIdentity(
+                int(claims["uid"]), str(claims["role"]), str(claims["name"]),
+                None if claims["did"] is None else int(claims["did"]), claims["spec"], int(claims["exp"]),
+            )
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            return None
+        return identity, index == 0
+
+    def verify(self, value: str) -> Optional[tuple[WebIdentity, bool]]:
+        """(identity, signed with the current key) for a valid, unexpired value, else None."""
+        verified = self._verify_cached(value)
+        if verified is None or verified[0].expires_at <= self._clock():
+            return None
+        return verified
+
+
+session_signer = SessionSigner(SESSION_KEYS)
+
+
+def _set_cookie(response: Response, value: str, expires_at: int) -> None:
+    max_age = max(int(expires_at - time.time()), 0)
+    response.set_cookie(SESSION_COOKIE, value, max_age=max_age, httponly=True, samesite="lax")
+
+
+def start_session(
+    response: Response,
+    user_id: int,
+    role: str,
+    name: str,
+    doctor_id: Optional[int] = None,
+    specialization: Optional[str] = None,
+) -> None:
+    expires_at = int(time.time()) + session_signer.ttl
+    _set_cookie(response, session_signer.sign(user_id, role, name, doctor_id, specialization, expires_at), expires_at)
+    for cookie in LEGACY_COOKIES:
+        response.delete_cookie(cookie)
+
+
+def end_session(response: Response) -> None:
+    for cookie in (SESSION_COOKIE, *LEGACY_COOKIES):
+        response.delete_cookie(cookie)
+
+
+def current_identity(request: Request) -> Optional[WebIdentity]:
+    """The signed-in visitor, or None. Costs no query."""
+    value = request.cookies.get(SESSION_COOKIE)
+    if not value:
+        return None
+    verified = session_signer.verify(value)
+    if verified is None:
+        return None
+    identity, current_key = verified
+    if not current_key:
+        # Picked up by SessionCookieRoute once the page has rendered
+        request.state.resign_session = identity
+    return identity
+
+
+class SessionCookieRoute(APIRoute):
+    """APIRoute that re-signs session cookies made with a retired key."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def session_handler(request: Request) -> Response:
+            response = await handler(request)
+            identity: Optional[WebIdentity] = getattr(request.state, "resign_session", None)
+            prefix = f"{SESSION_COOKIE}=".encode("ascii")
+            if identity is not None and not any(
+                name == b"set-cookie" and value.startswith(prefix) for name, value in response.raw_headers
+            ):
+                value = session_signer.sign(*identity)
+                _set_cookie(response, value, identity.expires_at)
+            return response
+
+        return session_handler
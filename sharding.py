@@ -0,0 +1,203 @@
+"""Doctor-partitioned SQLite shards.
+
+Off by default. With APP_SHARDS=N the rows a doctor owns (slots,
+appointments, waitlist entries and matches, the availability summary) live in
+one of N extra SQLite files, picked by doctor_id % N, while users, profiles,
+policies and idempotency records stay in the global file. Each shard has its
+own writer lock, so bookings for doctors on different shards commit in
+parallel.
+
+Every shard connection ATTACHes the global file, so queries that join
+appointments to users or profiles run unchanged. A ShardedSession talks to the
+global file until a route_doctor() or route_row() call pins it to one shard.
+Row ids carry their shard: shard k hands out ids from k * SHARD_ID_STRIDE up,
+so a route with only an appointment, slot or waitlist entry id can still find
+its file. Reads that span doctors, such as a patient's appointments, go
+through fan_out(), which runs them on every shard in parallel.
+
+Each shard keeps its own cacheversion table, so a booking never writes to the
+global file; versions.data_versions adds them up across files.
+"""
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence, TypeVar
+from sqlalchemy import Engine, MetaData, create_engine, event
+from sqlmodel import Session, SQLModel
+from .database import SHARD_COUNT, SHARD_URL_TEMPLATE, engine, get_schema_version, upgrade_schema
+
+T = TypeVar("T")
+
+# Ids of shard k start at k * SHARD_ID_STRIDE, which leaves room for 2**40 rows
+# per table and shard and keeps ids exact as JSON numbers up to 8192 shards.
+SHARD_ID_STRIDE = 1 << 40
+
+# Tables that live in the shard files. cacheversion is in every file.
+DOCTOR_TABLES = ("slot", "appointment", "waitlistentry", "waitlistmatch", "doctoravailability")
+SHARD_TABLES = DOCTOR_TABLES + ("cacheversion",)
+
+# Name the global file is attached under on shard connections.
+GLOBAL_SCHEMA = "shared"
+
+
+def _shard_metadata() -> MetaData:
+    """Copies of the shard tables whose integer ids use AUTOINCREMENT.
+
+    AUTOINCREMENT makes SQLite continue from sqlite_sequence, which is how a
+    shard's id range gets its starting point. The other tables are copied
+    along only so foreign keys resolve when the DDL is rendered.
+    """
+    from . import models  # noqa: F401 - registers every table on SQLModel.metadata
+
+    metadata = MetaData()
+    for table in SQLModel.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        if table.name in SHARD_TABLES and "id" in copy.c and copy.c.id.primary_key:
+            copy.dialect_kwargs["sqlite_autoincrement"] = True
+    return metadata
+
+
+class ShardSet:
+    """The global database and its doctor shards."""
+
+    def __init__(self, bind: Engine, count: int = 0, url_template: str = SHARD_URL_TEMPLATE):
+        self.bind = bind
+        self.engines = [self._open(url_template.format(index=index)) for index in range(count)]
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _open(self, url: str) -> Engine:
+        shard = create_engine(url, echo=False)
+        path = self.bind.url.database
+
+        @event.listens_for(shard, "connect")
+        def _attach_global(dbapi_conn, connection_record):
+            dbapi_conn.execute(f"ATTACH DATABASE ? AS {GLOBAL_SCHEMA}", (path,))
+
+        return shard
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def all_engines(self) -> list[Engine]:
+        return [self.bind, *self.engines]
+
+    def shard_for(self, doctor_id: int) -> int:
+        return doctor_id % len(self.engines)
+
+    def shard_of(self, row_id: int) -> int:
+        index = row_id // SHARD_ID_STRIDE
+        # An id from no shard's range is looked up in shard 0 and simply not found
+        return index if 0 <= index < len(self.engines) else 0
+
+    def session(self, shard: Optional[int] = None) -> Session:
+        """A session for the app database; a plain one when sharding is off."""
+        if not self.engines:
+            return Session(self.bind)
+        return ShardedSession(self, shard)
+
+    def fan_out(self, read: Callable[[Session], Sequence[T]], key: Optional[Callable[[T], Any]] = None) -> list[T]:
+        """Run read against every shard in parallel and concatenate the results.
+
+        With key, each shard's result must already be sorted by it and the
+        results are merged in that order.
+        """
+        def run(index: int) -> Sequence[T]:
+            with self.session(index) as session:
+                return read(session)
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=len(self.engines), thread_name_prefix="shard-read")
+        results = list(self._pool.map(run, range(len(self.engines))))
+        if key is not None:
+            return list(heapq.merge(*results, key=key))
+        return [row for rows in results for row in rows]
+
+    def init(self) -> None:
+        """Create or upgrade the global file and every shard."""
+        with self.bind.begin() as conn:
+            if not self.engines:
+                upgrade_schema(conn, SQLModel.metadata)
+                return
+            global_tables = [t for t in SQLModel.metadata.sorted_tables if t.name not in DOCTOR_TABLES]
+            # Existing migrations only touch doctor tables, which the global file does not have
+            upgrade_schema(conn, SQLModel.metadata, global_tables, migrate=False)
+
+        metadata = _shard_metadata()
+        tables = [metadata.tables[name] for name in SHARD_TABLES]
+        for index, shard in enumerate(self.engines):
+            with shard.begin() as conn:
+                fresh = get_schema_version(conn) == 0
+                upgrade_schema(conn, metadata, tables)
+                if fresh and index:
+                    for table in tables:
+                        if table.dialect_options["sqlite"]["autoincrement"]:
+                            conn.exec_driver_sql(
+                                "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                                (table.name, index * SHARD_ID_STRIDE),
+                            )
+
+    def dispose(self, close: bool = True) -> None:
+        for bind in self.all_engines():
+            bind.dispose(close=close)
+        # Worker threads do not survive a fork
+        self._pool = None
+
+
+class ShardedSession(Session):
+    """Session that uses the global file until it is routed to one shard.
+
+    Once routed, every statement, including ones on global tables, goes
+    through the shard's connection, which sees the global file as attached.
+    A session cannot be routed to a second shard.
+    """
+
+    def __init__(self, shards: ShardSet, shard: Optional[int] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.shards = shards
+        self.shard = shard
+
+    def route(self, index: int) -> None:
+        if self.shard is not None and self.shard != index:
+            raise RuntimeError(f"Session is already routed to shard {self.shard}, cannot use shard {index}")
+        self.shard = index
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Any:
+        if self.shard is None:
+            return self.shards.bind
+        return self.shards.engines[self.shard]
+
+
+shards = ShardSet(engine, SHARD_COUNT)
+
+
+def open_session() -> Session:
+    """Session on the app database for scripts and background jobs."""
+    return shards.session()
+
+
+def route_doctor(session: Session, doctor_id: int) -> None:
+    """Pin session to the shard holding doctor_id's rows. No-op without sharding."""
+    if isinstance(session, ShardedSession):
+        session.route(session.shards.shard_for(doctor_id))
+
+
+def route_row(session: Session, row_id: int) -> None:
+    """Pin session to the shard that issued a slot, appointment or waitlist entry id."""
+    if isinstance(session, ShardedSession):
+        session.route(session.shards.shard_of(row_id))
+
+
+def owns(session: Session, doctor_id: int) -> bool:
+    """Whether doctor_id's rows live behind session (always true without sharding)."""
+    if not isinstance(session, ShardedSession) or session.shard is None:
+        return True
+    return session.shards.shard_for(doctor_id) == session.shard
+
+
+def fan_out(session: Session, read: Callable[[Session], Sequence[T]], key: Optional[Callable[[T], Any]] = None) -> list[T]:
+    """Run read on every shard (or once on session when sharding is off)."""
+    if not isinstance(session, ShardedSession):
+        return list(read(session))
+    return session.shards.fan_out(read, key)
@@ -0,0 +1,271 @@
+"""Binary snapshots of the availability matrix.
+
+A snapshot holds, for every doctor and every SNAPSHOT_BUCKET_SECONDS bucket of
+the coming SNAPSHOT_DAYS, whether the doctor has a free slot, a booked slot,
+both or neither there. It is meant for offline consumers such as the
+scheduling optimizer, which would otherwise rebuild the matrix from one
+GET /doctors/{id}/slots call per doctor. The file is little-endian:
+
+    header        HEADER: magic, format version, bucket seconds, start of
+                  bucket 0, bucket count, doctor count, the SLOTS data version
+                  and the export time (epoch seconds); 64 bytes
+    doctor ids    int64 per doctor, ascending
+    rows          per doctor, in id order: the free bitmap, then the booked
+                  bitmap, each row_bytes long (padded to 8 bytes)
+
+Bucket i is bit i % 8 of byte i // 8 (numpy.unpackbits(..., bitorder="little"))
+and starts at start + i * bucket_seconds. A bit is set when a slot of that
+state overlaps the bucket; slots without an end time fill one bucket. A
+group session that is partly booked sets both.
+
+The export streams Slot rows in (doctor_id, start_ts) order off the
+matching index, writes one doctor's rows at a time and renames the file into
+place once it is complete. AvailabilitySnapshot memory-maps a file and hands
+out memoryviews into it, so nothing is copied or parsed up front;
+numpy.frombuffer accepts them as they are.
+
+    python -m doctor_appointment.snapshots export availability.snap [--days 28] [--bucket-minutes 15]
+    python -m doctor_appointment.snapshots show availability.snap [--doctor 7]
+"""
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import ExitStack, closing
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, Sequence
+from sqlalchemy import Engine, func
+from sqlmodel import Session, select
+from .models import DoctorProfile, Slot, epoch_seconds, from_epoch
+from .sharding import shards
+from .versions import SLOTS, VersionWatcher, data_versions
+
+SNAPSHOT_DAYS = 28
+SNAPSHOT_BUCKET_SECONDS = 15 * 60
+
+# Slots that started this long before the window are not looked at, which
+# keeps the scan on the index range of the window.
+SNAPSHOT_MAX_SLOT_SECONDS = 24 * 3600
+
+SNAPSHOT_FETCH_ROWS = 10_000
+
+MAGIC = b"APPTAVL\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHIqIIqq16x")
+
+
+class SnapshotHeader(NamedTuple):
+    format_version: int
+    bucket_seconds: int
+    start_ts: int
+    bucket_count: int
+    doctor_count: int
+    data_version: int
+    exported_ts: int
+
+
+def row_bytes(bucket_count: int) -> int:
+    """Length of one bitmap, rounded up to whole 8-byte words."""
+    return (bucket_count + 63) // 64 * 8
+
+
+def _slot_rows(engines: Sequence[Engine], start_ts: int, end_ts: int) -> Iterator[Any]:
+    """(doctor_id, start_ts, end_ts, seats left, seats taken) for slots overlapping the window, by doctor and start."""
+    stmt = (
+        select(Slot.doctor_id, Slot.start_ts, Slot.end_ts, Slot.capacity - Slot.booked_count, Slot.booked_count)
+        .where(
+            Slot.start_ts >= start_ts - SNAPSHOT_MAX_SLOT_SECONDS,
+            Slot.start_ts < end_ts,
+            func.coalesce(Slot.end_ts, Slot.start_ts + 1) > start_ts,
+        )
+        .order_by(Slot.doctor_id, Slot.start_ts)
+    )
+    with ExitStack() as stack:
+        stmt = stmt.execution_options(yield_per=SNAPSHOT_FETCH_ROWS)
+        results = [stack.enter_context(engine.connect()).execute(stmt) for engine in engines]
+        # Each file holds whole doctors, so merging on doctor_id keeps every doctor's rows together
+        yield from heapq.merge(*results, key=itemgetter(0))
+
+
+def _mark(free: bytearray, booked: bytearray, slots: Iterable[Any], header: SnapshotHeader) -> None:
+    size = header.bucket_seconds
+    for _, start, end, seats_left, seats_taken in slots:
+        if end is None or end <= start:
+            end = start + 1
+        first = max((start - header.start_ts) // size, 0)
+        last = min((end - 1 - header.start_ts) // size, header.bucket_count - 1)
+        for bits, on in ((free, seats_left > 0), (booked, seats_taken > 0)):
+            if on:
+                for bucket in range(first, last + 1):
+                    bits[bucket >> 3] |= 1 << (bucket & 7)
+
+
+def export_snapshot(
+    path: str,
+    start: Optional[datetime] = None,
+    days: int = SNAPSHOT_DAYS,
+    bucket_seconds: int = SNAPSHOT_BUCKET_SECONDS,
+    bind: Optional[Engine] = None,
+    engines: Optional[Sequence[Engine]] = None,
+    watcher: VersionWatcher = data_versions,
+) -> SnapshotHeader:
+    """Write the matrix from start (default: now, rounded down to a bucket) to path."""
+    if bucket_seconds <= 0 or days <= 0:
+        raise ValueError("days and bucket_seconds must be positive")
+    bind = bind or shards.bind
+    engines = engines or shards.engines or [bind]
+    start_ts = epoch_seconds(start or datetime.now(timezone.utc)) // bucket_seconds * bucket_seconds
+    bucket_count = days * 86_400 // bucket_seconds
+    # Taken before reading, so a consumer comparing versions errs towards re-exporting
+    watcher.expire()
+    header = SnapshotHeader(
+        FORMAT_VERSION, bucket_seconds, start_ts, bucket_count, 0, watcher.get(SLOTS), int(time.time()),
+    )
+    with Session(bind) as session:
+        doctor_ids = array("q", session.exec(select(DoctorProfile.id).order_by(DoctorProfile.id)).all())
+    header = header._replace(doctor_count=len(doctor_ids))
+    width = row_bytes(bucket_count)
+
+    tmp = f"{path}.tmp"
+    with ExitStack() as stack:
+        f = stack.enter_context(open(tmp, "wb"))
+        f.write(HEADER.pack(MAGIC, header.format_version, 0, *header[1:]))
+        f.write(doctor_ids.tobytes())
+        rows = stack.enter_context(closing(_slot_rows(engines, start_ts, start_ts + bucket_count * bucket_seconds)))
+        groups = groupby(rows, key=itemgetter(0))
+        pending = next(groups, None)
+        for doctor_id in doctor_ids:
+            free, booked = bytearray(width), bytearray(width)
+            # Slots of doctors without a profile are skipped
+            while pending is not None and pending[0] <= doctor_id:
+                if pending[0] == doctor_id:
+                    _mark(free, booked, pending[1], header)
+                pending = next(groups, None)
+            f.write(free)
+            f.write(booked)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return header
+
+
+class AvailabilitySnapshot:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Views handed out by row() point into the mapping; release them before
+    close(), which otherwise raises BufferError.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.header = self._parse(path)
+        except Exception:
+            self._mmap.close()
+            raise
+        self.buffer = memoryview(self._mmap)
+        ids_end = HEADER.size + 8 * self.header.doctor_count
+        self.doctor_ids = self.buffer[HEADER.size:ids_end].cast("q")
+        self.row_bytes = row_bytes(self.header.bucket_count)
+        self._rows_at = ids_end
+
+    def _parse(self, path: str) -> SnapshotHeader:
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f"{path} is not an availability snapshot")
+        magic, version, _, *fields = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an availability snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        header = SnapshotHeader(version, *fields)
+        expected = HEADER.size + header.doctor_count * (8 + 2 * row_bytes(header.bucket_count))
+        if len(self._mmap) != expected:
+            raise ValueError(f"{path} is {len(self._mmap)} bytes, expected {expected}")
+        return header
+
+    def __enter__(self) -> "AvailabilitySnapshot":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.doctor_ids.release()
+        self.buffer.release()
+        self._mmap.close()
+
+    def bucket_start(self, bucket: int) -> datetime:
+        return from_epoch(self.header.start_ts + bucket * self.header.bucket_seconds)
+
+    def bucket_of(self, moment: datetime) -> int:
+        """Bucket containing moment; may fall outside [0, bucket_count)."""
+        return (epoch_seconds(moment) - self.header.start_ts) // self.header.bucket_seconds
+
+    def index(self, doctor_id: int) -> int:
+        i = bisect_left(self.doctor_ids, doctor_id)
+        if i == len(self.doctor_ids) or self.doctor_ids[i] != doctor_id:
+            raise KeyError(doctor_id)
+        return i
+
+    def row(self, doctor_id: int) -> tuple[memoryview, memoryview]:
+        """(free, booked) bitmaps of doctor_id, without copying."""
+        at = self._rows_at + 2 * self.row_bytes * self.index(doctor_id)
+        return self.buffer[at:at + self.row_bytes], self.buffer[at + self.row_bytes:at + 2 * self.row_bytes]
+
+    def state(self, doctor_id: int, bucket: int) -> tuple[bool, bool]:
+        """(has a free slot, has a booked slot) in bucket."""
+        if not 0 <= bucket < self.header.bucket_count:
+            raise IndexError(bucket)
+        at = self._rows_at + 2 * self.row_bytes * self.index(doctor_id) + (bucket >> 3)
+        bit = 1 << (bucket & 7)
+        return bool(self._mmap[at] & bit), bool(self._mmap[at + self.row_bytes] & bit)
+
+    def free_buckets(self, doctor_id: int) -> Iterator[int]:
+        free, _ = self.row(doctor_id)
+        try:
+            for offset, byte in enumerate(free):
+                while byte:
+                    low = byte & -byte
+                    yield offset * 8 + low.bit_length() - 1
+                    byte ^= low
+        finally:
+            free.release()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Export or inspect availability matrix snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a snapshot of the coming days")
+    export.add_argument("path")
+    export.add_argument("--days", type=int, default=SNAPSHOT_DAYS)
+    export.add_argument("--bucket-minutes", type=int, default=SNAPSHOT_BUCKET_SECONDS // 60)
+    show = commands.add_parser("show", help="print a snapshot's header, or one doctor's free buckets")
+    show.add_argument("path")
+    show.add_argument("--doctor", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        header = export_snapshot(args.path, days=args.days, bucket_seconds=args.bucket_minutes * 60)
+        print(f"{args.path}: {header.doctor_count} doctors x {header.bucket_count} buckets "
+              f"from {from_epoch(header.start_ts).isoformat()}, slots version {header.data_version}")
+        return
+    with AvailabilitySnapshot(args.path) as snapshot:
+        if args.doctor is None:
+            for name, value in snapshot.header._asdict().items():
+                print(f"{name:<16} {value}")
+            return
+        if args.doctor not in snapshot.doctor_ids:
+            parser.error(f"doctor {args.doctor} is not in the snapshot")
+        for bucket in snapshot.free_buckets(args.doctor):
+            print(snapshot.bucket_start(bucket).isoformat())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,37 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlmodel import Session, select
-from sqlalchemy.orm import selectinload
-from typing import Any, cast
+from sqlmodel import Session
 from datetime import datetime, timezone, timedelta
-from typing import Sequence
+from typing import Literal, Optional, Sequence
 from collections import defaultdict
+from urllib.parse import quote
 from .database import get_session
-from .models import User, DoctorProfile, Slot, Appointment
+from .models import Slot, Appointment, slot_time
 from .crud import create_user
+from .fragments import fragment_cache, TIME_SENSITIVE_TTL_SECONDS
+from .holds import slot_holds
+from .schemas import MAX_SLOT_CAPACITY
+from .seats import has_seat, release_seat, take_seat
+from .ratelimit import credential_retry_after
+from .waitlist import join_waitlist, match_new_slots, promote_waitlisted
+from .policies import can_cancel
+from .session_cookies import SessionCookieRoute, current_identity, end_session, start_session
+from .sharding import fan_out, route_doctor, route_row
+from .versions import bump_versions, data_versions, USERS, DOCTORS, SLOTS, APPOINTMENTS
+from .readmodels import (
+    DoctorCard, SlotRow, PatientAppointmentCard, DoctorAppointmentCard, PatientCard, CalendarBucket, Cursor,
+    doctor_cards, doctor_card, doctor_card_for_user, slot_rows, slot_window, slot_page,
+    patient_appointment_cards, doctor_appointment_window, doctor_appointment_page, doctor_patient_page,
+    slot_counts, calendar_buckets,
+)
 
-router = APIRouter(tags=["frontend"])
+router = APIRouter(tags=["frontend"], route_class=SessionCookieRoute)
+
+# The doctor dashboard only renders upcoming items within this many days;
+# history and the patient list are loaded on demand in pages of FRAGMENT_PAGE_SIZE.
+DASHBOARD_WINDOW_DAYS = 14
+MAX_DASHBOARD_WINDOW_DAYS = 90
+FRAGMENT_PAGE_SIZE = 50
 
 # HTML Templates will be inline for simplicity
 def get_home_page():
@@ -222,38 +243,41 @@ def get_home_page():
     </html>
     """
 
-def get_patient_dashboard(doctors: Sequence[DoctorProfile], appointments: Sequence[Appointment], user_name: str) -> str:
+def doctor_directory_html(doctors: Sequence[DoctorCard]) -> str:
     doctors_html = ""
     for doc in doctors:
         doctors_html += f"""
         <div class="doctor-card">
-            <h3>Dr. {doc.user.full_name if doc.user else ''}</h3>
+            <h3>Dr. {doc.full_name or ''}</h3>
             <p class="specialty">{doc.specialization}</p>
             <a href="/book-appointment/{doc.id}" class="book-btn">View Available Slots</a>
         </div>
         """
-    
+    return doctors_html
+
+def patient_appointments_html(appointments: Sequence[PatientAppointmentCard]) -> tuple[str, Optional[float]]:
+    """Render a patient's appointment cards as of the time they were queried.
+
+    Also returns how many seconds the markup stays correct: until the first
+    cancellation deadline still ahead passes. None means it never changes.
+    """
     appointments_html = ""
-    current_time = datetime.now(timezone.utc)
+    valid_for: Optional[float] = None
     
     for apt in appointments:
-        # Check if appointment can be cancelled (more than 10 hours away)
+        # The deadline comes from the doctor's cancellation policy (policies.py)
         can_cancel = False
         time_until = ""
-        if apt.slot and apt.slot.start_time:
-            # Make slot time timezone-aware if it isn't
-            slot_time = apt.slot.start_time
-            if slot_time.tzinfo is None:
-                slot_time = slot_time.replace(tzinfo=timezone.utc)
-            
-            time_diff = slot_time - current_time
-            hours_until = time_diff.total_seconds() / 3600
-            can_cancel = hours_until > 10
+        if apt.cancellable_until is not None and apt.seconds_to_deadline is not None:
+            can_cancel = apt.seconds_to_deadline > 0
             
             if can_cancel:
-                time_until = f"<span style='color: #4caf50; font-size: 0.9em;'>✓ Can cancel (>{int(hours_until)}h away)</span>"
+                next_change = float(apt.seconds_to_deadline)
+                valid_for = next_change if valid_for is None else min(valid_for, next_change)
+
+                time_until = f"<span style='color: #4caf50; font-size: 0.9em;'>✓ Can cancel until {apt.cancellable_until.strftime('%B %d at %I:%M %p')}</span>"
             else:
-                time_until = f"<span style='color: #f44336; font-size: 0.9em;'>✗ Cannot cancel (<10h away)</span>"
+                time_until = f"<span style='color: #f44336; font-size: 0.9em;'>✗ Cannot cancel (deadline was {apt.cancellable_until.strftime('%B %d at %I:%M %p')})</span>"
         
         cancel_button = ""
         if can_cancel and apt.id:
@@ -269,9 +293,9 @@ def get_patient_dashboard(doctors: Sequence[DoctorProfile], appointments: Sequen
         
         appointments_html += f"""
         <div class="appointment-card">
-            <h4>Dr. {apt.doctor.user.full_name if (apt.doctor and apt.doctor.user) else ''}</h4>
-            <p><strong>Specialization:</strong> {apt.doctor.specialization if apt.doctor else ''}</p>
-            <p><strong>Time:</strong> {apt.slot.start_time.strftime('%B %d, %Y at %I:%M %p') if apt.slot else 'TBD'}</p>
+            <h4>Dr. {apt.doctor_name or ''}</h4>
+            <p><strong>Specialization:</strong> {apt.specialization or ''}</p>
+            <p><strong>Time:</strong> {apt.start_time.strftime('%B %d, %Y at %I:%M %p') if apt.start_time else 'TBD'}</p>
             <p><strong>Reason:</strong> {apt.reason or 'General checkup'}</p>
             <p>{time_until}</p>
             {cancel_button}
@@ -281,6 +305,9 @@ def get_patient_dashboard(doctors: Sequence[DoctorProfile], appointments: Sequen
     if not appointments_html:
         appointments_html = "<p style='text-align: center; color: #888;'>No appointments yet. Book one below!</p>"
     
+    return appointments_html, valid_for
+
+def get_patient_dashboard(doctors_html: str, appointments_html: str, user_name: str) -> str:
     return f"""
     <!DOCTYPE html>
     <html>
@@ -401,9 +428,12 @@ def get_patient_dashboard(doctors: Sequence[DoctorProfile], appointments: Sequen
     </html>
     """
 
-def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
+def seats_left_text(slot: SlotRow) -> str:
+    return f"{slot.seats_left} of {slot.capacity} seats left"
+
+def get_booking_page(doctor: DoctorCard, slots: Sequence[SlotRow]) -> str:
     # Group slots by date
-    slots_by_date: dict[str, list[Slot]] = defaultdict(list)
+    slots_by_date: dict[str, list[SlotRow]] = defaultdict(list)
     available_count = 0
     
     for slot in slots:
@@ -438,7 +468,7 @@ def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
         </head>
         <body>
             <div class="container">
-                <h1 style="color: #667eea; margin-bottom: 20px;">Dr. {doctor.user.full_name if doctor.user else ''}</h1>
+                <h1 style="color: #667eea; margin-bottom: 20px;">Dr. {doctor.full_name or ''}</h1>
                 <p style="color: #888; padding: 40px;">⚠️ No available slots at the moment. Please check back later.</p>
                 <a href="/patient-dashboard" style="display: inline-block; padding: 12px 30px; background: #667eea; color: white; text-decoration: none; border-radius: 8px;">Back to Dashboard</a>
             </div>
@@ -446,9 +476,9 @@ def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
         </html>
         """
     
+    # slots arrive ordered by start time, so the dates and their slots already are
     date_sections = ""
-    for date_key in sorted(slots_by_date.keys()):
-        date_slots = sorted(slots_by_date[date_key], key=lambda s: s.start_time)
+    for date_key, date_slots in slots_by_date.items():
         date_display = date_slots[0].start_time.strftime('%B %d, %Y')
         
         slots_dropdown = "<option value=''>-- Select Time Slot --</option>"
@@ -458,6 +488,8 @@ def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
             time_display = f"{slot.start_time.strftime('%I:%M %p')} - {slot.end_time.strftime('%I:%M %p') if slot.end_time else 'TBD'}"
             if slot.is_booked:
                 slots_dropdown += f"<option value='{slot.id}' disabled style='color: #999; background: #f0f0f0;'>{time_display} (Booked)</option>"
+            elif slot.capacity > 1:
+                slots_dropdown += f"<option value='{slot.id}'>{time_display} (group, {seats_left_text(slot)})</option>"
             else:
                 slots_dropdown += f"<option value='{slot.id}'>{time_display}</option>"
         
@@ -557,7 +589,7 @@ def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
             <h1>Book an Appointment</h1>
             
             <div class="doctor-info">
-                <h2>Dr. {doctor.user.full_name if doctor.user else ''}</h2>
+                <h2>Dr. {doctor.full_name or ''}</h2>
                 <p style="opacity: 0.9; margin-top: 5px;">{doctor.specialization}</p>
             </div>
 
@@ -567,28 +599,55 @@ def get_booking_page(doctor: DoctorProfile, slots: Sequence[Slot]) -> str:
 
             {date_sections}
 
+            <div class="date-section">
+                <h3 style="color: #667eea; margin-bottom: 15px;">⏳ Join the Waitlist</h3>
+                <p style="color: #666; margin-bottom: 15px;">Nothing suitable free? If a booked slot in this window is cancelled, it is booked for you automatically.</p>
+                <form action="/join-waitlist/{doctor.id}" method="POST" class="booking-form">
+                    <div class="form-group">
+                        <label>From</label>
+                        <input type="datetime-local" name="window_start" required>
+                    </div>
+                    <div class="form-group">
+                        <label>Until</label>
+                        <input type="datetime-local" name="window_end" required>
+                    </div>
+                    <div class="form-group">
+                        <label>Reason for Visit (Optional):</label>
+                        <input type="text" name="reason" placeholder="e.g., General checkup, Follow-up visit">
+                    </div>
+                    <button type="submit" class="book-btn">Join Waitlist</button>
+                </form>
+            </div>
+
             <a href="/patient-dashboard" class="back-btn">← Back to Dashboard</a>
         </div>
     </body>
     </html>
     """
 
-def get_doctor_dashboard(
-    doctor: DoctorProfile,
-    slots: Sequence[Slot],
-    appointments: Sequence[Appointment],
-    user_name: str,
-) -> str:
+def cursor_param(start_time: datetime, row_id: int) -> str:
+    return quote(f"{start_time.isoformat()},{row_id}")
+
+def parse_cursor(value: str) -> Optional[Cursor]:
+    at, _, row_id = value.rpartition(",")
+    try:
+        return datetime.fromisoformat(at), int(row_id)
+    except ValueError:
+        return None
+
+def load_more_button(url: str, label: str) -> str:
+    return f"""
+        <button type="button" class="more-btn" data-url="{url}" onclick="loadMore(this)">{label}</button>
+        """
+
+def slot_items_html(slots: Sequence[SlotRow]) -> str:
     slots_html = ""
-    available_slots = 0
-    booked_slots = 0
-    
     for slot in slots:
         if slot.is_booked:
-            booked_slots += 1
             status_badge = "<span class='status booked'>🔴 Booked</span>"
+        elif slot.capacity > 1:
+            status_badge = f"<span class='status available'>🟢 {seats_left_text(slot)}</span>"
         else:
-            available_slots += 1
             status_badge = "<span class='status available'>🟢 Available</span>"
         
         duration = ""
@@ -602,11 +661,81 @@ def get_doctor_dashboard(
             {status_badge}
         </div>
         """
-    
+    return slots_html
+
+def appointment_items_html(appointments: Sequence[DoctorAppointmentCard]) -> str:
+    appointments_html = ""
+    for apt in appointments:
+        appointments_html += f"""
+        <div class="appointment-card">
+            <h4>{apt.patient_name or ''}</h4>
+            <p><strong>Time:</strong> {apt.start_time.strftime('%B %d, %Y at %I:%M %p') if apt.start_time else 'TBD'}</p>
+            <p><strong>Reason:</strong> {apt.reason or 'General checkup'}</p>
+            <p><strong>Contact:</strong> {apt.patient_email or ''}</p>
+        </div>
+        """
+    return appointments_html
+
+def patient_items_html(patients: Sequence[PatientCard]) -> str:
+    patients_html = ""
+    for patient in patients:
+        patients_html += f"""
+        <div class="appointment-card">
+            <h4>{patient.full_name or ''}</h4>
+            <p><strong>Contact:</strong> {patient.email}</p>
+        </div>
+        """
+    return patients_html
+
+def slot_page_html(slots: Sequence[SlotRow], direction: str) -> str:
+    """One fragment page; slots holds up to FRAGMENT_PAGE_SIZE + 1 rows, the extra one signalling more."""
+    page = slots[:FRAGMENT_PAGE_SIZE]
+    html = slot_items_html(page) or "<p style='color: #888;'>No more slots.</p>"
+    if len(slots) > FRAGMENT_PAGE_SIZE:
+        last = page[-1]
+        html += load_more_button(f"/doctor-dashboard/slots?direction={direction}&cursor={cursor_param(last.start_time, last.id)}", "Load more slots")
+    return html
+
+def appointment_page_html(appointments: Sequence[DoctorAppointmentCard], direction: str) -> str:
+    page = appointments[:FRAGMENT_PAGE_SIZE]
+    html = appointment_items_html(page) or "<p style='color: #888;'>No more appointments.</p>"
+    if len(appointments) > FRAGMENT_PAGE_SIZE and page[-1].start_time:
+        last = page[-1]
+        html += load_more_button(f"/doctor-dashboard/appointments?direction={direction}&cursor={cursor_param(last.start_time, last.id)}", "Load more appointments")
+    return html
+
+def patient_page_html(patients: Sequence[PatientCard]) -> str:
+    page = patients[:FRAGMENT_PAGE_SIZE]
+    html = patient_items_html(page) or "<p style='color: #888;'>No more patients.</p>"
+    if len(patients) > FRAGMENT_PAGE_SIZE:
+        html += load_more_button(f"/doctor-dashboard/patients?after={page[-1].id}", "Load more patients")
+    return html
+
+def get_doctor_dashboard(
+    doctor: DoctorCard,
+    slots: Sequence[SlotRow],
+    appointments: Sequence[DoctorAppointmentCard],
+    user_name: str,
+    slot_totals: tuple[int, int],
+    calendar: Sequence[CalendarBucket],
+    window_start: datetime,
+    window_days: int,
+) -> str:
+    """Render the dashboard for the upcoming window only.
+
+    slots and appointments cover [window_start, window_start + window_days);
+    everything else is fetched page by page through the /doctor-dashboard/*
+    fragment endpoints when the doctor asks for it.
+    """
+    available_slots, booked_slots = slot_totals
+    window_end = window_start + timedelta(days=window_days)
+    past_cursor = cursor_param(window_start, 0)
+    later_cursor = cursor_param(window_end, 0)
+
+    slots_html = slot_items_html(slots)
     if not slots_html:
-        slots_html = "<p style='text-align: center; color: #888;'>No slots created yet.</p>"
-    else:
-        slots_html = f"""
+        slots_html = f"<p style='text-align: center; color: #888;'>No slots in the next {window_days} days.</p>"
+    slots_html = f"""
         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin-bottom: 20px;">
             <div style="background: linear-gradient(135deg, #4caf50, #45a049); color: white; padding: 20px; border-radius: 10px; text-align: center;">
                 <div style="font-size: 2em; font-weight: bold;">{available_slots}</div>
@@ -617,40 +746,47 @@ def get_doctor_dashboard(
                 <div>Booked Slots</div>
             </div>
         </div>
-        """ + slots_html
+        """ + slots_html + f"""
+        <div>{load_more_button(f"/doctor-dashboard/slots?direction=later&cursor={later_cursor}", "Show later slots")}</div>
+        <h3 class="history-title">Past slots</h3>
+        <div>{load_more_button(f"/doctor-dashboard/slots?direction=past&cursor={past_cursor}", "Show past slots")}</div>
+        """
 
-    # Build a unique patient list from appointments
-    patients_seen: set[int] = set()
-    patients_html = ""
-    for apt in appointments:
-        if not apt.patient or apt.patient.id is None:
-            continue
-        if apt.patient.id in patients_seen:
-            continue
-        patients_seen.add(apt.patient.id)
-        patients_html += f"""
-        <div class="appointment-card">
-            <h4>{apt.patient.full_name or ''}</h4>
-            <p><strong>Contact:</strong> {apt.patient.email}</p>
-        </div>
+    calendar_html = ""
+    for bucket in calendar:
+        hours = ""
+        if bucket.first_start and bucket.last_end:
+            hours = f"{bucket.first_start.strftime('%I:%M %p')} – {bucket.last_end.strftime('%I:%M %p')}"
+        calendar_html += f"""
+            <tr>
+                <td>{bucket.period_start.strftime('%a, %b %d')}</td>
+                <td>{hours}</td>
+                <td>{bucket.total}</td>
+                <td class="free">{bucket.free}</td>
+                <td class="booked">{bucket.booked}</td>
+            </tr>
         """
 
-    if not patients_html:
-        patients_html = "<p style='text-align: center; color: #888;'>No patients yet.</p>"
-    
-    appointments_html = ""
-    for apt in appointments:
-        appointments_html += f"""
-        <div class="appointment-card">
-            <h4>{apt.patient.full_name if apt.patient else ''}</h4>
-            <p><strong>Time:</strong> {apt.slot.start_time.strftime('%B %d, %Y at %I:%M %p') if apt.slot else 'TBD'}</p>
-            <p><strong>Reason:</strong> {apt.reason or 'General checkup'}</p>
-            <p><strong>Contact:</strong> {apt.patient.email if apt.patient else ''}</p>
-        </div>
+    if not calendar_html:
+        calendar_html = f"<p style='text-align: center; color: #888;'>No slots in the next {window_days} days.</p>"
+    else:
+        calendar_html = f"""
+        <table class="calendar-table">
+            <tr><th>Day</th><th>Hours</th><th>Slots</th><th>Free</th><th>Booked</th></tr>
+            {calendar_html}
+        </table>
         """
-    
+
+    patients_html = f"<div>{load_more_button('/doctor-dashboard/patients?after=0', 'Show patients')}</div>"
+
+    appointments_html = appointment_items_html(appointments)
     if not appointments_html:
-        appointments_html = "<p style='text-align: center; color: #888;'>No appointments booked yet.</p>"
+        appointments_html = f"<p style='text-align: center; color: #888;'>No appointments in the next {window_days} days.</p>"
+    appointments_html += f"""
+        <div>{load_more_button(f"/doctor-dashboard/appointments?direction=later&cursor={later_cursor}", "Show later appointments")}</div>
+        <h3 class="history-title">Earlier appointments</h3>
+        <div>{load_more_button(f"/doctor-dashboard/appointments?direction=past&cursor={past_cursor}", "Show earlier appointments")}</div>
+        """
     
     return f"""
     <!DOCTYPE html>
@@ -749,6 +885,18 @@ def get_doctor_dashboard(
                 background: #f44336;
                 color: white;
             }}
+            .calendar-table {{
+                width: 100%;
+                border-collapse: collapse;
+            }}
+            .calendar-table th, .calendar-table td {{
+                padding: 10px;
+                border-bottom: 1px solid #e0e0e0;
+                text-align: left;
+            }}
+            .calendar-table th {{ color: #555; }}
+            .calendar-table .free {{ color: #4caf50; font-weight: 600; }}
+            .calendar-table .booked {{ color: #f44336; font-weight: 600; }}
             .appointment-card {{
                 border-left: 4px solid #11998e;
                 padding: 15px;
@@ -764,7 +912,36 @@ def get_doctor_dashboard(
                 color: #555;
                 margin-bottom: 5px;
             }}
+            .history-title {{
+                color: #555;
+                margin: 20px 0 10px;
+            }}
+            .more-btn {{
+                padding: 10px 20px;
+                margin-top: 10px;
+                background: white;
+                color: #11998e;
+                border: 2px solid #11998e;
+                border-radius: 8px;
+                cursor: pointer;
+                font-weight: 600;
+            }}
+            .more-btn:hover {{
+                background: #11998e;
+                color: white;
+            }}
         </style>
+        <script>
+            async function loadMore(button) {{
+                button.disabled = true;
+                const response = await fetch(button.dataset.url, {{ credentials: "same-origin" }});
+                if (!response.ok) {{
+                    button.disabled = false;
+                    return;
+                }}
+                button.outerHTML = await response.text();
+            }}
+        </script>
     </head>
     <body>
         <div class="header">
@@ -788,11 +965,20 @@ def get_doctor_dashboard(
                         <label>End Date & Time</label>
                         <input type="datetime-local" name="end_time" required>
                     </div>
+                    <div class="form-group">
+                        <label>Seats (more than 1 for a group session)</label>
+                        <input type="number" name="capacity" value="1" min="1" max="{MAX_SLOT_CAPACITY}" required>
+                    </div>
                     <button type="submit" class="add-btn">Generate 20-Min Slots</button>
                 </div>
             </form>
         </div>
 
+        <div class="section">
+            <h2>📆 Next {window_days} Days</h2>
+            {calendar_html}
+        </div>
+
         <div class="section">
             <h2>📅 Your Time Slots</h2>
             {slots_html}
@@ -804,25 +990,36 @@ def get_doctor_dashboard(
         </div>
 
         <div class="section">
-            <h2>👥 Your Appointments</h2>
+            <h2>👥 Upcoming Appointments</h2>
             {appointments_html}
         </div>
     </body>
     </html>
     """
 
+def too_many_attempts(retry_after: int) -> HTMLResponse:
+    return HTMLResponse(
+        get_home_page() + "<script>alert('Too many attempts. Please wait a moment and try again.');</script>",
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
 @router.get("/", response_class=HTMLResponse)
 async def home():
     return get_home_page()
 
 @router.post("/register-patient")
 async def register_patient(
+    request: Request,
     full_name: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
     session: Session = Depends(get_session)
 ):
     from .auth import get_user_by_email
+    retry_after = credential_retry_after(request, email)
+    if retry_after:
+        return too_many_attempts(retry_after)
     if get_user_by_email(session, email):
         return HTMLResponse(get_home_page() + "<script>alert('Email already registered!');</script>")
     
@@ -833,12 +1030,12 @@ async def register_patient(
         return HTMLResponse(get_home_page() + f"<script>alert('{msg}');</script>")
     
     response = RedirectResponse(url="/patient-dashboard", status_code=303)
-    response.set_cookie(key="user_id", value=str(user.id))
-    response.set_cookie(key="user_role", value="patient")
+    start_session(response, int(user.id or 0), "patient", user.full_name or "")
     return response
 
 @router.post("/register-doctor")
 async def register_doctor(
+    request: Request,
     full_name: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
@@ -846,28 +1043,37 @@ async def register_doctor(
     session: Session = Depends(get_session)
 ):
     from .auth import get_user_by_email
+    retry_after = credential_retry_after(request, email)
+    if retry_after:
+        return too_many_attempts(retry_after)
     if get_user_by_email(session, email):
         return HTMLResponse(get_home_page() + "<script>alert('Email already registered!');</script>")
     
     try:
-        user, _ = create_user(session, email, password, full_name, "doctor", specialization)
+        user, profile = create_user(session, email, password, full_name, "doctor", specialization)
     except ValueError as e:
         msg = str(e).replace("'", "\\'")
         return HTMLResponse(get_home_page() + f"<script>alert('{msg}');</script>")
     
+    if profile is None:
+        return HTMLResponse(get_home_page() + "<script>alert('Could not create your doctor profile. Please try again.');</script>")
+
     response = RedirectResponse(url="/doctor-dashboard", status_code=303)
-    response.set_cookie(key="user_id", value=str(user.id))
-    response.set_cookie(key="user_role", value="doctor")
+    start_session(response, int(user.id or 0), "doctor", user.full_name or "", profile.id, profile.specialization)
     return response
 
 @router.post("/login")
 async def login(
+    request: Request,
     email: str = Form(...),
     password: str = Form(...),
     role: str = Form(...),
     session: Session = Depends(get_session)
 ):
     from .auth import authenticate_user, get_user_by_email
+    retry_after = credential_retry_after(request, email)
+    if retry_after:
+        return too_many_attempts(retry_after)
     
     # Debug: Check if user exists
     existing_user = get_user_by_email(session, email)
@@ -884,68 +1090,90 @@ async def login(
     if not user:
         return HTMLResponse(get_home_page() + "<script>alert('Incorrect password. Please try again.');</script>")
     
+    # The profile is looked up once here; pages read it from the session cookie
+    doctor = doctor_card_for_user(session, int(user.id or 0)) if role == "doctor" else None
     redirect_url = "/patient-dashboard" if role == "patient" else "/doctor-dashboard"
     response = RedirectResponse(url=redirect_url, status_code=303)
-    response.set_cookie(key="user_id", value=str(user.id))
-    response.set_cookie(key="user_role", value=role)
+    start_session(
+        response, int(user.id or 0), role, user.full_name or "",
+        doctor.id if doctor else None, doctor.specialization if doctor else None,
+    )
     return response
 
 @router.get("/patient-dashboard", response_class=HTMLResponse)
 async def patient_dashboard(request: Request, session: Session = Depends(get_session)):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
-        return RedirectResponse(url="/", status_code=303)
-    
-    user = session.get(User, int(user_id))
+    user = current_identity(request)
     if not user:
         return RedirectResponse(url="/", status_code=303)
     
-    # Get all doctors with their user info
-    doctors = session.exec(select(DoctorProfile)).all()
+    versions = data_versions.snapshot()
+    
+    # The doctor directory is the same for everyone
+    doctors_html = fragment_cache.get_or_render(
+        ("doctor-directory", versions.get(USERS, 0), versions.get(DOCTORS, 0)),
+        lambda: (doctor_directory_html(doctor_cards(session)), None),
+    )
     
-    # Get user's appointments
-    stmt = select(Appointment).where(Appointment.patient_id == int(user_id))
-    appointments = session.exec(stmt).all()
+    def render_appointments() -> tuple[str, Optional[float]]:
+        now = datetime.now(timezone.utc)
+        html, valid_for = patient_appointments_html(fan_out(session, lambda s: patient_appointment_cards(s, user.user_id, now)))
+        if valid_for is None:
+            return html, TIME_SENSITIVE_TTL_SECONDS
+        return html, min(valid_for, TIME_SENSITIVE_TTL_SECONDS)
     
-    return get_patient_dashboard(doctors, appointments, user.full_name or "")
+    appointments_html = fragment_cache.get_or_render(
+        ("patient-appointments", user.user_id, versions.get(APPOINTMENTS, 0), versions.get(DOCTORS, 0)),
+        render_appointments,
+    )
+    
+    return get_patient_dashboard(doctors_html, appointments_html, user.name)
 
 @router.get("/book-appointment/{doctor_id}", response_class=HTMLResponse)
 async def book_appointment_page(doctor_id: int, request: Request, session: Session = Depends(get_session)):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+    if not current_identity(request):
         return RedirectResponse(url="/", status_code=303)
     
-    doctor = session.get(DoctorProfile, doctor_id)
+    doctor = doctor_card(session, doctor_id)
     if not doctor:
         return RedirectResponse(url="/patient-dashboard", status_code=303)
     
     # Get ALL slots (both available and booked) to show in dropdown
-    stmt = select(Slot).where(Slot.doctor_id == doctor_id)
-    slots = session.exec(stmt).all()
-    # Sort in Python since order_by with datetime can have issues
-    slots = sorted(slots, key=lambda s: s.start_time)
+    route_doctor(session, doctor_id)
+    slots = slot_rows(session, doctor_id)
     
     return get_booking_page(doctor, slots)
 
-@router.post("/confirm-booking-dropdown")
-async def confirm_booking_dropdown(
+@router.post("/join-waitlist/{doctor_id}")
+async def join_waitlist_form(
+    doctor_id: int,
     request: Request,
-    slot_id: int = Form(...),
-    reason: str = Form(""),
+    window_start: str = Form(...),
+    window_end: str = Form(...),
+    reason: str = Form(None),
     session: Session = Depends(get_session)
 ):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+    user = current_identity(request)
+    if not user or user.role != "patient":
         return RedirectResponse(url="/", status_code=303)
-    
-    # Fetch the slot with race condition protection
-    slot = session.get(Slot, slot_id)
-    if not slot:
+
+    if not doctor_card(session, doctor_id):
         return RedirectResponse(url="/patient-dashboard", status_code=303)
-    
-    # Check if slot is already booked (race condition protection)
-    if slot.is_booked:
-        return HTMLResponse(content="""
+
+    try:
+        route_doctor(session, doctor_id)
+        join_waitlist(
+            session, doctor_id, user.user_id,
+            datetime.fromisoformat(window_start), datetime.fromisoformat(window_end),
+            reason if reason else None,
+        )
+    except ValueError as e:
+        msg = str(e).replace("'", "\\'")
+        return HTMLResponse(f"<script>alert('{msg}'); window.location.href='/book-appointment/{doctor_id}';</script>")
+
+    return HTMLResponse("<script>alert('You are on the waitlist. We will book a matching slot for you if one frees up.'); window.location.href='/patient-dashboard';</script>")
+
+def booking_failed_page() -> HTMLResponse:
+    return HTMLResponse(content="""
         <!DOCTYPE html>
         <html>
         <head>
@@ -967,19 +1195,52 @@ async def confirm_booking_dropdown(
         </body>
         </html>
         """)
+
+@router.post("/confirm-booking-dropdown")
+async def confirm_booking_dropdown(
+    request: Request,
+    slot_id: int = Form(...),
+    reason: str = Form(""),
+    session: Session = Depends(get_session)
+):
+    user = current_identity(request)
+    if not user:
+        return RedirectResponse(url="/", status_code=303)
     
-    # Create appointment and mark slot as booked
-    appointment = Appointment(
-        doctor_id=slot.doctor_id,
-        patient_id=int(user_id),
-        slot_id=slot_id,
-        reason=reason or None
-    )
-    slot.is_booked = True
+    # Fetch the slot with race condition protection
+    route_row(session, slot_id)
+    slot = session.get(Slot, slot_id)
+    if not slot:
+        return RedirectResponse(url="/patient-dashboard", status_code=303)
     
-    session.add(appointment)
-    session.add(slot)
-    session.commit()
+    # Check if slot is already booked or held by someone else (race condition protection).
+    # Group sessions are not held; their seats are only counted.
+    hold = None
+    if slot.capacity == 1:
+        hold = None if slot.is_booked else slot_holds.acquire(slot_id, slot.doctor_id, user.user_id)
+        if hold is None:
+            return booking_failed_page()
+    elif has_seat(session, slot_id, user.user_id):
+        return booking_failed_page()
+    
+    try:
+        # Create appointment and take a seat
+        if not take_seat(session, slot_id):
+            session.rollback()
+            return booking_failed_page()
+        appointment = Appointment(
+            doctor_id=slot.doctor_id,
+            patient_id=user.user_id,
+            slot_id=slot_id,
+            reason=reason or None
+        )
+        
+        session.add(appointment)
+        bump_versions(session, SLOTS, APPOINTMENTS)
+        session.commit()
+    finally:
+        if hold is not None:
+            slot_holds.release(hold.hold_id)
     
     return RedirectResponse(url="/patient-dashboard", status_code=303)
 
@@ -990,95 +1251,154 @@ async def confirm_booking(
     reason: str = Form(""),
     session: Session = Depends(get_session)
 ):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+    user = current_identity(request)
+    if not user:
         return RedirectResponse(url="/", status_code=303)
     
+    route_row(session, slot_id)
     slot = session.get(Slot, slot_id)
-    if not slot or slot.is_booked:
-        return HTMLResponse("<script>alert('Slot not available!'); window.location='/patient-dashboard';</script>")
-    
-    appointment = Appointment(
-        doctor_id=slot.doctor_id,
-        patient_id=int(user_id),
-        slot_id=slot_id,
-        reason=reason if reason else None
-    )
-    slot.is_booked = True
+    not_available = HTMLResponse("<script>alert('Slot not available!'); window.location='/patient-dashboard';</script>")
+    if not slot:
+        return not_available
+    hold = None
+    if slot.capacity == 1:
+        hold = None if slot.is_booked else slot_holds.acquire(slot_id, slot.doctor_id, user.user_id)
+        if hold is None:
+            return not_available
+    elif has_seat(session, slot_id, user.user_id):
+        return not_available
     
-    session.add(appointment)
-    session.add(slot)
-    session.commit()
+    try:
+        if not take_seat(session, slot_id):
+            session.rollback()
+            return not_available
+        appointment = Appointment(
+            doctor_id=slot.doctor_id,
+            patient_id=user.user_id,
+            slot_id=slot_id,
+            reason=reason if reason else None
+        )
+        
+        session.add(appointment)
+        bump_versions(session, SLOTS, APPOINTMENTS)
+        session.commit()
+    finally:
+        if hold is not None:
+            slot_holds.release(hold.hold_id)
     
     return RedirectResponse(url="/patient-dashboard", status_code=303)
 
+def dashboard_doctor(request: Request, session: Session) -> Optional[DoctorCard]:
+    user = current_identity(request)
+    if not user or user.role != "doctor" or user.doctor_id is None:
+        return None
+    route_doctor(session, user.doctor_id)
+    return DoctorCard(user.doctor_id, user.specialization or "", user.name)
+
 @router.get("/doctor-dashboard", response_class=HTMLResponse)
-async def doctor_dashboard(request: Request, session: Session = Depends(get_session)):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+async def doctor_dashboard(
+    request: Request,
+    days: int = DASHBOARD_WINDOW_DAYS,
+    session: Session = Depends(get_session)
+):
+    doctor = dashboard_doctor(request, session)
+    if not doctor:
         return RedirectResponse(url="/", status_code=303)
 
-    if request.cookies.get("user_role") != "doctor":
-        return RedirectResponse(url="/", status_code=303)
+    days = min(max(days, 1), MAX_DASHBOARD_WINDOW_DAYS)
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time())
+    window_end = today + timedelta(days=days)
 
-    user = session.get(User, int(user_id))
+    slots = slot_window(session, doctor.id, today, window_end)
+    appointments = doctor_appointment_window(session, doctor.id, today, window_end)
+    calendar = calendar_buckets(session, doctor.id, today, window_end)
 
-    stmt = select(DoctorProfile).where(DoctorProfile.user_id == int(user_id))
-    doctor = session.exec(stmt).first()
+    return get_doctor_dashboard(
+        doctor, slots, appointments, doctor.full_name or "",
+        slot_counts(session, doctor.id), calendar, today, days,
+    )
+
+@router.get("/doctor-dashboard/slots", response_class=HTMLResponse)
+async def doctor_dashboard_slots(
+    request: Request,
+    cursor: str,
+    direction: Literal["past", "later"] = "later",
+    session: Session = Depends(get_session)
+):
+    doctor = dashboard_doctor(request, session)
     if not doctor:
-        return RedirectResponse(url="/", status_code=303)
+        return HTMLResponse("", status_code=401)
+    after = parse_cursor(cursor)
+    if after is None:
+        return HTMLResponse("", status_code=400)
 
-    stmt = select(Slot).where(Slot.doctor_id == doctor.id)
-    slots = session.exec(stmt).all()
+    slots = slot_page(session, doctor.id, after, FRAGMENT_PAGE_SIZE + 1, descending=direction == "past")
+    return slot_page_html(slots, direction)
 
-    stmt = (
-        select(Appointment)
-        .where(Appointment.doctor_id == doctor.id)
-        .options(
-            selectinload(cast(Any, Appointment.patient)),
-            selectinload(cast(Any, Appointment.slot)),
-        )
-    )
-    appointments = session.exec(stmt).all()
+@router.get("/doctor-dashboard/appointments", response_class=HTMLResponse)
+async def doctor_dashboard_appointments(
+    request: Request,
+    cursor: str,
+    direction: Literal["past", "later"] = "past",
+    session: Session = Depends(get_session)
+):
+    doctor = dashboard_doctor(request, session)
+    if not doctor:
+        return HTMLResponse("", status_code=401)
+    after = parse_cursor(cursor)
+    if after is None:
+        return HTMLResponse("", status_code=400)
+
+    appointments = doctor_appointment_page(session, doctor.id, after, FRAGMENT_PAGE_SIZE + 1, descending=direction == "past")
+    return appointment_page_html(appointments, direction)
 
-    return get_doctor_dashboard(doctor, slots, appointments, (user.full_name or "") if user else "")
+@router.get("/doctor-dashboard/patients", response_class=HTMLResponse)
+async def doctor_dashboard_patients(
+    request: Request,
+    after: int = 0,
+    session: Session = Depends(get_session)
+):
+    doctor = dashboard_doctor(request, session)
+    if not doctor:
+        return HTMLResponse("", status_code=401)
+
+    return patient_page_html(doctor_patient_page(session, doctor.id, after, FRAGMENT_PAGE_SIZE + 1))
 
 @router.post("/add-slot")
 async def add_slot(
     request: Request,
     start_time: str = Form(...),
     end_time: str = Form(...),
+    capacity: int = Form(1),
     session: Session = Depends(get_session)
 ):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
-        return RedirectResponse(url="/", status_code=303)
-
-    stmt = select(DoctorProfile).where(DoctorProfile.user_id == int(user_id))
-    doctor = session.exec(stmt).first()
+    doctor = dashboard_doctor(request, session)
     if not doctor:
         return RedirectResponse(url="/", status_code=303)
+    capacity = min(max(capacity, 1), MAX_SLOT_CAPACITY)
 
-    if doctor.id is None:
-        return RedirectResponse(url="/", status_code=303)
-
-    start_dt = datetime.fromisoformat(start_time)
-    end_dt = datetime.fromisoformat(end_time)
+    start_dt = slot_time(datetime.fromisoformat(start_time))
+    end_dt = slot_time(datetime.fromisoformat(end_time))
 
     # Generate 20-minute slots automatically
     current: datetime = start_dt
     slots_created = 0
+    new_slots: list[Slot] = []
     
     while current < end_dt:
         slot_end = current + timedelta(minutes=20)
         if slot_end > end_dt:
             break  # Don't create partial slots
         
-        slot = Slot(doctor_id=doctor.id, start_time=current, end_time=slot_end)
+        slot = Slot(doctor_id=doctor.id, start_time=current, end_time=slot_end, capacity=capacity)
         session.add(slot)
+        new_slots.append(slot)
         current = slot_end
         slots_created += 1
     
+    session.flush()
+    match_new_slots(session, new_slots)
+    bump_versions(session, SLOTS)
     session.commit()
 
     return RedirectResponse(url="/doctor-dashboard", status_code=303)
@@ -1089,11 +1409,12 @@ async def cancel_appointment(
     request: Request,
     session: Session = Depends(get_session)
 ):
-    user_id = request.cookies.get("user_id")
-    if not user_id:
+    user = current_identity(request)
+    if not user:
         return RedirectResponse(url="/", status_code=303)
     
     # Get the appointment
+    route_row(session, appointment_id)
     appointment = session.get(Appointment, appointment_id)
     if not appointment:
         return HTMLResponse("""
@@ -1108,7 +1429,7 @@ async def cancel_appointment(
         """)
     
     # Verify the appointment belongs to this patient
-    if appointment.patient_id != int(user_id):
+    if appointment.patient_id != user.user_id:
         return HTMLResponse("""
         <!DOCTYPE html>
         <html>
@@ -1121,74 +1442,74 @@ async def cancel_appointment(
         </html>
         """)
     
-    # Check if appointment is more than 10 hours away
-    if appointment.slot:
-        slot_time = appointment.slot.start_time
-        if slot_time.tzinfo is None:
-            slot_time = slot_time.replace(tzinfo=timezone.utc)
-        
-        current_time = datetime.now(timezone.utc)
-        time_diff = slot_time - current_time
-        hours_until = time_diff.total_seconds() / 3600
-        
-        if hours_until <= 10:
-            return HTMLResponse(f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Cannot Cancel</title>
-                <style>
-                    body {{ font-family: Arial; display: flex; justify-content: center; align-items: center; 
-                           height: 100vh; background: #f5f7fa; margin: 0; }}
-                    .error-box {{ background: white; padding: 40px; border-radius: 15px; 
-                                 box-shadow: 0 10px 40px rgba(0,0,0,0.1); text-align: center; max-width: 500px; }}
-                    h1 {{ color: #f44336; margin-bottom: 20px; }}
-                    p {{ color: #555; margin-bottom: 30px; line-height: 1.6; }}
-                    a {{ background: #667eea; color: white; padding: 12px 30px; text-decoration: none; 
-                        border-radius: 8px; display: inline-block; }}
-                </style>
-            </head>
-            <body>
-                <div class="error-box">
-                    <h1>⚠️ Cannot Cancel Appointment</h1>
-                    <p>Sorry, you can only cancel appointments that are more than 10 hours away.</p>
-                    <p>Your appointment is in <strong>{hours_until:.1f} hours</strong>.</p>
-                    <p>Please contact the doctor's office directly if you need to cancel.</p>
-                    <a href="/patient-dashboard">Back to Dashboard</a>
-                </div>
-            </body>
-            </html>
-            """)
-        
-        # Free up the slot
-        slot = appointment.slot
-        slot.is_booked = False
-        session.add(slot)
+    # The deadline was fixed by the doctor's cancellation policy at booking time
+    deadline = appointment.cancellable_until
+    if deadline is not None and not can_cancel(appointment):
+        return HTMLResponse(f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Cannot Cancel</title>
+            <style>
+                body {{ font-family: Arial; display: flex; justify-content: center; align-items: center; 
+                       height: 100vh; background: #f5f7fa; margin: 0; }}
+                .error-box {{ background: white; padding: 40px; border-radius: 15px; 
+                             box-shadow: 0 10px 40px rgba(0,0,0,0.1); text-align: center; max-width: 500px; }}
+                h1 {{ color: #f44336; margin-bottom: 20px; }}
+                p {{ color: #555; margin-bottom: 30px; line-height: 1.6; }}
+                a {{ background: #667eea; color: white; padding: 12px 30px; text-decoration: none; 
+                    border-radius: 8px; display: inline-block; }}
+            </style>
+        </head>
+        <body>
+            <div class="error-box">
+                <h1>⚠️ Cannot Cancel Appointment</h1>
+                <p>Sorry, this doctor's cancellation policy only allowed cancelling this appointment until
+                   <strong>{deadline.strftime('%B %d, %Y at %I:%M %p')} UTC</strong>.</p>
+                <p>Please contact the doctor's office directly if you need to cancel.</p>
+                <a href="/patient-dashboard">Back to Dashboard</a>
+            </div>
+        </body>
+        </html>
+        """)
     
     # Delete the appointment
+    slot = appointment.slot
     session.delete(appointment)
+
+    # Free up the slot, or hand it straight to the next patient on the waitlist
+    promoted = None
+    if slot and slot.id is not None:
+        release_seat(session, slot.id)
+        promoted = promote_waitlisted(session, slot)
+
+    bump_versions(session, SLOTS, APPOINTMENTS)
     session.commit()
+
+    freed_message = "The time slot has been freed for other patients."
+    if promoted is not None:
+        freed_message = "The time slot has been given to the next patient on the waitlist."
     
     # Redirect back with success message
-    return HTMLResponse("""
+    return HTMLResponse(f"""
     <!DOCTYPE html>
     <html>
     <head>
         <title>Appointment Cancelled</title>
         <meta http-equiv="refresh" content="2;url=/patient-dashboard">
         <style>
-            body { font-family: Arial; display: flex; justify-content: center; align-items: center; 
-                   height: 100vh; background: #f5f7fa; margin: 0; }
-            .success-box { background: white; padding: 40px; border-radius: 15px; 
-                          box-shadow: 0 10px 40px rgba(0,0,0,0.1); text-align: center; }
-            h1 { color: #4caf50; margin-bottom: 20px; }
-            p { color: #555; }
+            body {{ font-family: Arial; display: flex; justify-content: center; align-items: center; 
+                   height: 100vh; background: #f5f7fa; margin: 0; }}
+            .success-box {{ background: white; padding: 40px; border-radius: 15px; 
+                          box-shadow: 0 10px 40px rgba(0,0,0,0.1); text-align: center; }}
+            h1 {{ color: #4caf50; margin-bottom: 20px; }}
+            p {{ color: #555; }}
         </style>
     </head>
     <body>
         <div class="success-box">
             <h1>✓ Appointment Cancelled Successfully</h1>
-            <p>The time slot has been freed for other patients.</p>
+            <p>{freed_message}</p>
             <p>Redirecting to dashboard...</p>
         </div>
     </body>
@@ -1198,6 +1519,5 @@ async def cancel_appointment(
 @router.get("/logout")
 async def logout():
     response = RedirectResponse(url="/", status_code=303)
-    response.delete_cookie("user_id")
-    response.delete_cookie("user_role")
+    end_session(response)
     return response
\ No newline at end of file
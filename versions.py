@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import Counter
+from typing import Callable, Sequence
+from sqlalchemy import Engine, event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from .database import engine
+from .models import CacheVersion
+from .sharding import shards
+
+# Data version names. Writers bump them in the same transaction as the change;
+# caches key their entries on the version so a bump invalidates them everywhere.
+USERS = "users"
+DOCTORS = "doctors"
+SLOTS = "slots"
+APPOINTMENTS = "appointments"
+POLICIES = "policies"
+REVOKED_TOKENS = "revoked_tokens"
+
+# Upper bound on how long another worker process may serve stale cache entries.
+VERSION_POLL_INTERVAL = 1.0
+
+_PENDING_KEY = "bumped_versions"
+
+
+class VersionWatcher:
+    """Per-process view of the CacheVersion table.
+
+    Reads are served from a local snapshot that is refreshed with a single
+    small SELECT at most once per interval, so workers observe each other's
+    writes within that delay without talking to anything but the database.
+    With shards, each file counts its own bumps and the versions are the sums.
+    """
+
+    def __init__(
+        self,
+        bind=engine,
+        interval: float = VERSION_POLL_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        shards: Sequence[Engine] = (),
+    ):
+        self._binds = [bind, *shards]
+        self.interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+        self._checked_at = float("-inf")
+
+    def _poll(self) -> None:
+        versions: Counter[str] = Counter()
+        for bind in self._binds:
+            with bind.connect() as conn:
+                for name, version in conn.execute(select(CacheVersion.name, CacheVersion.version)):
+                    versions[name] += version
+        self._versions = dict(versions)
+
+    def snapshot(self) -> dict[str, int]:
+        now = self._clock()
+        if now - self._checked_at >= self.interval:
+            with self._lock:
+                if now - self._checked_at >= self.interval:
+                    self._poll()
+                    self._checked_at = self._clock()
+        return self._versions
+
+    def get(self, name: str) -> int:
+        return self.snapshot().get(name, 0)
+
+    def expire(self) -> None:
+        """Force the next read to poll, e.g. right after a local write commits."""
+        self._checked_at = float("-inf")
+
+
+data_versions = VersionWatcher(shards=shards.engines)
+
+
+def bump_versions(session: Session, *names: str) -> None:
+    """Increment data versions as part of the session's current transaction."""
+    for name in names:
+        stmt = insert(CacheVersion).values(name=name, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={"version": CacheVersion.version + 1},
+        )
+        session.exec(stmt)
+    session.info.setdefault(_PENDING_KEY, set()).update(names)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _expire_after_commit(session: OrmSession) -> None:
+    if session.info.pop(_PENDING_KEY, None):
+        data_versions.expire()
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_after_rollback(session: OrmSession) -> None:
+    session.info.pop(_PENDING_KEY, None)
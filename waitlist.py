@@ -0,0 +1,117 @@
+"""Per-doctor waitlist.
+
+A patient joins with a time window. Every slot of that doctor inside the
+window, existing or created later, gets a WaitlistMatch row. When an
+appointment is cancelled, the freed slot goes to the earliest entry matching
+it, in the same transaction as the cancellation, so the slot is never visible
+as free in between. Finding that entry is a single primary-key index seek.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+from sqlalchemy import delete, insert, literal
+from sqlmodel import Session, select
+from .models import Appointment, Slot, WaitlistEntry, WaitlistMatch, as_utc, epoch_seconds
+from .seats import take_seat
+
+# Bounds how many slot matches one entry can create.
+MAX_WAITLIST_WINDOW = timedelta(days=31)
+
+
+def join_waitlist(
+    session: Session,
+    doctor_id: int,
+    patient_id: int,
+    window_start: datetime,
+    window_end: datetime,
+    reason: Optional[str] = None,
+) -> WaitlistEntry:
+    """Add an entry and match it against the doctor's slots in its window."""
+    window_start, window_end = as_utc(window_start), as_utc(window_end)
+    if window_end <= window_start:
+        raise ValueError("Window end must be after window start")
+    if window_end - window_start > MAX_WAITLIST_WINDOW:
+        raise ValueError(f"Waitlist windows can span at most {MAX_WAITLIST_WINDOW.days} days")
+
+    entry = WaitlistEntry(
+        doctor_id=doctor_id,
+        patient_id=patient_id,
+        window_start=window_start,
+        window_end=window_end,
+        reason=reason,
+    )
+    session.add(entry)
+    session.flush()
+
+    slots_in_window = select(Slot.id, literal(entry.id)).where(
+        Slot.doctor_id == doctor_id,
+        Slot.start_ts >= epoch_seconds(window_start),
+        Slot.start_ts < epoch_seconds(window_end),
+    )
+    session.exec(insert(WaitlistMatch).from_select(["slot_id", "entry_id"], slots_in_window))
+    session.commit()
+    session.refresh(entry)
+    return entry
+
+
+def match_new_slots(session: Session, slots: Sequence[Slot]) -> None:
+    """Match freshly flushed slots against existing entries of their doctor."""
+    if not slots:
+        return
+    doctor_id = slots[0].doctor_id
+    first = min(as_utc(s.start_time) for s in slots)
+    last = max(as_utc(s.start_time) for s in slots)
+    entries = session.exec(
+        select(WaitlistEntry.id, WaitlistEntry.window_start, WaitlistEntry.window_end).where(
+            WaitlistEntry.doctor_id == doctor_id,
+            WaitlistEntry.window_start <= last,
+            WaitlistEntry.window_end > first,
+        )
+    ).all()
+    if not entries:
+        return
+    rows = [
+        {"slot_id": slot.id, "entry_id": entry_id}
+        for slot in slots
+        for entry_id, window_start, window_end in entries
+        if as_utc(window_start) <= as_utc(slot.start_time) < as_utc(window_end)
+    ]
+    if rows:
+        session.exec(insert(WaitlistMatch), params=rows)
+
+
+def _remove_entry(session: Session, entry: WaitlistEntry) -> None:
+    session.exec(delete(WaitlistMatch).where(WaitlistMatch.entry_id == entry.id))
+    session.delete(entry)
+
+
+def leave_waitlist(session: Session, entry: WaitlistEntry) -> None:
+    _remove_entry(session, entry)
+    session.commit()
+
+
+def promote_waitlisted(session: Session, slot: Slot) -> Optional[Appointment]:
+    """Give a just-freed slot to the earliest matching waitlist entry.
+
+    Runs inside the caller's cancellation transaction and does not commit.
+    Returns the new appointment, or None when nobody is waiting for the slot,
+    the slot has already started or it has no seat left.
+    """
+    if slot.id is None or as_utc(slot.start_time) <= datetime.now(timezone.utc):
+        return None
+
+    entry = session.exec(
+        select(WaitlistEntry)
+        .join(WaitlistMatch, WaitlistMatch.entry_id == WaitlistEntry.id)
+        .where(WaitlistMatch.slot_id == slot.id)
+        .order_by(WaitlistMatch.entry_id)
+        .limit(1)
+    ).first()
+    if entry is None:
+        return None
+
+    if not take_seat(session, slot.id):
+        return None
+    appt = Appointment(doctor_id=slot.doctor_id, patient_id=entry.patient_id, slot_id=slot.id, reason=entry.reason)
+    session.add(appt)
+    _remove_entry(session, entry)
+    return appt
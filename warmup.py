@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+from typing import Any
+from sqlalchemy import text
+from sqlmodel import Session, select
+from .models import User, DoctorProfile, Slot, Appointment
+from .schemas import DoctorOut, SlotOut, AppointmentOut
+from .sharding import fan_out, open_session, shards
+
+POOL_WARM_CONNECTIONS = 2
+
+def warm_pool(connections: int = POOL_WARM_CONNECTIONS) -> None:
+    """Open pooled connections up front so the first requests don't pay for it."""
+    conns = [bind.connect() for bind in shards.all_engines() for _ in range(connections)]
+    for conn in conns:
+        conn.execute(text("SELECT 1"))
+    for conn in conns:
+        conn.close()
+
+def warm_queries() -> None:
+    """Run the hot statement shapes once so SQLAlchemy caches their compiled SQL.
+
+    Parameters never match a row; only the statement structure matters for the
+    compiled cache, which each engine keeps for itself, so with shards the
+    doctor statements are run once per shard.
+    """
+    global_statements: list[Any] = [
+        select(User).where(User.email == ""),
+        select(DoctorProfile).where(DoctorProfile.user_id == -1),
+        select(DoctorProfile).where(DoctorProfile.id == -1, DoctorProfile.user_id == -1),
+    ]
+    doctor_statements: list[Any] = [
+        select(Slot).where(Slot.doctor_id == -1),
+        select(Slot).where(Slot.doctor_id == -1).where(Slot.is_booked == False),
+        select(Appointment).where(Appointment.patient_id == -1),
+        select(Appointment).where(Appointment.doctor_id == -1),
+    ]
+
+    def run(session: Session, statements: list[Any], models: tuple[Any, ...]) -> list[None]:
+        for stmt in statements:
+            session.exec(stmt).all()
+        for model in models:
+            session.get(model, -1)
+        return []
+
+    with open_session() as session:
+        run(session, global_statements, (User, DoctorProfile))
+        fan_out(session, lambda s: run(s, doctor_statements, (Slot, Appointment)))
+
+def warm_validators() -> None:
+    """Push one sample through each response schema in both directions."""
+    now = datetime.now(timezone.utc)
+    samples: list[tuple[Any, Any]] = [
+        (DoctorOut, DoctorProfile(id=0, user_id=0, specialization="General")),
+        (SlotOut, Slot(id=0, doctor_id=0, start_time=now, end_time=now)),
+        (AppointmentOut, Appointment(id=0, doctor_id=0, patient_id=0, slot_id=0, created_at=now)),
+    ]
+    for schema, obj in samples:
+        schema.model_validate_json(schema.model_validate(obj).model_dump_json())
+
+def warm_crypto() -> None:
+    """Import the JWT stack, load the revocation list and the bcrypt backend without hashing anything."""
+    from .auth import create_access_token, decode_token, get_pwd_context
+    decode_token(create_access_token({"sub": "0"}))
+    get_pwd_context().handler("bcrypt").get_backend()  # type: ignore[attr-defined]
+
+def warmup() -> None:
+    warm_pool()
+    warm_queries()
+    warm_validators()
+    warm_crypto()
@@ -0,0 +1,238 @@
+"""Group-commit writer.
+
+Off by default; APP_GROUP_COMMIT=1 starts it with the app. Bookings,
+cancellations and slot creations are then not committed by the request that
+makes them. The route checks what it can, then hands the write to
+commit_write(), which puts it on an asyncio queue. One writer task takes up to
+WRITE_BATCH_SIZE queued writes, waiting at most WRITE_MAX_WAIT seconds for the
+batch to fill (APP_WRITE_BATCH_SIZE and APP_WRITE_MAX_WAIT_MS override both, see
+main.py), and applies them on its own thread in a single transaction, so
+the whole batch costs one commit and one fsync.
+
+Each write runs inside its own SAVEPOINT. A write that raises, for example
+because the slot was booked by an earlier write in the same batch, is rolled
+back alone and its exception is raised in the route that submitted it; the
+rest of the batch still commits. If the commit itself fails, every write in
+the batch gets that error.
+
+With shards a batch is split by shard and each part commits separately.
+"""
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, TypeVar
+from sqlalchemy import inspect
+from sqlmodel import Session
+from .sharding import ShardSet, route_doctor, route_row, shards
+
+T = TypeVar("T")
+
+WRITE_BATCH_SIZE = 32
+# How long the writer waits for more writes once the first one has arrived.
+WRITE_MAX_WAIT = 0.002
+
+
+@dataclass
+class _Write:
+    apply: Callable[[Session], Any]
+    shard: int
+    future: asyncio.Future
+
+
+def _refresh(session: Session, result: Any) -> None:
+    # Load what the database filled in, while the session is still open
+    state = inspect(result, raiseerr=False)
+    if state is not None and getattr(state, "session", None) is session:
+        session.refresh(result)
+
+
+class GroupWriter:
+    """Single writer that commits queued writes in batches."""
+
+    def __init__(
+        self,
+        shard_set: ShardSet = shards,
+        batch_size: int = WRITE_BATCH_SIZE,
+        max_wait: float = WRITE_MAX_WAIT,
+    ):
+        self.shard_set = shard_set
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="group-writer")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Apply what is already queued, then stop."""
+        task = self._task
+        if task is None or self._queue is None or self._executor is None:
+            return
+        self._task = None
+        await self._queue.put(None)
+        await task
+        self._executor.shutdown()
+
+    def _shard(self, doctor_id: Optional[int], row_id: Optional[int]) -> int:
+        if not self.shard_set.engines:
+            return 0
+        if doctor_id is not None:
+            return self.shard_set.shard_for(doctor_id)
+        if row_id is not None:
+            return self.shard_set.shard_of(row_id)
+        raise ValueError("A sharded write needs a doctor_id or row_id")
+
+    async def submit(
+        self,
+        apply: Callable[[Session], T],
+        doctor_id: Optional[int] = None,
+        row_id: Optional[int] = None,
+    ) -> T:
+        """Queue apply and wait until its batch has committed; returns what apply returned."""
+        if self._queue is None or self._task is None:
+            raise RuntimeError("The group writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Write(apply, self._shard(doctor_id, row_id), future))
+        return await future
+
+    def submit_threadsafe(
+        self,
+        apply: Callable[[Session], T],
+        doctor_id: Optional[int] = None,
+        row_id: Optional[int] = None,
+    ) -> T:
+        """submit() for code running on a worker thread, such as sync routes."""
+        if self._loop is None or self._task is None:
+            raise RuntimeError("The group writer is not running")
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            raise RuntimeError("Blocking on the group writer from its own event loop would deadlock; await submit()")
+        return asyncio.run_coroutine_threadsafe(self.submit(apply, doctor_id, row_id), self._loop).result()
+
+    async def _next_batch(self) -> tuple[list[_Write], bool]:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                write = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    write = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if write is None:
+                return batch, True
+            batch.append(write)
+        return batch, False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._apply_batch, batch)
+            except Exception as e:
+                outcomes = [(e, None)] * len(batch)
+            for write, (error, result) in zip(batch, outcomes):
+                if write.future.done():
+                    continue
+                if error is not None:
+                    write.future.set_exception(error)
+                else:
+                    write.future.set_result(result)
+
+    def _apply_batch(self, batch: list[_Write]) -> list[tuple[Optional[BaseException], Any]]:
+        outcomes: list[tuple[Optional[BaseException], Any]] = [(None, None)] * len(batch)
+        by_shard: dict[int, list[int]] = {}
+        for index, write in enumerate(batch):
+            by_shard.setdefault(write.shard, []).append(index)
+        for shard, indexes in by_shard.items():
+            with self.shard_set.session(shard) as session:
+                try:
+                    # Take the write lock up front; the savepoints nest inside this transaction
+                    session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                    for index in indexes:
+                        outcomes[index] = self._apply_one(session, batch[index].apply)
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    for index in indexes:
+                        outcomes[index] = (e, None)
+                    continue
+                for index in indexes:
+                    error, result = outcomes[index]
+                    if error is None:
+                        try:
+                            _refresh(session, result)
+                        except Exception as e:
+                            outcomes[index] = (e, None)
+        return outcomes
+
+    @staticmethod
+    def _apply_one(session: Session, apply: Callable[[Session], Any]) -> tuple[Optional[BaseException], Any]:
+        # Listeners stage their after-commit work in session.info; a write
+        # that is rolled back must not leave any of it behind
+        staged = {key: copy.copy(value) for key, value in session.info.items()}
+        try:
+            with session.begin_nested():
+                result = apply(session)
+            return None, result
+        except Exception as e:
+            session.info.clear()
+            session.info.update(staged)
+            return e, None
+
+
+group_writer = GroupWriter()
+
+
+def commit_write(
+    session: Session,
+    apply: Callable[[Session], T],
+    doctor_id: Optional[int] = None,
+    row_id: Optional[int] = None,
+) -> T:
+    """Run apply and commit it, through the group writer when it is running.
+
+    Otherwise apply runs in session, which is committed right away. apply may
+    be handed a different session than the caller's, so it must load what it
+    changes through the session it is given. Pass doctor_id or row_id so the
+    write reaches the right shard.
+    """
+    if group_writer.running:
+        return group_writer.submit_threadsafe(apply, doctor_id, row_id)
+    if doctor_id is not None:
+        route_doctor(session, doctor_id)
+    if row_id is not None:
+        route_row(session, row_id)
+    result = apply(session)
+    session.commit()
+    _refresh(session, result)
+    return result